@@ -1,49 +1,98 @@
 import board
 import busio
-import adafruit_adxl34x
+import array
+from adxl345 import ADXL345, RANGE_4_G, FIFO_BYPASS, FIFO_STREAM, FIFO_SIZE, INT_ACTIVITY
+from gestures import GestureRecognizer, GESTURE_NONE, GESTURE_NAMES
+from calibration import Calibration
 
 class Accelerometer:
-    """Handle accelerometer input and shake detection along Z-axis"""
+    """
+    Handle accelerometer input and gesture detection on all axes
     
-    def __init__(self, i2c=None, shake_threshold=15.0, cooldown_time=0.5):
+    The sensor runs its FIFO in stream mode and detect_gesture() drains it,
+    so every sample reaches the GestureRecognizer even when the loop polls
+    late (up to FIFO_SIZE samples, 320ms at 100 Hz).
+    """
+    
+    TILT_THRESHOLD = 4.0  # m/s^2 mean deviation on X or Y that counts as tilted
+    TILT_MAX_DEVIATION = 1.5  # m/s^2 standard deviation, more is moving rather than held
+    ACTIVITY_THRESHOLD = 3.0  # m/s^2 change from rest that wakes the recognizer
+    ACTIVITY_HOLD = 1.0  # seconds the FIFO is read after an activity interrupt
+    
+    def __init__(self, i2c=None, shake_threshold=15.0, cooldown_time=0.5, int_pin=None):
         """
         Initialize the accelerometer
         
         Args:
-            shake_threshold: Acceleration threshold in m/s² to detect shake (default 15.0)
-            cooldown_time: Minimum time between shake detections in seconds (default 0.5)
+            shake_threshold: Peak acceleration in m/s² from rest for shakes and flicks (default 15.0)
+            cooldown_time: Minimum time between gestures in seconds (default 0.5)
+            int_pin: Board pin wired to the ADXL345 INT1 line. The FIFO is then
+                     only read after the sensor reports activity.
+                     None polls over I2C (default)
         """
         # Setup I2C for accelerometer
         if i2c:
             self.i2c = i2c
         else:
             self.i2c = busio.I2C(board.SCL, board.SDA)
-        self.accelerometer = adafruit_adxl34x.ADXL345(self.i2c)
+        # +-4g, a shake swings both ways from the 1g resting Z
+        self.sensor = ADXL345(self.i2c, g_range=RANGE_4_G)
+        self.calibration = Calibration(self.sensor)
         
         self.shake_threshold = shake_threshold
         self.cooldown_time = cooldown_time
-        self.last_shake_time = 0
         self.baseline_z = None
-        self.calibration_samples = []
+        
+        # Rest position in raw counts, so sampling needs no float math
+        self._baseline_x = 0
+        self._baseline_y = 0
+        self._baseline_z = self.sensor.to_counts(9.8)
+        # Newest X and Y from rest in counts, read by tilt steering
+        self.tilt_x = 0
+        self.tilt_y = 0
+        self._samples = array.array("h", [0] * (3 * FIFO_SIZE))
+        self._sample_period = 1 / self.sensor.sample_rate
+        self.gestures = GestureRecognizer(
+            self.sensor.to_counts(shake_threshold),
+            self.sensor.to_counts(self.TILT_THRESHOLD),
+            self.sensor.to_counts(self.TILT_MAX_DEVIATION),
+            cooldown_time,
+        )
+        self.sensor.set_fifo_mode(FIFO_STREAM)
+        
+        self.use_interrupts = int_pin is not None
+        self._active_until = 0
+        if self.use_interrupts:
+            self.sensor.attach_interrupt(int_pin)
+            self._enable_activity_interrupt()
+    
+    def _enable_activity_interrupt(self):
+        """Activity compared against the current (resting) acceleration"""
+        self.sensor.enable_activity(self.ACTIVITY_THRESHOLD)
+        self.sensor.interrupt_source()
         
     def calibrate(self, num_samples=10):
         """
-        Calibrate by taking multiple readings to establish baseline Z-axis value
-        Call this when device is at rest
+        Calibrate by taking multiple readings to establish the rest position
+        Call this when device is at rest. A rest position stored by an
+        earlier boot is only checked with a few samples.
         
         Args:
             num_samples: Number of samples to average for baseline (default 10)
         """
-        import time
-        self.calibration_samples = []
-        
-        for _ in range(num_samples):
-            x, y, z = self.accelerometer.acceleration
-            self.calibration_samples.append(z)
-            time.sleep(0.01)
-        
-        self.baseline_z = sum(self.calibration_samples) / len(self.calibration_samples)
+        # Read live samples, not what is queued in the FIFO
+        self.sensor.set_fifo_mode(FIFO_BYPASS)
+        calibration = self.calibration
+        calibration.run(num_samples, 0.01)
+        self._baseline_x = calibration.x
+        self._baseline_y = calibration.y
+        self._baseline_z = calibration.z
+        self.baseline_z = self._baseline_z * self.sensor.scale
+        self.sensor.set_fifo_mode(FIFO_STREAM)
+        self.gestures.clear()
         print(f"Calibrated baseline Z: {self.baseline_z:.2f} m/s²")
+        if self.use_interrupts:
+            self._enable_activity_interrupt()
     
     def get_acceleration(self):
         """
@@ -52,38 +101,53 @@ class Accelerometer:
         Returns:
             Tuple of (x, y, z) acceleration in m/s²
         """
-        return self.accelerometer.acceleration
+        self.sensor.read()
+        return self.sensor.acceleration
     
-    def detect_z_shake(self, current_time):
+    def detect_gesture(self, current_time):
         """
-        Detect shake along Z-axis
+        Feed every sample queued since the last call to the gesture recognizer
         
         Args:
             current_time: Current time in seconds (from time.monotonic())
             
         Returns:
-            True if shake detected, False otherwise
+            The first GESTURE_* recognized, GESTURE_NONE otherwise. Its
+            confidence and timestamp are in self.gestures
         """
-        # Check cooldown period
-        if current_time - self.last_shake_time < self.cooldown_time:
-            return False
-        
-        x, y, z = self.accelerometer.acceleration
+        sensor = self.sensor
+        if self.use_interrupts:
+            # No I2C traffic until the sensor raises INT1, reading the source clears it
+            if sensor.interrupt_pending() and sensor.interrupt_source() & INT_ACTIVITY:
+                self._active_until = current_time + self.ACTIVITY_HOLD
+            if current_time >= self._active_until:
+                return GESTURE_NONE
         
-        # If not calibrated, use standard gravity as baseline
-        if self.baseline_z is None:
-            self.baseline_z = 9.8
+        samples = self._samples
+        count = sensor.read_fifo(samples, FIFO_SIZE)
+        gestures = self.gestures
+        base_x = self._baseline_x
+        base_y = self._baseline_y
+        base_z = self._baseline_z
+        # The newest sample was taken about now, older ones one period apart
+        sample_time = current_time - (count - 1) * self._sample_period
+        found = GESTURE_NONE
         
-        # Calculate deviation from baseline
-        z_deviation = abs(z - self.baseline_z)
+        for i in range(count):
+            j = i * 3
+            gesture = gestures.update(samples[j] - base_x, samples[j + 1] - base_y,
+                                      samples[j + 2] - base_z, sample_time)
+            if gesture and not found:
+                found = gesture
+            sample_time += self._sample_period
+        if count:
+            j = (count - 1) * 3
+            self.tilt_x = samples[j] - base_x
+            self.tilt_y = samples[j + 1] - base_y
         
-        # Check if deviation exceeds threshold
-        if z_deviation > self.shake_threshold:
-            self.last_shake_time = current_time
-            print(f"Shake detected! Z deviation: {z_deviation:.2f} m/s²")
-            return True
-        
-        return False
+        if found:
+            print(f"Gesture: {GESTURE_NAMES[found]} ({gestures.confidence:.2f})")
+        return found
     
     def get_z_deviation(self):
         """
@@ -92,8 +156,5 @@ class Accelerometer:
         Returns:
             Absolute deviation from baseline in m/s²
         """
-        if self.baseline_z is None:
-            self.baseline_z = 9.8
-        
-        x, y, z = self.accelerometer.acceleration
-        return abs(z - self.baseline_z)
\ No newline at end of file
+        self.sensor.read()
+        return abs(self.sensor.z - self._baseline_z) * self.sensor.scale
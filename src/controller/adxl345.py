@@ -0,0 +1,303 @@
+import digitalio
+from adafruit_bus_device.i2c_device import I2CDevice
+
+# This file is shared between the controller and Scrappy.
+
+STANDARD_GRAVITY = 9.80665  # m/s^2 per g
+
+# Registers
+_REG_DEVID = 0x00
+_REG_THRESH_TAP = 0x1D
+_REG_DUR = 0x21
+_REG_THRESH_ACT = 0x24
+_REG_ACT_INACT_CTL = 0x27
+_REG_THRESH_FF = 0x28
+_REG_TIME_FF = 0x29
+_REG_TAP_AXES = 0x2A
+_REG_BW_RATE = 0x2C
+_REG_POWER_CTL = 0x2D
+_REG_INT_ENABLE = 0x2E
+_REG_INT_MAP = 0x2F
+_REG_INT_SOURCE = 0x30
+_REG_DATA_FORMAT = 0x31
+_REG_DATAX0 = 0x32
+_REG_FIFO_CTL = 0x38
+_REG_FIFO_STATUS = 0x39
+
+_DEVICE_ID = 0xE5
+_POWER_MEASURE = 0x08
+_FULL_RES = 0x08
+_MG_PER_COUNT = 3.9  # in full resolution mode, and at +-2g otherwise
+_MG_PER_THRESHOLD = 62.5  # activity, free-fall and tap thresholds
+_AC_COUPLED = 0x80
+
+# Output data rates (BW_RATE register)
+RATE_25_HZ = 0x08
+RATE_50_HZ = 0x09
+RATE_100_HZ = 0x0A
+RATE_200_HZ = 0x0B
+RATE_400_HZ = 0x0C
+RATE_800_HZ = 0x0D
+RATE_1600_HZ = 0x0E
+RATE_3200_HZ = 0x0F
+
+# Measurement ranges (DATA_FORMAT register)
+RANGE_2_G = 0
+RANGE_4_G = 1
+RANGE_8_G = 2
+RANGE_16_G = 3
+
+# FIFO modes (FIFO_CTL register)
+FIFO_BYPASS = 0x00
+FIFO_FIFO = 0x40     # fills up, then stops collecting
+FIFO_STREAM = 0x80   # keeps the newest FIFO_SIZE samples
+FIFO_TRIGGER = 0xC0
+FIFO_SIZE = 32
+
+# Interrupt sources (INT_ENABLE and INT_SOURCE registers)
+INT_DATA_READY = 0x80
+INT_SINGLE_TAP = 0x40
+INT_DOUBLE_TAP = 0x20
+INT_ACTIVITY = 0x10
+INT_INACTIVITY = 0x08
+INT_FREE_FALL = 0x04
+INT_WATERMARK = 0x02
+INT_OVERRUN = 0x01
+
+# Axes taking part in activity and tap detection
+AXIS_X = 0x04
+AXIS_Y = 0x02
+AXIS_Z = 0x01
+AXES_ALL = AXIS_X | AXIS_Y | AXIS_Z
+
+
+class ADXL345:
+    """
+    Allocation-free ADXL345 sampler.
+
+    read() fetches all six data registers with one I2C transaction into a
+    preallocated buffer and leaves the raw signed counts in x, y and z.
+    Nothing is converted to floats in the hot path: compare counts against
+    thresholds converted once with to_counts(), and use scale (m/s^2 per
+    count) or acceleration only where a value in m/s^2 is really needed.
+    """
+
+    def __init__(self, i2c, address=0x53, data_rate=RATE_100_HZ, g_range=RANGE_2_G,
+                 full_resolution=True):
+        """
+        Args:
+            i2c: I2C bus the sensor is on
+            address: I2C address (default 0x53)
+            data_rate: Output data rate, one of RATE_* (default 100 Hz)
+            g_range: Measurement range, one of RANGE_* (default +-2g)
+            full_resolution: 3.9 mg per count at every range (default True)
+        """
+        self._device = I2CDevice(i2c, address)
+        self._cmd = bytearray(2)
+        self._reg = bytearray(1)
+        self._value = bytearray(1)
+        self._data = bytearray(6)
+        self.x = 0
+        self.y = 0
+        self.z = 0
+        self.samples = 0
+        self.interrupts = 0
+        self._int_pin = None
+
+        if self._read_register(_REG_DEVID) != _DEVICE_ID:
+            raise RuntimeError("ADXL345 not found")
+        self._data_rate = data_rate
+        self._range = g_range
+        self._full_resolution = full_resolution
+        self.scale = 0.0
+        self._write_register(_REG_BW_RATE, data_rate)
+        self._write_format()
+        self._write_register(_REG_POWER_CTL, _POWER_MEASURE)
+
+    # ===== REGISTER ACCESS =====
+
+    def _read_register(self, register):
+        self._reg[0] = register
+        with self._device as device:
+            device.write_then_readinto(self._reg, self._value)
+        return self._value[0]
+
+    def _write_register(self, register, value):
+        self._cmd[0] = register
+        self._cmd[1] = value
+        with self._device as device:
+            device.write(self._cmd)
+
+    def _write_format(self):
+        value = self._range
+        if self._full_resolution:
+            value |= _FULL_RES
+        self._write_register(_REG_DATA_FORMAT, value)
+        mg_per_count = _MG_PER_COUNT
+        if not self._full_resolution:
+            mg_per_count *= 1 << self._range
+        self.scale = mg_per_count / 1000 * STANDARD_GRAVITY
+
+    # ===== SETTINGS =====
+
+    @property
+    def data_rate(self):
+        """Output data rate, one of RATE_*"""
+        return self._data_rate
+
+    @data_rate.setter
+    def data_rate(self, value):
+        self._data_rate = value
+        self._write_register(_REG_BW_RATE, value)
+
+    @property
+    def g_range(self):
+        """Measurement range, one of RANGE_*"""
+        return self._range
+
+    @g_range.setter
+    def g_range(self, value):
+        self._range = value
+        self._write_format()
+
+    @property
+    def sample_rate(self):
+        """Output data rate in Hz"""
+        return 3200 / (1 << (RATE_3200_HZ - self._data_rate))
+
+    @property
+    def full_resolution(self):
+        """True if a count is 3.9 mg at every range"""
+        return self._full_resolution
+
+    @full_resolution.setter
+    def full_resolution(self, value):
+        self._full_resolution = value
+        self._write_format()
+
+    # ===== SAMPLING =====
+
+    def read(self):
+        """Read one sample into x, y and z (raw counts), allocates nothing"""
+        self._reg[0] = _REG_DATAX0
+        data = self._data
+        with self._device as device:
+            device.write_then_readinto(self._reg, data)
+        x = data[0] | (data[1] << 8)
+        y = data[2] | (data[3] << 8)
+        z = data[4] | (data[5] << 8)
+        self.x = x - 0x10000 if x & 0x8000 else x
+        self.y = y - 0x10000 if y & 0x8000 else y
+        self.z = z - 0x10000 if z & 0x8000 else z
+        self.samples += 1
+
+    # ===== FIFO =====
+
+    def set_fifo_mode(self, mode, watermark=16):
+        """Set the FIFO mode (FIFO_*), watermark is in samples"""
+        self._write_register(_REG_FIFO_CTL, mode | (watermark & 0x1F))
+
+    def fifo_count(self):
+        """Number of samples waiting in the FIFO"""
+        return self._read_register(_REG_FIFO_STATUS) & 0x3F
+
+    def read_fifo(self, samples, max_count):
+        """
+        Drain up to max_count samples in one burst, holding the bus once
+        Args:
+            samples: array("h") of at least 3 * max_count, filled with x, y, z
+            max_count: Most samples to read
+        Returns: number of samples read
+        """
+        count = min(self.fifo_count(), max_count)
+        data = self._data
+        self._reg[0] = _REG_DATAX0
+        pos = 0
+        with self._device as device:
+            for _ in range(count):
+                # Every read of the data registers pops one FIFO entry
+                device.write_then_readinto(self._reg, data)
+                for axis in range(3):
+                    value = data[axis * 2] | (data[axis * 2 + 1] << 8)
+                    samples[pos] = value - 0x10000 if value & 0x8000 else value
+                    pos += 1
+        self.samples += count
+        return count
+
+    # ===== INTERRUPTS =====
+    # All interrupts are routed to INT1 and stay latched until
+    # interrupt_source() reads them, so a level check of the pin never
+    # misses an event.
+
+    def _threshold(self, acceleration):
+        value = int(acceleration / STANDARD_GRAVITY * 1000 / _MG_PER_THRESHOLD)
+        return max(1, min(255, value))
+
+    def _enable_interrupt(self, source):
+        self.interrupts |= source
+        self._write_register(_REG_INT_MAP, 0)
+        self._write_register(_REG_INT_ENABLE, self.interrupts)
+
+    def enable_free_fall(self, threshold=4.0, duration=0.15):
+        """
+        Raise INT_FREE_FALL when all axes stay under threshold (m/s^2) for
+        duration (seconds)
+        """
+        self._write_register(_REG_THRESH_FF, self._threshold(threshold))
+        self._write_register(_REG_TIME_FF, max(1, min(255, int(duration / 0.005))))
+        self._enable_interrupt(INT_FREE_FALL)
+
+    def enable_activity(self, threshold, axes=AXES_ALL, ac_coupled=True):
+        """
+        Raise INT_ACTIVITY when any of the axes is over threshold (m/s^2).
+        AC-coupled compares against the acceleration at the time this is
+        called, so call it while the device is at rest.
+        """
+        self._write_register(_REG_THRESH_ACT, self._threshold(threshold))
+        self._write_register(_REG_ACT_INACT_CTL, (_AC_COUPLED if ac_coupled else 0) | (axes << 4))
+        # Re-enabling takes a new AC reference
+        self.interrupts &= ~INT_ACTIVITY
+        self._write_register(_REG_INT_ENABLE, self.interrupts)
+        self._enable_interrupt(INT_ACTIVITY)
+
+    def enable_single_tap(self, threshold, duration=0.01, axes=AXES_ALL):
+        """Raise INT_SINGLE_TAP for a spike over threshold (m/s^2) shorter than duration"""
+        self._write_register(_REG_THRESH_TAP, self._threshold(threshold))
+        self._write_register(_REG_DUR, max(1, min(255, int(duration / 0.000625))))
+        self._write_register(_REG_TAP_AXES, axes)
+        self._enable_interrupt(INT_SINGLE_TAP)
+
+    def disable_interrupts(self):
+        self.interrupts = 0
+        self._write_register(_REG_INT_ENABLE, 0)
+
+    def interrupt_source(self):
+        """
+        Read and clear the latched interrupts
+        Returns: INT_* bits that fired
+        """
+        return self._read_register(_REG_INT_SOURCE)
+
+    def attach_interrupt(self, pin):
+        """Watch the INT1 line on a board pin"""
+        self._int_pin = digitalio.DigitalInOut(pin)
+        self._int_pin.direction = digitalio.Direction.INPUT
+
+    def interrupt_pending(self):
+        """
+        True if INT1 is raised, checked without touching the I2C bus.
+        Always True without an attached pin, the caller has to poll.
+        """
+        if self._int_pin is None:
+            return True
+        return self._int_pin.value
+
+    def to_counts(self, acceleration):
+        """Convert m/s^2 to raw counts at the current range and resolution"""
+        return int(acceleration / self.scale)
+
+    @property
+    def acceleration(self):
+        """Last sample as (x, y, z) in m/s^2"""
+        scale = self.scale
+        return (self.x * scale, self.y * scale, self.z * scale)
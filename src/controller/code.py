@@ -1,5 +1,6 @@
 import board
 import time
+import gc
 import busio
 import displayio
 import i2cdisplaybus
@@ -9,9 +10,49 @@ from adafruit_ble.advertising.standard import ProvideServicesAdvertisement
 from adafruit_ble.services.nordic import UARTService
 from buttons import Buttons
 from accelerometer import Accelerometer
+from gestures import GESTURE_NONE, GESTURE_SHAKE
 from display import DisplayManager
+from framebuffer_display import FramebufferDisplayManager
 from rotary_encoder import RotaryEncoder
+from steering import SteeringStream
 from neopixel_status import NeoPixelStatus
+from link import Link
+from command_channel import CommandChannel
+from heartbeat import HeartbeatSender
+from watchdog_monitor import StallMonitor
+from memory_manager import MemoryManager
+from game_state import (
+    GameStateMachine, EVENT_LINK, EVENT_FRAME, EVENT_BUTTON, EVENT_ENCODER, EVENT_SHAKE, EVENT_TIMER,
+    EVENT_GESTURE, EVENT_STEER,
+    TASK_LINK, TASK_ENCODER, TASK_BUTTONS, TASK_SHAKE, TASK_TIMER, TASK_TRANSITION, TASK_STEER,
+)
+from protocol import SESSION_ACKLESS_MOVES, SESSION_STATE_EVENTS
+
+# Watchdog regions, each id is an index into WATCHDOG_REGIONS
+REGION_SCAN = 0
+REGION_CONNECT = 1
+REGION_TIMER = 2
+REGION_LINK = 3
+REGION_INPUT = 4
+REGION_DISPLAY = 5
+WATCHDOG_REGIONS = ("scan", "connect", "timer", "link", "input", "display")
+WAIT_REGIONS = (REGION_SCAN, REGION_CONNECT)  # BLE scan and link negotiation block on purpose
+ENABLE_WATCHDOG = True
+WATCHDOG_TIMEOUT = 8.0  # seconds, longer than any single blocking step below
+SCAN_TIMEOUT = 5  # seconds per BLE scan, must stay below WATCHDOG_TIMEOUT
+FRAMEBUFFER_TEXT = False  # draw text into one preallocated bitmap instead of Labels
+RELEASE_SCREENS = False  # free screens when they are left, rebuilt on the next visit
+ACCEL_INT_PIN = None  # board pin wired to the ADXL345 INT1, None polls over I2C
+STEER_FULL_TILT = 5.0  # m/s^2 of tilt (about 30 degrees) for full speed in manual mode
+MEMORY_FLOOR = 16384  # bytes free below which GC runs even while a level is timed
+PROFILE_ALLOCATIONS = False  # count heap allocations per region, printed on disconnect
+LOG_FRAMES = False  # print every frame sent and every command dropped on a full window, each line allocates
+
+boot_time = time.monotonic()
+
+monitor = StallMonitor(WATCHDOG_REGIONS, timeout=WATCHDOG_TIMEOUT,
+                       track_allocations=PROFILE_ALLOCATIONS, waits=WAIT_REGIONS)
+monitor.report()
 
 # Release any existing displays
 displayio.release_displays()
@@ -22,10 +63,20 @@ display_bus = i2cdisplaybus.I2CDisplayBus(i2c, device_address=0x3C)
 display = adafruit_displayio_ssd1306.SSD1306(display_bus, width=128, height=64)
 
 # Initialize display manager
-display_mgr = DisplayManager(display)
+gc.collect()
+heap_before_display = gc.mem_alloc()
+free_before_display = gc.mem_free()
+if FRAMEBUFFER_TEXT:
+    display_mgr = FramebufferDisplayManager(display, release_screens=RELEASE_SCREENS)
+else:
+    display_mgr = DisplayManager(display, release_screens=RELEASE_SCREENS)
+display_mgr.refresh(force=True)
+print(f"First frame after {time.monotonic() - boot_time:.2f}s, "
+      f"display uses {gc.mem_alloc() - heap_before_display} bytes, "
+      f"peak {free_before_display - display_mgr.min_free} bytes")
 
 # Initialize accelerometer
-accelerometer = Accelerometer(i2c=i2c, shake_threshold=15.0, cooldown_time=0.5)
+accelerometer = Accelerometer(i2c=i2c, shake_threshold=15.0, cooldown_time=0.5, int_pin=ACCEL_INT_PIN)
 print("Calibrating accelerometer...")
 accelerometer.calibrate(20)
 print("Accelerometer ready!")
@@ -36,6 +87,12 @@ buttons = Buttons()
 # Initialize rotary encoder
 encoder = RotaryEncoder(board.D10, board.D9, pulses_per_detent=3)
 
+# Tilt steering and the game flow
+steering = SteeringStream(accelerometer.sensor.to_counts(STEER_FULL_TILT))
+memory = MemoryManager(floor=MEMORY_FLOOR)
+game = GameStateMachine(display_mgr, steering, memory, encoder)
+tasks = game.tasks
+
 # Initialize NeoPixel status LED
 neopixel_status = NeoPixelStatus(pin=board.D8)
 
@@ -45,13 +102,15 @@ ble = BLERadio()
 print("BLE Client Ready")
 
 connection = None
-LEVEL_LENGTH = 10
-LEVEL1_LENGTH = 10
-ADD_TIME = 2
-MAX_LEVEL = 10  # Win after completing level 10
+ACKLESS_SESSION = True  # fire-and-forget moves, Scrappy reports state changes instead
+HEARTBEAT_INTERVAL = 0.03  # seconds between heartbeats, Scrappy stops after 3 missed (3 of the longest gap seen)
+
+if ENABLE_WATCHDOG:
+    monitor.start()
 
 while True:
     # ===== CONNECTION PHASE =====
+    monitor.feed()
     neopixel_status.show_disconnected()  # Show red while not connected
     display_mgr.show_connection_screen()
     display_mgr.update_connection_status("Scanning...", "")
@@ -60,7 +119,8 @@ while True:
     connection = None
     
     # Scan for devices
-    for advertisement in ble.start_scan(ProvideServicesAdvertisement, timeout=10):
+    monitor.begin(REGION_SCAN)
+    for advertisement in ble.start_scan(ProvideServicesAdvertisement, timeout=SCAN_TIMEOUT):
         if UARTService in advertisement.services:
             print("Found server! Connecting...")
             display_mgr.update_connection_status("Connecting...", "")
@@ -73,208 +133,87 @@ while True:
                 connection = None
     
     ble.stop_scan()
+    monitor.end()
+    monitor.feed()
     
     if connection and connection.connected:
         print("Connected!")
         neopixel_status.show_connected()  # Show green when connected
         display_mgr.update_connection_status("Connected!", "Initializing...")
-        time.sleep(1)
+        monitor.begin(REGION_CONNECT)
         uart = connection[UARTService]
+        link = Link(uart, verbose=LOG_FRAMES)
+        if link.negotiate():
+            display_mgr.update_connection_status("Connected!", "Binary link")
+        heartbeat = HeartbeatSender(link, interval=HEARTBEAT_INTERVAL)
+        channel = CommandChannel(link, heartbeat, verbose=LOG_FRAMES)
+        if ACKLESS_SESSION:
+            channel.open_session(SESSION_ACKLESS_MOVES | SESSION_STATE_EVENTS)
+        monitor.end()
+        time.sleep(1)
         
-        # ===== MAIN GAME SESSION LOOP =====
-        session_active = True
+        # ===== GAME SESSION =====
+        # Menu, levels, game over and win screens are states of `game`,
+        # this loop samples whatever inputs are due and feeds them in as events
+        game.start(channel, time.monotonic())
         
-        while connection.connected and session_active:
-            
-            # ===== MENU PHASE =====
-            display_mgr.show_menu_screen()
-            menu_active = True
-            encoder.reset(to_detent=0)
-            
-            while connection.connected and menu_active:
-                # Update encoder and check for rotation
-                if encoder.update():
-                    delta = encoder.get_delta()
-                    
-                    if delta > 0:
-                        for _ in range(abs(delta)):
-                            display_mgr.menu_move_down()
-                        print(f"Selected: {display_mgr.get_difficulty_name()}")
-                
-                # Check for RIGHT button to confirm selection
-                button_pressed = buttons.get_pressed_button()
-                
-                if button_pressed == "RIGHT":
-                    selected_difficulty = display_mgr.get_difficulty_name()
-                    print(f"Starting game on {selected_difficulty} mode")
-                    menu_active = False
-                    while buttons.any_button_pressed():
-                        time.sleep(0.01)
-                    time.sleep(0.1)
-                
-                time.sleep(0.001)
+        while connection.connected:
+            monitor.feed()
+            now = time.monotonic()
             
-            if not connection.connected:
-                break
-            
-            # ===== GAME PHASE =====
-            game_level = 1
-            display_mgr.show_game_screen()
-            display_mgr.update_level(game_level)
-            print(f"Game started! Difficulty: {display_mgr.get_difficulty_name()}")
+            # Match ACKs, retransmit, keep heartbeats going and hand over messages (e.g., DEAD)
+            if tasks.due(TASK_LINK, now):
+                monitor.begin(REGION_LINK)
+                channel.service(now)
+                events = channel.events
+                for i in range(events.count):
+                    game.dispatch(EVENT_FRAME, events.opcodes[i], events.arg0[i], now)
+                game.dispatch(EVENT_LINK, 0, 0, now)
+                monitor.end()
             
-            # Send difficulty to server
-            difficulty_msg = f"LEVEL:{str(game_level)}:{display_mgr.get_difficulty_name()}\n"
-            uart.write(difficulty_msg.encode('utf-8'))
-            print(f"Sent: {difficulty_msg.strip()}")
+            # Check for player input
+            monitor.begin(REGION_INPUT)
+            if tasks.due(TASK_ENCODER, now) and encoder.update():
+                game.dispatch(EVENT_ENCODER, encoder.get_delta(), 0, now)
+            gesture = accelerometer.detect_gesture(now) if tasks.due(TASK_SHAKE, now) else GESTURE_NONE
+            if gesture == GESTURE_SHAKE:
+                game.dispatch(EVENT_SHAKE, 0, 0, now)
+            elif gesture:
+                game.dispatch(EVENT_GESTURE, gesture, accelerometer.gestures.confidence, now)
+            elif tasks.due(TASK_BUTTONS, now):
+                game.dispatch(EVENT_BUTTON, buttons.get_pressed_button(), 0, now)
+            if tasks.due(TASK_STEER, now):
+                game.dispatch(EVENT_STEER, accelerometer.tilt_x, accelerometer.tilt_y, now)
+            monitor.end()
             
-            game_start = time.monotonic()
-            print(f"Level {game_level} started at: {game_start}")
+            # Level timer and transition deadlines
+            monitor.begin(REGION_TIMER)
+            if tasks.due(TASK_TIMER, now):
+                game.dispatch(EVENT_TIMER, TASK_TIMER, 0, now)
+            if tasks.due(TASK_TRANSITION, now):
+                game.dispatch(EVENT_TIMER, TASK_TRANSITION, 0, now)
+            monitor.end()
             
-            # Main game loop
-            game_running = True
+            # Send everything queued this iteration in as few writes as possible
+            link.flush()
             
-            while connection.connected and game_running:
-                
-                # ===== PLAYING =====
-                if display_mgr.is_game_screen():
-                    time_left = LEVEL_LENGTH - (time.monotonic() - game_start)
-                    
-                    # Level complete
-                    if time_left <= 0:
-                        # Check if player won (completed level 10)
-                        if game_level >= MAX_LEVEL:
-                            display_mgr.show_game_win_screen()
-                            message = "STOP\n"
-                            uart.write(message.encode('utf-8'))
-                            print("Game completed! Player wins!")
-                            continue
-                        
-                        # Otherwise, go to next level
-                        game_level += 1
-                        display_mgr.show_transition_screen(game_level)
-                        message = "STOP\n"
-                        uart.write(message.encode('utf-8'))
-                        print(f"Level {game_level - 1} complete!")
-                        continue  # Skip to next iteration to handle transition
-                    
-                    display_mgr.update_timer(int(time_left))
-                    
-                    # Check for incoming messages from server (e.g., DEAD)
-                    if uart.in_waiting:
-                        data = uart.read(uart.in_waiting)
-                        if data:
-                            received = data.decode('utf-8').strip()
-                            print(f"Received (unsolicited): {received}")
-                            
-                            if "DEAD" in received:
-                                reason = "Scrappy Died!"
-                                display_mgr.show_game_over_screen(reason)
-                                print(f"Game Over: {reason}")
-                                continue
-                    
-                    # Check for player input
-                    message = None
-                    shake = accelerometer.detect_z_shake(time.monotonic())
-                    
-                    if shake:
-                        message = "MANUAL\n"
-                        display_mgr.update_command("Sent: MANUAL")
-                    else:
-                        button_pressed = buttons.get_pressed_button()
-                        if button_pressed:
-                            message = f"{button_pressed}\n"
-                            display_mgr.update_command(f"Sent: {button_pressed}")
-                    
-                    if message:
-                        uart.write(message.encode('utf-8'))
-                        print(f"Sent: {message.strip()}")
-                        
-                        display_mgr.update_response("Waiting...")
-                        response_received = False
-                        response_timeout = time.monotonic() + 2  # 2 second timeout
-                        
-                        while connection.connected and not response_received and time.monotonic() < response_timeout:
-                            if uart.in_waiting:
-                                data = uart.read(uart.in_waiting)
-                                if data:
-                                    received = data.decode('utf-8').strip()
-                                    print(f"Received: {received}")
-                                    
-                                    if "DEAD" in received:
-                                        reason = "Scrappy Died!"
-                                        display_mgr.show_game_over_screen(reason)
-                                        LEVEL_LENGTH = LEVEL1_LENGTH
-                                        print(f"Game Over: {reason}")
-                                        # Don't set game_running = False here either
-                                    else:
-                                        display_mgr.update_response("ACK OK!")
-                                    
-                                    response_received = True
-                        
-                        if not response_received:
-                            display_mgr.update_response("Timeout")
-                            print("Warning: No response from server")
-                        
-                        time.sleep(0.1)
-                        display_mgr.update_response("")
-
-                
-                # ===== LEVEL TRANSITION =====
-                elif display_mgr.is_transition_screen():
-                    time.sleep(2)
-                    
-                    LEVEL_LENGTH += ADD_TIME
-                    # Clear pending data
-                    if uart.in_waiting:
-                        uart.read(uart.in_waiting)
-                    
-                    # Send new level info
-                    message = f"LEVEL:{str(game_level)}:{display_mgr.get_difficulty_name()}\n"
-                    uart.write(message.encode('utf-8'))
-                    print(f"Sent: {message.strip()}")
-                    
-                    # Wait for ACK
-                    response_received = False
-                    timeout = time.monotonic() + 5
-                    
-                    while connection.connected and not response_received and time.monotonic() < timeout:
-                        if uart.in_waiting:
-                            data = uart.read(uart.in_waiting)
-                            if data:
-                                received = data.decode('utf-8').strip()
-                                print(f"Level ACK: {received}")
-                                response_received = True
-                    
-                    # Return to game and reset timer
-                    display_mgr.show_game_screen()
-                    display_mgr.update_level(game_level)
-                    game_start = time.monotonic()
-                    print(f"Level {game_level} started at: {game_start}")
-                
-                # ===== GAME OVER =====
-                elif display_mgr.is_game_over_screen():
-                    print("Waiting for shake to restart...")
-                    LEVEL_LENGTH = LEVEL1_LENGTH
-                    if accelerometer.detect_z_shake(time.monotonic()):
-                        print("Restarting game...")
-                        game_running = False  # Exit game loop, return to menu
-                
-                # ===== GAME WIN =====
-                elif display_mgr.is_game_win_screen():
-                    print("Waiting for shake to return to menu...")
-                    LEVEL_LENGTH = LEVEL1_LENGTH
-                    if accelerometer.detect_z_shake(time.monotonic()):
-                        print("Returning to menu...")
-                        game_running = False  # Exit game loop, return to menu
-                
-                time.sleep(0.01)
+            # Draw everything that changed this iteration as one frame
+            monitor.begin(REGION_DISPLAY)
+            display_mgr.refresh(now)
+            monitor.end()
             
-            # If connection lost during game, exit session
-            if not connection.connected:
-                session_active = False
+            memory.check()
+            tasks.sleep()
         
         print("Disconnected from server")
+        print(f"Link: {link.frames_sent} frames in {link.writes} writes")
+        print(f"Heartbeat: {heartbeat.stats}, longest gap {heartbeat.longest_gap * 1000:.0f}ms")
+        print(f"Steering: {steering.key_frames} key frames, {steering.delta_frames} deltas, {steering.skipped} skipped")
+        monitor.print_stats()
+        tasks.print_stats()
+        display_mgr.print_stats()
+        memory.print_stats()
+        memory.release()
         neopixel_status.show_disconnected()  # Show red when disconnected
         display_mgr.update_connection_status("Disconnected", "")
         time.sleep(2)
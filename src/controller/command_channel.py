@@ -0,0 +1,209 @@
+import time
+from link import FrameBatch
+from protocol import opcode_name, OP_ACK, OP_PONG, OP_SESSION, SESSION_ACKLESS_MOVES
+
+
+class CommandChannel:
+    """
+    Non-blocking, sequence-numbered command sender.
+
+    Up to WINDOW commands can be in flight at once. Each one carries a
+    sequence number that Scrappy echoes back in its ACK, ACKs are matched
+    whenever service() runs and commands that are not acknowledged within
+    RETRY_TIMEOUT are retransmitted. Scrappy drops the duplicates.
+
+    On the text protocol there are no sequence numbers, ACKs are matched
+    to the oldest command in flight and nothing is retransmitted.
+
+    Frames that are not ACKs (e.g. DEAD) are collected in events on every
+    service() call.
+
+    With an ACK-less session (open_session) movement commands are sent
+    without a sequence number and Scrappy reports state changes as events
+    instead of acknowledging every move.
+
+    An optional HeartbeatSender is serviced along with the channel and is
+    handed the PONG replies.
+    """
+
+    WINDOW = 4
+    RETRY_TIMEOUT = 0.3   # seconds before a command is sent again
+    TEXT_TIMEOUT = 2.0    # seconds before a text protocol command is given up
+    MAX_RETRIES = 3
+
+    def __init__(self, link, heartbeat=None, verbose=False):
+        self.link = link
+        self.heartbeat = heartbeat
+        self.verbose = verbose
+        self.events = FrameBatch(8)
+
+        # In-flight slots, seq 0 means the slot is free
+        self._seq = bytearray(self.WINDOW)
+        self._opcode = bytearray(self.WINDOW)
+        self._arg0 = [0] * self.WINDOW
+        self._arg1 = [0] * self.WINDOW
+        self._sent_time = [0.0] * self.WINDOW
+        self._retries = bytearray(self.WINDOW)
+        self._next_seq = 1
+        self.session_flags = 0
+
+        # Results since the last pop_acked() / pop_lost()
+        self._acked = 0
+        self._lost = 0
+
+        # Statistics
+        self.sent = 0
+        self.sent_unacked = 0
+        self.retransmits = 0
+        self.total_acked = 0
+        self.total_lost = 0
+        self.last_rtt = 0.0
+
+    def reset(self):
+        """Forget everything in flight"""
+        for i in range(self.WINDOW):
+            self._seq[i] = 0
+        self.events.count = 0
+        self._acked = 0
+        self._lost = 0
+
+    def in_flight(self):
+        """Number of commands waiting for an ACK"""
+        count = 0
+        for i in range(self.WINDOW):
+            if self._seq[i]:
+                count += 1
+        return count
+
+    def send(self, opcode, arg0=0, arg1=0):
+        """
+        Queue and send a command without waiting for its ACK
+        Returns: the sequence number used, 0 if the window is full
+        """
+        if 0 not in self._seq:
+            if self.verbose:
+                print(f"Window full, dropped {opcode_name(opcode)}")
+            return 0
+        slot = self._seq.index(0)
+        seq = self._next_seq
+        self._next_seq = seq + 1 if seq < 255 else 1
+
+        self._seq[slot] = seq
+        self._opcode[slot] = opcode
+        self._arg0[slot] = arg0
+        self._arg1[slot] = arg1
+        self._retries[slot] = 0
+        self._sent_time[slot] = time.monotonic()
+        self.link.send(opcode, arg0, arg1, seq)
+        self.sent += 1
+        return seq
+
+    def send_unacked(self, opcode, arg0=0, arg1=0):
+        """Send a fire-and-forget command, it is never retransmitted"""
+        self.link.send(opcode, arg0, arg1, 0)
+        self.sent_unacked += 1
+
+    def send_move(self, opcode):
+        """
+        Send a movement command, fire-and-forget if the session allows it
+        Returns: True if the command expects an ACK
+        """
+        if self.session_flags & SESSION_ACKLESS_MOVES:
+            self.send_unacked(opcode)
+            return False
+        return self.send(opcode) != 0
+
+    def open_session(self, flags, timeout=1.0):
+        """
+        Ask Scrappy for session flags (blocking, binary protocol only)
+        Returns: the flags Scrappy accepted
+        """
+        self.session_flags = 0
+        if not self.link.binary:
+            return 0
+        self.send(OP_SESSION, flags)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.service()
+            events = self.events
+            for i in range(events.count):
+                if events.opcodes[i] == OP_SESSION:
+                    self.session_flags = events.arg0[i]
+                    print(f"Session flags: 0x{self.session_flags:02X}")
+                    return self.session_flags
+            time.sleep(0.01)
+        print("Session flags not accepted")
+        return 0
+
+    def service(self, now=None):
+        """
+        Read incoming frames, match ACKs, retransmit overdue commands and
+        flush the link's output buffer
+        """
+        if now is None:
+            now = time.monotonic()
+        link = self.link
+        events = self.events
+        events.count = 0
+
+        link.poll()
+        while link.next_frame():
+            if link.opcode == OP_ACK:
+                self._match_ack(link.seq, now)
+            elif link.opcode == OP_PONG:
+                if self.heartbeat:
+                    self.heartbeat.on_pong(link.arg0)
+            elif events.count < events.capacity:
+                events.add(link.opcode, link.arg0, link.arg1, link.seq)
+
+        timeout = self.RETRY_TIMEOUT if link.binary else self.TEXT_TIMEOUT
+        for slot in range(self.WINDOW):
+            seq = self._seq[slot]
+            if not seq or now - self._sent_time[slot] < timeout:
+                continue
+            if not link.binary or self._retries[slot] >= self.MAX_RETRIES:
+                print(f"No ACK for {opcode_name(self._opcode[slot])} #{seq}")
+                self._seq[slot] = 0
+                self._lost += 1
+                self.total_lost += 1
+                continue
+            self._retries[slot] += 1
+            self._sent_time[slot] = now
+            link.send(self._opcode[slot], self._arg0[slot], self._arg1[slot], seq)
+            self.retransmits += 1
+
+        if self.heartbeat:
+            self.heartbeat.service(now)
+        link.flush()
+
+    def _match_ack(self, seq, now):
+        slot = -1
+        if seq:
+            if seq in self._seq:
+                slot = self._seq.index(seq)
+        else:
+            # Text protocol: the oldest command in flight is acknowledged
+            oldest = None
+            for i in range(self.WINDOW):
+                if self._seq[i] and (oldest is None or self._sent_time[i] < oldest):
+                    oldest = self._sent_time[i]
+                    slot = i
+        if slot < 0:
+            # ACK for a retransmission that was already matched
+            return
+        self.last_rtt = now - self._sent_time[slot]
+        self._seq[slot] = 0
+        self._acked += 1
+        self.total_acked += 1
+
+    def pop_acked(self):
+        """Number of commands acknowledged since the last call"""
+        count = self._acked
+        self._acked = 0
+        return count
+
+    def pop_lost(self):
+        """Number of commands given up on since the last call"""
+        count = self._lost
+        self._lost = 0
+        return count
@@ -1,10 +1,25 @@
+import gc
+import time
 import displayio
 import terminalio
 from adafruit_display_text import label
 import adafruit_displayio_ssd1306
 
 class DisplayManager:
-    """Manage different screens for the game"""
+    """
+    Manage different screens for the game
+
+    The panel is not refreshed automatically. Updates only change labels
+    whose text actually changed and mark the frame dirty, refresh() then
+    pushes all of them to the display in one frame, at most MAX_FPS times
+    per second. The I2C bus is shared with the accelerometer, so every
+    refresh that is skipped is bus time left for sampling.
+
+    Screens are built the first time they are shown. With release_screens
+    they are freed again when left, except the connection screen. The
+    lowest free heap seen right after a screen was built or switched is
+    kept in min_free, the peak heap the screens cost.
+    """
     
     # Screen constants
     SCREEN_CONNECTION = 0
@@ -19,120 +34,240 @@ class DisplayManager:
     DIFFICULTY_MEDIUM = 1
     DIFFICULTY_HARD = 2
     
-    def __init__(self, display):
+    MAX_FPS = 20  # refreshes per second at most
+    TIMER_TEXTS = 60  # seconds, timer label texts up to this are prebuilt
+    
+    # Label attributes of every screen, cleared when the screen is released
+    SCREEN_LABELS = (
+        ("conn_title", "conn_status", "conn_detail"),
+        ("menu_title", "easy_label", "medium_label", "hard_label"),
+        ("game_title", "level_label", "timer_label", "command_label", "response_label"),
+        ("gameover_title", "gameover_reason", "gameover_instruction"),
+        ("transition_title", "transition_message", "transition_message2"),
+        ("gamewin_title", "gamewin_message", "gamewin_message2", "gamewin_instruction"),
+    )
+    
+    def __init__(self, display, release_screens=False):
         self.display = display
+        self.release_screens = release_screens
+        self.display.auto_refresh = False
+        self._dirty = True
+        self._last_refresh = 0
+        self._timer_seconds = None
+        # The timer changes every second, its texts are built once here
+        self._timer_texts = tuple(f"Time: {seconds}s" for seconds in range(self.TIMER_TEXTS + 1))
+        
+        # Statistics
+        self.refreshes = 0
+        self.refreshes_skipped = 0
+        self.text_updates = 0
+        self.text_unchanged = 0
+        self.screens_built = 0
+        # CPython has no mem_free, the heap is not sampled on a host
+        self._mem_free = getattr(gc, "mem_free", None)
+        self.min_free = None
         self.current_screen = self.SCREEN_CONNECTION
         self.selected_difficulty = self.DIFFICULTY_EASY
         self.current_level = 1
         self.game_over_reason = ""
         self.response = ""
         
-        # Create groups for each screen
-        self.connection_group = displayio.Group()
-        self.menu_group = displayio.Group()
-        self.game_group = displayio.Group()
-        self.game_over_group = displayio.Group()
-        self.transition_group = displayio.Group()
-        self.game_win_group = displayio.Group()
-        
-        self._setup_connection_screen()
-        self._setup_menu_screen()
-        self._setup_game_screen()
-        self._setup_game_over_screen()
-        self._setup_transition_screen()
-        self._setup_game_win_screen()
+        # Screens are built on first use, indexed by screen constant
+        self._groups = [None] * len(self.SCREEN_LABELS)
+        self._setups = (
+            self._setup_connection_screen,
+            self._setup_menu_screen,
+            self._setup_game_screen,
+            self._setup_game_over_screen,
+            self._setup_transition_screen,
+            self._setup_game_win_screen,
+        )
         
         # Show connection screen by default
-        self.display.root_group = self.connection_group
+        self._switch(self.SCREEN_CONNECTION)
+    
+    # RENDERING HOOKS, overridden by other rendering backends
+    def _label(self, text, x, y):
+        """Create a text element"""
+        return label.Label(terminalio.FONT, text=text, x=x, y=y)
+    
+    def _group(self):
+        """Create an empty screen"""
+        return displayio.Group()
+    
+    # SCREEN CONSTRUCTION
+    def _build(self, screen):
+        """Returns: the screen's group, built now if it does not exist yet"""
+        group = self._groups[screen]
+        if group is None:
+            group = self._setups[screen]()
+            self._groups[screen] = group
+            self.screens_built += 1
+            self._sample_heap()
+        return group
+    
+    def _release(self, screen):
+        """Drop a screen's group and labels so they can be collected"""
+        self._groups[screen] = None
+        for name in self.SCREEN_LABELS[screen]:
+            setattr(self, name, None)
+    
+    def _switch(self, screen):
+        """Show a screen, releasing the one that was left if enabled"""
+        left = self.current_screen
+        self._show_group(screen, self._build(screen))
+        if (self.release_screens and left != screen and left != self.SCREEN_CONNECTION
+                and self._groups[left] is not None):
+            self._release(left)
+        self._sample_heap()
+
+    def _sample_heap(self):
+        """Keep the lowest free heap seen, the peak the screens cost"""
+        if self._mem_free is None:
+            return
+        free = self._mem_free()
+        if self.min_free is None or free < self.min_free:
+            self.min_free = free
+    
+    # FRAME METHODS
+    def _set_text(self, text_label, text):
+        """Change a label's text only if it differs, marks the frame dirty"""
+        if text_label.text == text:
+            self.text_unchanged += 1
+            return
+        text_label.text = text
+        self.text_updates += 1
+        self._dirty = True
+    
+    def _show_group(self, screen, group):
+        self.current_screen = screen
+        if self.display.root_group is not group:
+            self.display.root_group = group
+            self._dirty = True
+    
+    def refresh(self, now=None, force=False):
+        """
+        Push all changes since the last frame to the display
+        Returns: True if the display was refreshed
+        """
+        if now is None:
+            now = time.monotonic()
+        if not self._dirty or (not force and now - self._last_refresh < 1 / self.MAX_FPS):
+            self.refreshes_skipped += 1
+            return False
+        self.display.refresh(target_frames_per_second=None)
+        self._last_refresh = now
+        self._dirty = False
+        self.refreshes += 1
+        return True
+    
+    def print_stats(self):
+        """Print how many refreshes and label updates were performed and skipped"""
+        print(f"Display: {self.refreshes} refreshes, {self.refreshes_skipped} skipped, "
+              f"{self.text_updates} text updates, {self.text_unchanged} unchanged, "
+              f"{self.screens_built} screens built, lowest free heap {self.min_free}")
     
     def _setup_connection_screen(self):
         """Setup BLE connection screen"""
-        self.conn_title = label.Label(terminalio.FONT, text="BLE Client", x=30, y=10)
-        self.conn_status = label.Label(terminalio.FONT, text="Scanning...", x=20, y=30)
-        self.conn_detail = label.Label(terminalio.FONT, text="", x=10, y=50)
+        group = self._group()
+        self.conn_title = self._label("BLE Client", x=30, y=10)
+        self.conn_status = self._label("Scanning...", x=20, y=30)
+        self.conn_detail = self._label("", x=10, y=50)
         
-        self.connection_group.append(self.conn_title)
-        self.connection_group.append(self.conn_status)
-        self.connection_group.append(self.conn_detail)
+        group.append(self.conn_title)
+        group.append(self.conn_status)
+        group.append(self.conn_detail)
+        return group
     
     def _setup_menu_screen(self):
         """Setup difficulty selection menu"""
-        self.menu_title = label.Label(terminalio.FONT, text="Select Difficulty", x=10, y=5)
+        group = self._group()
+        self.menu_title = self._label("Select Difficulty", x=10, y=5)
         
         # Difficulty options
-        self.easy_label = label.Label(terminalio.FONT, text="  EASY", x=20, y=25)
-        self.medium_label = label.Label(terminalio.FONT, text="  MEDIUM", x=20, y=40)
-        self.hard_label = label.Label(terminalio.FONT, text="  HARD", x=20, y=55)
+        self.easy_label = self._label("  EASY", x=20, y=25)
+        self.medium_label = self._label("  MEDIUM", x=20, y=40)
+        self.hard_label = self._label("  HARD", x=20, y=55)
         
-        self.menu_group.append(self.menu_title)
-        self.menu_group.append(self.easy_label)
-        self.menu_group.append(self.medium_label)
-        self.menu_group.append(self.hard_label)
+        group.append(self.menu_title)
+        group.append(self.easy_label)
+        group.append(self.medium_label)
+        group.append(self.hard_label)
+        return group
     
     def _setup_game_screen(self):
         """Setup game play screen"""
-        self.game_title = label.Label(terminalio.FONT, text="Playing", x=35, y=10)
-        self.level_label = label.Label(terminalio.FONT, text="Level: 1", x=30, y=20)
-        self.timer_label = label.Label(terminalio.FONT, text="Time: 30s", x=25, y=30)
-        self.command_label = label.Label(terminalio.FONT, text="", x=10, y=40)
-        self.response_label = label.Label(terminalio.FONT, text="", x=10, y=50)
+        group = self._group()
+        self.game_title = self._label("Playing", x=35, y=10)
+        self.level_label = self._label("Level: 1", x=30, y=20)
+        self.timer_label = self._label("Time: 30s", x=25, y=30)
+        self.command_label = self._label("", x=10, y=40)
+        self.response_label = self._label("", x=10, y=50)
+        self._timer_seconds = None
         
-        self.game_group.append(self.game_title)
-        self.game_group.append(self.level_label)
-        self.game_group.append(self.timer_label)
-        self.game_group.append(self.command_label)
-        self.game_group.append(self.response_label)
+        group.append(self.game_title)
+        group.append(self.level_label)
+        group.append(self.timer_label)
+        group.append(self.command_label)
+        group.append(self.response_label)
+        return group
     
     def _setup_game_over_screen(self):
         """Setup game over screen"""
-        self.gameover_title = label.Label(terminalio.FONT, text="GAME OVER", x=25, y=15)
-        self.gameover_reason = label.Label(terminalio.FONT, text="", x=5, y=35, scale=1)
-        self.gameover_instruction = label.Label(terminalio.FONT, text="Shake to restart", x=5, y=55)
+        group = self._group()
+        self.gameover_title = self._label("GAME OVER", x=25, y=15)
+        self.gameover_reason = self._label("", x=5, y=35)
+        self.gameover_instruction = self._label("Shake to restart", x=5, y=55)
         
-        self.game_over_group.append(self.gameover_title)
-        self.game_over_group.append(self.gameover_reason)
-        self.game_over_group.append(self.gameover_instruction)
+        group.append(self.gameover_title)
+        group.append(self.gameover_reason)
+        group.append(self.gameover_instruction)
+        return group
     
     def _setup_transition_screen(self):
         """Setup level transition screen"""
-        self.transition_title = label.Label(terminalio.FONT, text="Level Passed!", x=20, y=20)
-        self.transition_message = label.Label(terminalio.FONT, text="Starting next", x=18, y=35)
-        self.transition_message2 = label.Label(terminalio.FONT, text=f"level {self.current_level}", x=35, y=48)
+        group = self._group()
+        self.transition_title = self._label("Level Passed!", x=20, y=20)
+        self.transition_message = self._label("Starting next", x=18, y=35)
+        self.transition_message2 = self._label(f"level {self.current_level}", x=35, y=48)
         
-        self.transition_group.append(self.transition_title)
-        self.transition_group.append(self.transition_message)
-        self.transition_group.append(self.transition_message2)
+        group.append(self.transition_title)
+        group.append(self.transition_message)
+        group.append(self.transition_message2)
+        return group
     
     def _setup_game_win_screen(self):
         """Setup game win screen"""
-        self.gamewin_title = label.Label(terminalio.FONT, text="YOU WIN!", x=30, y=15)
-        self.gamewin_message = label.Label(terminalio.FONT, text="All levels", x=25, y=30)
-        self.gamewin_message2 = label.Label(terminalio.FONT, text="completed!", x=25, y=42)
-        self.gamewin_instruction = label.Label(terminalio.FONT, text="Shake to restart", x=5, y=55)
+        group = self._group()
+        self.gamewin_title = self._label("YOU WIN!", x=30, y=15)
+        self.gamewin_message = self._label("All levels", x=25, y=30)
+        self.gamewin_message2 = self._label("completed!", x=25, y=42)
+        self.gamewin_instruction = self._label("Shake to restart", x=5, y=55)
         
-        self.game_win_group.append(self.gamewin_title)
-        self.game_win_group.append(self.gamewin_message)
-        self.game_win_group.append(self.gamewin_message2)
-        self.game_win_group.append(self.gamewin_instruction)
+        group.append(self.gamewin_title)
+        group.append(self.gamewin_message)
+        group.append(self.gamewin_message2)
+        group.append(self.gamewin_instruction)
+        return group
     
     # CONNECTION SCREEN METHODS
     def show_connection_screen(self):
         """Switch to connection screen"""
-        self.current_screen = self.SCREEN_CONNECTION
-        self.display.root_group = self.connection_group
+        self._switch(self.SCREEN_CONNECTION)
     
     def update_connection_status(self, status, detail=""):
-        """Update connection screen text"""
-        self.conn_status.text = status
-        self.conn_detail.text = detail
+        """Update connection screen text, shown right away since BLE calls block"""
+        self._set_text(self.conn_status, status)
+        self._set_text(self.conn_detail, detail)
+        self.refresh(force=True)
     
     # MENU SCREEN METHODS
     def show_menu_screen(self):
         """Switch to menu screen"""
-        self.current_screen = self.SCREEN_MENU
+        self._build(self.SCREEN_MENU)
         self.selected_difficulty = self.DIFFICULTY_EASY
         self._update_menu_selection()
-        self.display.root_group = self.menu_group
+        self._switch(self.SCREEN_MENU)
     
     def menu_move_down(self):
         """Move selection down in menu"""
@@ -144,18 +279,10 @@ class DisplayManager:
     
     def _update_menu_selection(self):
         """Update menu to show current selection with '>' indicator"""
-        # Reset all
-        self.easy_label.text = "  EASY"
-        self.medium_label.text = "  MEDIUM"
-        self.hard_label.text = "  HARD"
-        
-        # Highlight selected
-        if self.selected_difficulty == self.DIFFICULTY_EASY:
-            self.easy_label.text = "> EASY"
-        elif self.selected_difficulty == self.DIFFICULTY_MEDIUM:
-            self.medium_label.text = "> MEDIUM"
-        elif self.selected_difficulty == self.DIFFICULTY_HARD:
-            self.hard_label.text = "> HARD"
+        selected = self.selected_difficulty
+        self._set_text(self.easy_label, "> EASY" if selected == self.DIFFICULTY_EASY else "  EASY")
+        self._set_text(self.medium_label, "> MEDIUM" if selected == self.DIFFICULTY_MEDIUM else "  MEDIUM")
+        self._set_text(self.hard_label, "> HARD" if selected == self.DIFFICULTY_HARD else "  HARD")
     
     def get_selected_difficulty(self):
         """Get currently selected difficulty"""
@@ -173,29 +300,36 @@ class DisplayManager:
     # GAME SCREEN METHODS
     def show_game_screen(self):
         """Switch to game screen"""
-        self.current_screen = self.SCREEN_GAME
-        self.display.root_group = self.game_group
+        self._switch(self.SCREEN_GAME)
     
     def update_response(self, text):
-        self.response_label.text = text
+        self._set_text(self.response_label, text)
     
     def update_level(self, level):
         """Update the level display"""
         self.current_level = level
-        self.level_label.text = f"Level: {self.current_level}"
+        self._set_text(self.level_label, f"Level: {self.current_level}")
     
     def update_timer(self, seconds_left):
         """Update the timer display"""
-        self.timer_label.text = f"Time: {seconds_left}s"
+        if seconds_left == self._timer_seconds:
+            self.text_unchanged += 1
+            return
+        self._timer_seconds = seconds_left
+        if 0 <= seconds_left <= self.TIMER_TEXTS:
+            text = self._timer_texts[seconds_left]
+        else:
+            text = f"Time: {seconds_left}s"
+        self._set_text(self.timer_label, text)
     
     def update_command(self, command_text):
         """Update command label on game screen"""
-        self.command_label.text = command_text
+        self._set_text(self.command_label, command_text)
     
     # GAME OVER SCREEN METHODS
     def show_game_over_screen(self, reason=""):
         """Switch to game over screen"""
-        self.current_screen = self.SCREEN_GAME_OVER
+        self._build(self.SCREEN_GAME_OVER)
         self.game_over_reason = reason
         # Wrap text if too long
         if len(reason) > 20:
@@ -208,25 +342,24 @@ class DisplayManager:
                     line1 += word + " "
                 else:
                     line2 += word + " "
-            self.gameover_reason.text = line1.strip() + "\n" + line2.strip()
+            self._set_text(self.gameover_reason, line1.strip() + "\n" + line2.strip())
         else:
-            self.gameover_reason.text = reason
-        self.display.root_group = self.game_over_group
+            self._set_text(self.gameover_reason, reason)
+        self._switch(self.SCREEN_GAME_OVER)
     
     # TRANSITION SCREEN METHODS
     def show_transition_screen(self, level):
         """Switch to level transition screen"""
+        self._build(self.SCREEN_LEVEL_TRANSITION)
         self.current_level = level
-        self.current_screen = self.SCREEN_LEVEL_TRANSITION
         # Update the level number text dynamically
-        self.transition_message2.text = f"level {self.current_level}"
-        self.display.root_group = self.transition_group
+        self._set_text(self.transition_message2, f"level {self.current_level}")
+        self._switch(self.SCREEN_LEVEL_TRANSITION)
     
     # GAME WIN SCREEN METHODS
     def show_game_win_screen(self):
         """Switch to game win screen"""
-        self.current_screen = self.SCREEN_GAME_WIN
-        self.display.root_group = self.game_win_group
+        self._switch(self.SCREEN_GAME_WIN)
     
     # UTILITY METHODS
     def get_current_screen(self):
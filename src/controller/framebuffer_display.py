@@ -0,0 +1,163 @@
+import array
+import displayio
+import terminalio
+import bitmaptools
+from display import DisplayManager
+
+# Glyph cache entry for characters the font does not have
+_NO_GLYPH = 0xFFFF
+
+
+class TextField:
+    """Stands in for a Label: a run of character cells at a fixed position"""
+
+    def __init__(self, text, x, y):
+        self.text = text
+        self.x = x
+        self.y = y
+
+
+class TextFramebuffer:
+    """
+    One preallocated 1-bit bitmap covering the whole panel.
+
+    Text is drawn cell by cell from the font's glyph sheet, the position of
+    every printable character in the sheet is looked up once at startup.
+    Only cells whose character changed are redrawn, displayio then sends
+    just the dirty area of the bitmap to the display.
+    """
+
+    FIRST_CHAR = 32
+    LAST_CHAR = 126
+    LINE_SPACING = 1.25  # same as adafruit_display_text
+
+    def __init__(self, width, height, font=terminalio.FONT):
+        self.width = width
+        self.height = height
+        self.bitmap = displayio.Bitmap(width, height, 2)
+        palette = displayio.Palette(2)
+        palette[0] = 0x000000
+        palette[1] = 0xFFFFFF
+        self.group = displayio.Group()
+        self.group.append(displayio.TileGrid(self.bitmap, pixel_shader=palette))
+
+        self.cell_width, self.cell_height = font.get_bounding_box()[:2]
+        self.line_height = int(self.cell_height * self.LINE_SPACING)
+
+        # Glyph cache: x offset of every printable character in the glyph sheet
+        self.font_bitmap = None
+        self._glyph_x = array.array("H", [_NO_GLYPH] * (self.LAST_CHAR - self.FIRST_CHAR + 1))
+        for code in range(self.FIRST_CHAR, self.LAST_CHAR + 1):
+            glyph = font.get_glyph(code)
+            if glyph is None:
+                continue
+            self.font_bitmap = glyph.bitmap
+            self._glyph_x[code - self.FIRST_CHAR] = glyph.tile_index * self.cell_width
+
+        # Statistics
+        self.cells_drawn = 0
+
+    def clear(self):
+        self.bitmap.fill(0)
+
+    def draw(self, x, y, old, new):
+        """
+        Replace the text old with new at x, y (vertical center of the first
+        line, like a Label). Only character cells that differ are drawn.
+        """
+        # Both texts are walked line by line in place, splitting them would
+        # allocate on every update. Past the end of a line counts as spaces.
+        top = y - self.cell_height // 2
+        old_len = len(old)
+        new_len = len(new)
+        i = 0
+        j = 0
+        row = 0
+        col = 0
+        while i < old_len or j < new_len:
+            before = old[i] if i < old_len else "\n"
+            after = new[j] if j < new_len else "\n"
+            if before == "\n" and after == "\n":
+                i += 1
+                j += 1
+                row += 1
+                col = 0
+                continue
+            if before == "\n":
+                before = " "
+            else:
+                i += 1
+            if after == "\n":
+                after = " "
+            else:
+                j += 1
+            if after != before:
+                self._draw_char(x + col * self.cell_width, top + row * self.line_height, after)
+            col += 1
+
+    def _draw_char(self, x, y, char):
+        width = self.cell_width
+        height = self.cell_height
+        if x < 0 or x + width > self.width:
+            return
+        # Keep lines at the top and bottom edge on the panel
+        y = max(0, min(self.height - height, y))
+        code = ord(char)
+        src = _NO_GLYPH
+        # Spaces and characters the font lacks are cleared
+        if self.FIRST_CHAR < code <= self.LAST_CHAR:
+            src = self._glyph_x[code - self.FIRST_CHAR]
+        if src == _NO_GLYPH:
+            bitmaptools.fill_region(self.bitmap, x, y, x + width, y + height, 0)
+        else:
+            bitmaptools.blit(self.bitmap, self.font_bitmap, x, y,
+                             x1=src, y1=0, x2=src + width, y2=height)
+        self.cells_drawn += 1
+
+
+class FramebufferDisplayManager(DisplayManager):
+    """
+    DisplayManager drawing into a TextFramebuffer instead of Labels.
+
+    Same public methods. Screens are lists of TextFields, switching screens
+    redraws the framebuffer and changing a text redraws only the changed
+    cells, so memory use stays flat and every update sends as few bytes
+    over I2C as possible.
+    """
+
+    def __init__(self, display, release_screens=False):
+        self.framebuffer = TextFramebuffer(display.width, display.height)
+        self._shown = None
+        super().__init__(display, release_screens)
+        display.root_group = self.framebuffer.group
+
+    def _label(self, text, x, y):
+        return TextField(text, x, y)
+
+    def _group(self):
+        return []
+
+    def _set_text(self, field, text):
+        if field.text == text:
+            self.text_unchanged += 1
+            return
+        if self._shown is not None and field in self._shown:
+            self.framebuffer.draw(field.x, field.y, field.text, text)
+            self._dirty = True
+        field.text = text
+        self.text_updates += 1
+
+    def _show_group(self, screen, group):
+        self.current_screen = screen
+        if group is self._shown:
+            return
+        self._shown = group
+        framebuffer = self.framebuffer
+        framebuffer.clear()
+        for field in group:
+            framebuffer.draw(field.x, field.y, "", field.text)
+        self._dirty = True
+
+    def print_stats(self):
+        super().print_stats()
+        print(f"Framebuffer: {self.framebuffer.cells_drawn} cells drawn")
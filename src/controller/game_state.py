@@ -0,0 +1,336 @@
+from scheduler import Scheduler, NEVER
+from gestures import GESTURE_FLICK_LEFT, GESTURE_FLICK_RIGHT
+from protocol import (
+    opcode_name, BUTTON_OPCODES, MODE_NAMES,
+    OP_LEVEL, OP_STOP, OP_MANUAL, OP_DEAD, OP_MODE, OP_MANUAL_END, OP_LEVEL_START, OP_FAILSAFE, OP_DANGER,
+    MODE_MANUAL,
+)
+
+# Game states, each one is an index into the dispatch tables
+STATE_MENU = 0
+STATE_PLAYING = 1
+STATE_TRANSITION = 2
+STATE_GAME_OVER = 3
+STATE_GAME_WIN = 4
+STATE_NAMES = ("MENU", "PLAYING", "TRANSITION", "GAME_OVER", "GAME_WIN")
+
+# Events fed to dispatch(event, arg0, arg1, now)
+EVENT_LINK = 0      # the link was serviced
+EVENT_FRAME = 1     # unsolicited frame from Scrappy: arg0 opcode, arg1 first field
+EVENT_BUTTON = 2    # button sample: arg0 button name, None if released
+EVENT_ENCODER = 3   # encoder turned: arg0 detents
+EVENT_SHAKE = 4     # the controller was shaken
+EVENT_TIMER = 5     # a deadline passed: arg0 TASK_TIMER or TASK_TRANSITION
+EVENT_GESTURE = 6   # any other gesture: arg0 GESTURE_*, arg1 confidence, see GESTURE_BUTTONS
+EVENT_STEER = 7     # steering frame due: arg0, arg1 tilt X and Y in counts from rest
+
+# Scheduler tasks, registered in this order
+TASK_LINK = 0
+TASK_ENCODER = 1
+TASK_BUTTONS = 2
+TASK_SHAKE = 3
+TASK_TIMER = 4
+TASK_TRANSITION = 5
+TASK_STEER = 6
+PERIODIC_TASKS = (TASK_LINK, TASK_ENCODER, TASK_BUTTONS, TASK_SHAKE, TASK_STEER)
+
+# Periodic tasks sampled in each state, the others are parked
+STATE_TASKS = (
+    (TASK_LINK, TASK_ENCODER, TASK_BUTTONS),   # MENU
+    (TASK_LINK, TASK_BUTTONS, TASK_SHAKE, TASK_STEER),  # PLAYING
+    (TASK_LINK,),                              # TRANSITION
+    (TASK_LINK, TASK_SHAKE),                   # GAME_OVER
+    (TASK_LINK, TASK_SHAKE),                   # GAME_WIN
+)
+
+# Label texts shown while playing, built once instead of on every event
+COMMAND_TEXTS = {button: f"Sent: {button}" for button in BUTTON_OPCODES}
+MODE_TEXTS = tuple(f"Mode: {name}" for name in MODE_NAMES)
+
+# Gestures that press a button while playing, the others are not used yet
+GESTURE_BUTTONS = {
+    GESTURE_FLICK_LEFT: "LEFT",
+    GESTURE_FLICK_RIGHT: "RIGHT",
+}
+
+
+class GameStateMachine:
+    """
+    Controller game flow as a table-driven state machine.
+
+    Every state has an enter, update and exit handler, looked up by state
+    index. The main loop samples the inputs whose tasks are due and feeds
+    them in as events, update handlers return the next state (or None to
+    stay). Nothing here touches hardware, the display, command channel and
+    rotary encoder are passed in, so the flow runs on a host with stand-ins.
+    """
+
+    LEVEL1_LENGTH = 10        # seconds
+    ADD_TIME = 2              # seconds added to every following level
+    MAX_LEVEL = 10            # win after completing this level
+    BUTTON_REPEAT = 0.2       # seconds between repeated commands while a button is held
+    RESPONSE_SHOW_TIME = 0.1  # seconds the ACK status stays on screen
+    TRANSITION_TIME = 2       # seconds the level transition screen stays up
+    LEVEL_ACK_TIMEOUT = 5     # seconds to wait for the next level's ACK
+
+    LINK_PERIOD = 0.01        # seconds between link services (ACKs, retransmits, heartbeats)
+    ENCODER_PERIOD = 0.002    # seconds between rotary encoder samples
+    BUTTON_PERIOD = 0.01      # seconds between button samples
+    SHAKE_PERIOD = 0.01       # seconds between accelerometer FIFO reads
+    STEER_PERIOD = 0.04       # seconds between steering frames (25 Hz)
+
+    def __init__(self, display, steering=None, memory=None, encoder=None):
+        self.display = display
+        self.steering = steering
+        self.memory = memory
+        self.encoder = encoder
+        self.steering_active = False
+        self.channel = None
+        self.state = None
+        self.transitions = 0
+
+        self.tasks = Scheduler()
+        self.tasks.add("link", self.LINK_PERIOD)
+        self.tasks.add("encoder", self.ENCODER_PERIOD)
+        self.tasks.add("buttons", self.BUTTON_PERIOD)
+        self.tasks.add("shake", self.SHAKE_PERIOD)
+        self.tasks.add("timer", 0)
+        self.tasks.add("transition", 0)
+        self.tasks.add("steer", self.STEER_PERIOD)
+
+        # Game progress
+        self.level = 1
+        self.level_length = self.LEVEL1_LENGTH
+        self.level_start = 0
+        self.level_ack_deadline = 0
+        self.reason = ""
+
+        # Input and status display
+        self.last_button = None
+        self.next_repeat_time = 0
+        self.response_clear_time = 0
+
+        # Dispatch tables, indexed by state
+        self._enter = (self._enter_menu, self._enter_playing, self._enter_transition,
+                       self._enter_game_over, self._enter_game_win)
+        self._update = (self._update_menu, self._update_playing, self._update_transition,
+                        self._update_game_over, self._update_game_over)
+        self._exit = (self._nothing, self._exit_playing, self._exit_transition,
+                      self._nothing, self._nothing)
+
+    def start(self, channel, now):
+        """Begin a session on a new connection, starts at the menu"""
+        self.channel = channel
+        # Nothing left over from the last session fires, the menu parks what it doesn't sample
+        self.tasks.start(now)
+        self.go(STATE_MENU, now)
+
+    def go(self, state, now):
+        """Leave the current state and enter another one"""
+        if self.state is not None:
+            self._exit[self.state](now)
+        self.state = state
+        self.transitions += 1
+
+        tasks = self.tasks
+        active = STATE_TASKS[state]
+        for task in PERIODIC_TASKS:
+            if task not in active:
+                tasks.set_deadline(task, NEVER)
+            elif tasks.deadlines[task] == NEVER:
+                tasks.set_deadline(task, now)
+
+        self._enter[state](now)
+
+    def dispatch(self, event, arg0=0, arg1=0, now=0):
+        """Hand an event to the current state, switch if it asks to"""
+        state = self._update[self.state](event, arg0, arg1, now)
+        if state is not None and state != self.state:
+            self.go(state, now)
+
+    def _nothing(self, now):
+        pass
+
+    # ===== MENU =====
+
+    def _enter_menu(self, now):
+        self.display.show_menu_screen()
+        if self.encoder:
+            # The menu starts on EASY, forget turns made since the last visit
+            self.encoder.reset(to_detent=0)
+
+    def _update_menu(self, event, arg0, arg1, now):
+        display = self.display
+        if event == EVENT_ENCODER:
+            if arg0 > 0:
+                for _ in range(arg0):
+                    display.menu_move_down()
+                print(f"Selected: {display.get_difficulty_name()}")
+        elif event == EVENT_BUTTON and arg0 == "RIGHT":
+            print(f"Starting game on {display.get_difficulty_name()} mode")
+            self.level = 1
+            self.level_length = self.LEVEL1_LENGTH
+            # RIGHT stays held, it only moves Scrappy once released and pressed again
+            self.last_button = "RIGHT"
+            self.next_repeat_time = NEVER
+            self.response_clear_time = 0
+            self.channel.reset()
+            self.channel.send(OP_LEVEL, self.level, display.get_selected_difficulty())
+            return STATE_PLAYING
+        return None
+
+    # ===== PLAYING =====
+
+    def _enter_playing(self, now):
+        self.display.show_game_screen()
+        self.display.update_level(self.level)
+        self.level_start = now
+        self.tasks.set_deadline(TASK_TIMER, now)
+        if self.memory:
+            # No automatic collections while the level timer runs
+            self.memory.hold()
+        print(f"Level {self.level} started at: {now}")
+
+    def _exit_playing(self, now):
+        self.tasks.set_deadline(TASK_TIMER, NEVER)
+        self.steering_active = False
+        if self.memory:
+            # Transition or game over, a good moment for a collection
+            self.memory.release()
+            self.memory.collect()
+
+    def _update_playing(self, event, arg0, arg1, now):
+        display = self.display
+        channel = self.channel
+
+        if event == EVENT_TIMER:
+            # Runs whenever the displayed second changes
+            time_left = self.level_length - (now - self.level_start)
+            if time_left <= 0:
+                channel.send(OP_STOP)
+                # Check if player won (completed the last level)
+                if self.level >= self.MAX_LEVEL:
+                    print("Game completed! Player wins!")
+                    return STATE_GAME_WIN
+                self.level += 1
+                print(f"Level {self.level - 1} complete!")
+                return STATE_TRANSITION
+            seconds_left = int(time_left)
+            display.update_timer(seconds_left)
+            self.tasks.set_deadline(TASK_TIMER, self.level_start + self.level_length - seconds_left)
+
+        elif event == EVENT_FRAME:
+            print(f"Received (unsolicited): {opcode_name(arg0)}")
+            if arg0 == OP_DEAD:
+                self.reason = "Scrappy Died!"
+                return STATE_GAME_OVER
+            if arg0 == OP_MODE:
+                if not 0 <= arg1 < len(MODE_TEXTS):
+                    # Corrupt frame or a newer Scrappy, keep the current mode
+                    print(f"Unknown mode {arg1} ignored")
+                    return None
+                display.update_response(MODE_TEXTS[arg1])
+                self.response_clear_time = now + 1
+                # Tilt steering while Scrappy is in manual mode (binary protocol only)
+                self.steering_active = (arg1 == MODE_MANUAL and self.steering is not None
+                                        and channel.link.binary)
+                if self.steering_active:
+                    self.steering.restart()
+            elif arg0 == OP_MANUAL_END:
+                display.update_command("Manual over")
+                self.steering_active = False
+            elif arg0 == OP_LEVEL_START:
+                print(f"Scrappy started level {arg1}")
+            elif arg0 == OP_FAILSAFE:
+                display.update_response(f"Link gap {arg1}ms")
+                self.response_clear_time = now + 1
+            elif arg0 == OP_DANGER:
+                display.update_response(f"EDGE in {arg1}ms!")
+                self.response_clear_time = now + 1
+
+        elif event == EVENT_LINK:
+            if channel.pop_lost():
+                display.update_response("Timeout")
+                print("Warning: No response from server")
+                self.response_clear_time = now + self.RESPONSE_SHOW_TIME
+            elif channel.pop_acked():
+                display.update_response("ACK OK!")
+                self.response_clear_time = now + self.RESPONSE_SHOW_TIME
+            elif self.response_clear_time and now >= self.response_clear_time and not channel.in_flight():
+                display.update_response("")
+                self.response_clear_time = 0
+
+        elif event == EVENT_STEER:
+            if self.steering_active:
+                self.steering.send(channel, arg0, arg1)
+
+        elif event == EVENT_SHAKE:
+            display.update_command("Sent: MANUAL")
+            self._sent(channel.send(OP_MANUAL) != 0)
+
+        elif event == EVENT_GESTURE:
+            # A flick turns Scrappy like its button, tilt steering keeps the wheels to itself
+            button = GESTURE_BUTTONS.get(arg0)
+            if button and not self.steering_active:
+                display.update_command(COMMAND_TEXTS[button])
+                self._sent(channel.send_move(BUTTON_OPCODES[button]))
+
+        elif event == EVENT_BUTTON:
+            button = arg0
+            if button and (button != self.last_button or now >= self.next_repeat_time):
+                display.update_command(COMMAND_TEXTS[button])
+                self.next_repeat_time = now + self.BUTTON_REPEAT
+                # Doesn't wait for the ACK, the channel matches it later
+                self._sent(channel.send_move(BUTTON_OPCODES[button]))
+            self.last_button = button
+        return None
+
+    def _sent(self, expects_ack):
+        if expects_ack:
+            self.display.update_response("Waiting...")
+            self.response_clear_time = 0
+
+    # ===== LEVEL TRANSITION =====
+
+    def _enter_transition(self, now):
+        self.display.show_transition_screen(self.level)
+        self.tasks.set_deadline(TASK_TRANSITION, now + self.TRANSITION_TIME)
+
+    def _exit_transition(self, now):
+        self.tasks.set_deadline(TASK_TRANSITION, NEVER)
+        self.level_ack_deadline = 0
+
+    def _update_transition(self, event, arg0, arg1, now):
+        channel = self.channel
+        if event == EVENT_TIMER:
+            self.level_length += self.ADD_TIME
+            # Clear pending data
+            channel.reset()
+            channel.link.discard_input()
+            # Send new level info, the level starts once it is acknowledged
+            channel.send(OP_LEVEL, self.level, self.display.get_selected_difficulty())
+            self.level_ack_deadline = now + self.LEVEL_ACK_TIMEOUT
+        elif event == EVENT_LINK and self.level_ack_deadline:
+            if not channel.in_flight():
+                return STATE_PLAYING
+            if now >= self.level_ack_deadline:
+                print("Warning: No level ACK from server")
+                return STATE_PLAYING
+        return None
+
+    # ===== GAME OVER / GAME WIN =====
+
+    def _enter_game_over(self, now):
+        self.display.show_game_over_screen(self.reason)
+        print(f"Game Over: {self.reason}")
+        print("Waiting for shake to restart...")
+
+    def _enter_game_win(self, now):
+        self.display.show_game_win_screen()
+        print("Waiting for shake to return to menu...")
+
+    def _update_game_over(self, event, arg0, arg1, now):
+        if event == EVENT_SHAKE:
+            print("Returning to menu...")
+            return STATE_MENU
+        return None
@@ -0,0 +1,234 @@
+import array
+
+# Gestures, each id is an index into GESTURE_NAMES
+GESTURE_NONE = 0
+GESTURE_SHAKE = 1
+GESTURE_FLICK_LEFT = 2
+GESTURE_FLICK_RIGHT = 3
+GESTURE_TILT_HOLD = 4
+GESTURE_NAMES = ("none", "shake", "flick-left", "flick-right", "tilt-hold")
+
+_AXIS_X = 0
+_AXIS_Y = 1
+_AXES = 3
+
+
+class GestureRecognizer:
+    """
+    Incremental gesture recognizer over the last WINDOW samples of all axes.
+
+    update() takes one sample at a time as deviation from rest in raw
+    counts, and does the same fixed amount of work for every sample:
+
+    - A hysteresis tracker per axis marks a peak when the axis goes over
+      peak_threshold, and a zero crossing when that peak has the opposite
+      sign of the axis' previous one. Ring buffers keep both counts over
+      the window.
+    - shake: SHAKE_CROSSINGS zero crossings on any axis within the window,
+      i.e. three alternating peaks (out, back, out) within 480 ms. An
+      ordinary hand shake at 2.5 Hz or faster fits, a flick and its stop
+      peak are only one crossing.
+    - flick: a single X peak, at most followed by the opposite peak of the
+      stop, reported once X has been quiet for FLICK_SETTLE samples
+      without a shake. Positive X is right.
+    - tilt-hold: the X or Y mean over the whole window is over
+      tilt_threshold and the samples are steady (spread under tilt_spread).
+      Reported once per tilt, axis and direction tell which way.
+
+    Each gesture comes with a confidence from 0.5 (barely over the limits)
+    to 1.0 and the time of the sample that completed it. After a gesture
+    nothing is reported for cooldown seconds.
+    """
+
+    WINDOW = 48  # samples, 480 ms at 100 Hz
+    SHAKE_CROSSINGS = 2  # direction changes of one axis within the window
+    FLICK_SETTLE = 15  # quiet samples after a flick's last X peak before it is reported
+
+    def __init__(self, peak_threshold, tilt_threshold, tilt_spread, cooldown=0.5):
+        """
+        Args:
+            peak_threshold: Deviation in counts that counts as a peak
+            tilt_threshold: Mean deviation in counts of X or Y that counts as tilted
+            tilt_spread: Largest standard deviation in counts while tilted
+            cooldown: Seconds after a gesture before the next one is reported
+        """
+        size = self.WINDOW
+        self.peak_threshold = peak_threshold
+        self.cooldown = cooldown
+        self._release = peak_threshold // 2
+
+        # Per sample: one bit per axis where a peak or a zero crossing started
+        self._peak_flags = bytearray(size)
+        self._crossing_flags = bytearray(size)
+        self.peaks = array.array("H", [0] * _AXES)
+        self.crossings = array.array("H", [0] * _AXES)
+        self._last_sign = array.array("b", [0] * _AXES)
+        self._in_peak = array.array("b", [0] * _AXES)
+        self._peak_max = array.array("H", [0] * _AXES)
+
+        # X and Y samples with their sums, for the tilt mean and spread
+        self._tilt = array.array("h", [0] * (2 * size))
+        self._tilt_total = [0, 0]
+        self._tilt_total_sq = [0, 0]
+        self._tilt_limit = size * tilt_threshold
+        spread = size * tilt_spread
+        self._spread_limit = spread * spread
+        self._tilted = False
+
+        self._pos = 0
+        self.count = 0
+        self._flick_age = -1
+        self._flick_sign = 0
+        self._flick_peak = 0
+        self._quiet_until = 0
+
+        # Last gesture
+        self.gesture = GESTURE_NONE
+        self.confidence = 0.0
+        self.timestamp = 0
+        self.axis = 0
+        self.direction = 0
+
+    def clear(self):
+        """Forget all samples, e.g. after recalibrating"""
+        size = self.WINDOW
+        for i in range(size):
+            self._peak_flags[i] = 0
+            self._crossing_flags[i] = 0
+        for i in range(2 * size):
+            self._tilt[i] = 0
+        for axis in range(_AXES):
+            self.peaks[axis] = 0
+            self.crossings[axis] = 0
+            self._last_sign[axis] = 0
+            self._in_peak[axis] = 0
+        for axis in range(2):
+            self._tilt_total[axis] = 0
+            self._tilt_total_sq[axis] = 0
+        self._tilted = False
+        self._pos = 0
+        self.count = 0
+        self._flick_age = -1
+
+    def update(self, x, y, z, now):
+        """
+        Add one sample (deviation from rest in counts) taken at now
+        Returns: GESTURE_* completed by this sample, GESTURE_NONE otherwise
+        """
+        size = self.WINDOW
+        pos = self._pos
+        full = self.count == size
+        if not full:
+            self.count += 1
+
+        # Drop the flags of the sample leaving the window
+        old_peaks = self._peak_flags[pos]
+        old_crossings = self._crossing_flags[pos]
+        peak_flags = 0
+        crossing_flags = 0
+        for axis in range(_AXES):
+            bit = 1 << axis
+            if old_peaks & bit:
+                self.peaks[axis] -= 1
+            if old_crossings & bit:
+                self.crossings[axis] -= 1
+
+            value = x if axis == 0 else y if axis == 1 else z
+            magnitude = value if value >= 0 else -value
+            if self._in_peak[axis]:
+                if magnitude < self._release:
+                    self._in_peak[axis] = 0
+                elif magnitude > self._peak_max[axis]:
+                    self._peak_max[axis] = magnitude
+            elif magnitude > self.peak_threshold:
+                sign = 1 if value > 0 else -1
+                peak_flags |= bit
+                self.peaks[axis] += 1
+                if self._last_sign[axis] == -sign:
+                    crossing_flags |= bit
+                    self.crossings[axis] += 1
+                self._last_sign[axis] = sign
+                self._in_peak[axis] = sign
+                self._peak_max[axis] = magnitude
+        self._peak_flags[pos] = peak_flags
+        self._crossing_flags[pos] = crossing_flags
+
+        # Tilt sums of X and Y
+        tilt = self._tilt
+        for axis in range(2):
+            value = x if axis == 0 else y
+            slot = pos * 2 + axis
+            if full:
+                old = tilt[slot]
+                self._tilt_total[axis] -= old
+                self._tilt_total_sq[axis] -= old * old
+            tilt[slot] = value
+            self._tilt_total[axis] += value
+            self._tilt_total_sq[axis] += value * value
+        self._pos = pos + 1 if pos + 1 < size else 0
+
+        gesture = self._classify(peak_flags)
+        if gesture == GESTURE_NONE or now < self._quiet_until:
+            return GESTURE_NONE
+        self.gesture = gesture
+        self.timestamp = now
+        self._quiet_until = now + self.cooldown
+        return gesture
+
+    def _strength(self, value, limit):
+        # 0.5 at the limit, 1.0 at twice the limit
+        return min(1.0, value / (2 * limit)) if limit else 1.0
+
+    def _classify(self, peak_flags):
+        # Shake
+        for axis in range(_AXES):
+            if self.crossings[axis] >= self.SHAKE_CROSSINGS:
+                self._flick_age = -1
+                self.axis = axis
+                self.direction = 0
+                self.confidence = self._strength(self._peak_max[axis], self.peak_threshold)
+                return GESTURE_SHAKE
+
+        # Flick: starts on the first X peak in the window ...
+        if self._flick_age < 0:
+            if peak_flags & 1 and self.peaks[_AXIS_X] == 1:
+                self._flick_age = 0
+                self._flick_sign = self._in_peak[_AXIS_X]
+                self._flick_peak = self._peak_max[_AXIS_X]
+        elif self._in_peak[_AXIS_X]:
+            # Samples are counted from the end of the last peak, so the
+            # next swing of a shake turns it into a shake first
+            self._flick_age = 0
+            if self._in_peak[_AXIS_X] == self._flick_sign:
+                self._flick_peak = self._peak_max[_AXIS_X]
+        else:
+            self._flick_age += 1
+            # ... and is reported once it has settled
+            if self._flick_age >= self.FLICK_SETTLE:
+                self._flick_age = -1
+                if self.crossings[_AXIS_X] <= 1:
+                    self.axis = _AXIS_X
+                    self.direction = self._flick_sign
+                    self.confidence = self._strength(self._flick_peak, self.peak_threshold)
+                    return GESTURE_FLICK_RIGHT if self._flick_sign > 0 else GESTURE_FLICK_LEFT
+
+        # Tilt-hold
+        if self.count < self.WINDOW:
+            return GESTURE_NONE
+        size = self.WINDOW
+        tilted = False
+        for axis in range(2):
+            total = self._tilt_total[axis]
+            magnitude = total if total >= 0 else -total
+            if magnitude > self._tilt_limit:
+                tilted = True
+                spread = self._tilt_total_sq[axis] * size - total * total
+                if not self._tilted and spread < self._spread_limit:
+                    self._tilted = True
+                    self.axis = axis
+                    self.direction = 1 if total > 0 else -1
+                    self.confidence = self._strength(magnitude, self._tilt_limit)
+                    return GESTURE_TILT_HOLD
+        if not tilted:
+            self._tilted = False
+        return GESTURE_NONE
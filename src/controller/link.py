@@ -0,0 +1,380 @@
+import time
+import array
+from protocol import (
+    Encoder, Decoder, opcode_name, payload_size,
+    PROTOCOL_VERSION, HEADER_SIZE, OP_INVALID, OP_HELLO,
+)
+
+# Per-frame results reported by FrameBatch
+RESULT_PENDING = 0
+RESULT_DONE = 1
+RESULT_IGNORED = 2
+RESULT_SUPERSEDED = 3
+RESULT_UNKNOWN = 4
+
+RESULT_NAMES = ("PENDING", "DONE", "IGNORED", "SUPERSEDED", "UNKNOWN")
+
+
+class RxRing:
+    """
+    Preallocated receive ring buffer.
+    Bytes stay in the ring until a whole frame has been decoded, so frames
+    split across UART reads are reassembled instead of dropped. Frames that
+    do not wrap around the end of the ring can be parsed in place in
+    buffer, starting at start (see contiguous()). Nothing here allocates.
+    """
+
+    def __init__(self, size=256):
+        # size must be a power of two
+        self.buffer = bytearray(size)
+        self._chunk = bytearray(size)
+        self._size = size
+        self._mask = size - 1
+        self.start = 0
+        self.count = 0
+
+    def free(self):
+        """Number of bytes that can still be stored"""
+        return self._size - self.count
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    def fill(self, uart, nbytes):
+        """Read up to nbytes from the UART into the ring"""
+        buf = self.buffer
+        chunk = self._chunk
+        mask = self._mask
+        total = 0
+        while nbytes > 0 and self.count < self._size:
+            # readinto() can't take an offset without slicing, go through
+            # the fixed chunk buffer instead
+            read = uart.readinto(chunk, min(nbytes, self._size - self.count)) or 0
+            if not read:
+                break
+            end = self.start + self.count
+            for i in range(read):
+                buf[(end + i) & mask] = chunk[i]
+            self.count += read
+            nbytes -= read
+            total += read
+        return total
+
+    def contiguous(self):
+        """Number of bytes from buffer[start] on that don't wrap around"""
+        return min(self.count, self._size - self.start)
+
+    def peek_into(self, dest, nbytes):
+        """Copy up to nbytes from the front of the ring into dest"""
+        nbytes = min(nbytes, self.count)
+        buf = self.buffer
+        start = self.start
+        mask = self._mask
+        for i in range(nbytes):
+            dest[i] = buf[(start + i) & mask]
+        return nbytes
+
+    def skip(self, nbytes):
+        """Drop nbytes from the front of the ring"""
+        nbytes = min(nbytes, self.count)
+        self.start = (self.start + nbytes) & self._mask
+        self.count -= nbytes
+
+
+class DuplicateFilter:
+    """
+    Remembers the last few sequence numbers received so a retransmitted
+    command is acknowledged again without being executed twice.
+    """
+
+    def __init__(self, size=16):
+        self._seen = bytearray(size)
+        self._pos = 0
+
+    def clear(self):
+        for i in range(len(self._seen)):
+            self._seen[i] = 0
+        self._pos = 0
+
+    def is_duplicate(self, seq):
+        """True if seq was already seen, otherwise remember it"""
+        if seq == 0:
+            return False
+        if seq in self._seen:
+            return True
+        self._seen[self._pos] = seq
+        self._pos = (self._pos + 1) % len(self._seen)
+        return False
+
+
+class FrameBatch:
+    """
+    Fixed-capacity table of the frames decoded in one loop iteration,
+    with a result slot per frame.
+    """
+
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self.count = 0
+        self.opcodes = array.array("B", bytes(capacity))
+        self.arg0 = array.array("l", [0] * capacity)
+        self.arg1 = array.array("l", [0] * capacity)
+        self.seqs = array.array("B", bytes(capacity))
+        self.results = array.array("B", bytes(capacity))
+
+    def add(self, opcode, arg0, arg1, seq=0):
+        i = self.count
+        self.opcodes[i] = opcode
+        self.arg0[i] = arg0
+        self.arg1[i] = arg1
+        self.seqs[i] = seq
+        self.results[i] = RESULT_PENDING
+        self.count = i + 1
+
+    def collapse(self, opcodes):
+        """
+        Latest wins: of all frames whose opcode is in opcodes, only the
+        newest stays pending, older ones are marked RESULT_SUPERSEDED.
+        Returns: number of frames superseded
+        """
+        newest = -1
+        superseded = 0
+        for i in range(self.count - 1, -1, -1):
+            if self.opcodes[i] in opcodes:
+                if newest < 0:
+                    newest = i
+                else:
+                    self.results[i] = RESULT_SUPERSEDED
+                    superseded += 1
+        return superseded
+
+
+class Link:
+    """
+    BLE UART link speaking the framed protocol, with text fallback.
+    This file is shared between the controller and Scrappy.
+
+    Usage:
+        link.poll()
+        while link.next_frame():
+            handle(link.opcode, link.arg0, link.arg1)
+
+    or, to look at everything received in one go:
+        link.poll()
+        for i in range(link.read_batch(batch)):
+            handle(batch.opcodes[i], batch.arg0[i], batch.arg1[i])
+
+    On the binary protocol, sent frames are coalesced in an output buffer
+    and written in MTU sized chunks by flush(), which the main loop calls
+    once per iteration. The buffer is also flushed when it is full or when
+    its oldest frame has waited FLUSH_DELAY. The text protocol is written
+    straight away, older firmware expects one message per write.
+
+    Binary frames are encoded straight into the output buffer and decoded
+    in place in the receive ring, so sending and receiving them allocates
+    nothing.
+    """
+
+    RX_BUFFER_SIZE = 256   # power of two
+    TX_BUFFER_SIZE = 128
+    MAX_LINE = 32          # longest text line or binary frame accepted
+    FLUSH_DELAY = 0.01     # seconds a queued frame may wait for company
+
+    def __init__(self, uart, mtu=20, verbose=False):
+        self.uart = uart
+        self.mtu = mtu
+        self.verbose = verbose
+        self.binary = False
+        self.encoder = Encoder()
+        self.decoder = Decoder()
+        self._rx = RxRing(self.RX_BUFFER_SIZE)
+        self._scratch = bytearray(self.MAX_LINE)
+
+        # Output buffer
+        self._tx = bytearray(self.TX_BUFFER_SIZE)
+        self._tx_len = 0
+        self._tx_frames = 0
+        self._tx_deadline = 0
+        # Every write goes through a staging buffer with one view per write
+        # length, so flush() never has to slice
+        self._chunk = bytearray(mtu)
+        chunk_view = memoryview(self._chunk)
+        self._chunk_views = [chunk_view[:size] for size in range(mtu + 1)]
+
+        # Output statistics
+        self.frames_sent = 0
+        self.writes = 0
+        self.max_frames_per_flush = 0
+
+    def reset(self):
+        """Go back to the text protocol and drop buffered input and output"""
+        self.binary = False
+        self._rx.clear()
+        self._tx_len = 0
+        self._tx_frames = 0
+
+    @property
+    def opcode(self):
+        return self.decoder.opcode
+
+    @property
+    def arg0(self):
+        return self.decoder.arg0
+
+    @property
+    def arg1(self):
+        return self.decoder.arg1
+
+    @property
+    def seq(self):
+        return self.decoder.seq
+
+    # ===== SENDING =====
+
+    def send(self, opcode, arg0=0, arg1=0, seq=0):
+        """
+        Send one frame using the negotiated protocol.
+        seq is only carried by the binary protocol.
+        Binary frames are queued until the next flush().
+        """
+        if self.verbose:
+            print(f"Sent: {opcode_name(opcode)}")
+        if not self.binary:
+            self.uart.write(self.encoder.encode_text(opcode, arg0, arg1))
+            self.frames_sent += 1
+            self.writes += 1
+            return
+
+        size = HEADER_SIZE + (payload_size(opcode) or 0)
+        if self._tx_len:
+            if self._tx_len + size > self.TX_BUFFER_SIZE or time.monotonic() >= self._tx_deadline:
+                self.flush()
+        if not self._tx_len:
+            self._tx_deadline = time.monotonic() + self.FLUSH_DELAY
+        self._tx_len = self.encoder.encode_into(self._tx, self._tx_len, opcode, arg0, arg1, seq)
+        self._tx_frames += 1
+
+    def pending(self):
+        """Number of bytes waiting in the output buffer"""
+        return self._tx_len
+
+    def flush(self):
+        """Write all queued frames in as few MTU sized writes as possible"""
+        length = self._tx_len
+        if not length:
+            return
+        tx = self._tx
+        staging = self._chunk
+        pos = 0
+        writes = 0
+        while pos < length:
+            chunk = min(self.mtu, length - pos)
+            for i in range(chunk):
+                staging[i] = tx[pos + i]
+            self.uart.write(self._chunk_views[chunk])
+            pos += chunk
+            writes += 1
+        self.writes += writes
+        self.frames_sent += self._tx_frames
+        if self._tx_frames > self.max_frames_per_flush:
+            self.max_frames_per_flush = self._tx_frames
+        self._tx_len = 0
+        self._tx_frames = 0
+
+    def frames_per_write(self):
+        """Average number of frames carried by one UART write"""
+        if not self.writes:
+            return 0.0
+        return self.frames_sent / self.writes
+
+    # ===== RECEIVING =====
+
+    def poll(self):
+        """Move whatever is waiting on the UART into the receive ring"""
+        waiting = self.uart.in_waiting
+        if waiting:
+            self._rx.fill(self.uart, waiting)
+
+    def next_frame(self):
+        """
+        Decode the next complete frame from the receive ring
+        Returns: True if a frame is available as opcode/arg0/arg1.
+        Unknown text messages are returned with opcode OP_INVALID, corrupt
+        binary bytes are skipped. A partial frame stays buffered until the
+        rest of it arrives.
+        """
+        rx = self._rx
+        while rx.count:
+            available = min(rx.count, self.MAX_LINE)
+            if rx.contiguous() >= available:
+                # Parse in place in the ring
+                data = rx.buffer
+                start = rx.start
+            else:
+                # The frame wraps around the end of the ring, parse a copy
+                data = self._scratch
+                start = 0
+                rx.peek_into(data, available)
+            used = self.decoder.parse(data, start, start + available)
+            if used == 0:
+                if available < self.MAX_LINE:
+                    return False
+                # Too long to ever be a valid frame, drop a byte and resync
+                used = 1
+            rx.skip(used)
+            if self.decoder.opcode != OP_INVALID or not self.decoder.binary:
+                return True
+        return False
+
+    def read_batch(self, batch):
+        """
+        Decode every complete frame (up to the batch capacity) into batch
+        Returns: number of frames read
+        """
+        batch.count = 0
+        while batch.count < batch.capacity and self.next_frame():
+            decoder = self.decoder
+            batch.add(decoder.opcode, decoder.arg0, decoder.arg1, decoder.seq)
+        return batch.count
+
+    def discard_input(self):
+        """Drop everything buffered or waiting on the UART"""
+        self._rx.clear()
+        while self.uart.in_waiting:
+            self.uart.read(self.uart.in_waiting)
+
+    # ===== NEGOTIATION =====
+
+    def negotiate(self, timeout=1.0):
+        """
+        Offer the binary protocol (controller side).
+        Older firmware answers HELLO with a plain ACK, in which case the
+        link stays on the text protocol.
+        Returns: True if the binary protocol was agreed
+        """
+        self.reset()
+        self.send(OP_HELLO, PROTOCOL_VERSION)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.poll()
+            while self.next_frame():
+                if self.opcode == OP_HELLO and self.decoder.binary and self.arg0 == PROTOCOL_VERSION:
+                    self.binary = True
+                    print(f"Binary protocol v{self.arg0}")
+                    return True
+                print("Peer only speaks the text protocol")
+                return False
+            time.sleep(0.01)
+        print("No HELLO reply, using text protocol")
+        return False
+
+    def accept_hello(self, version):
+        """
+        Answer a HELLO (Scrappy side) and switch to the binary protocol.
+        Peers with another binary frame layout stay on the text protocol.
+        """
+        if version == PROTOCOL_VERSION:
+            self.binary = True
+            self.send(OP_HELLO, PROTOCOL_VERSION)
+            self.flush()
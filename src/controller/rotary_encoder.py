@@ -28,20 +28,16 @@ class RotaryEncoder:
         self._b.switch_to_input(pull=pull)
         self._debounce_ms = max(1, int(debounce_ms))
         self._pulses_per_detent = max(1, int(pulses_per_detent))
-        self._last_raw = (self._a.value, self._b.value)
-        self._last_stable = self._last_raw
+        # Pin states are kept packed as (A << 1) | B, update() allocates nothing
+        self._last_raw = self._read_raw()
+        self._last_q = self._last_raw
         self._last_change_time = time.monotonic() * 1000.0 
-        self._last_q = (1 if self._last_stable[0] else 0) << 1 | (1 if self._last_stable[1] else 0)
         self._position_raw = 0
         self._position = 0
         self._delta_accum = 0
     
-    @staticmethod
-    def _pack(state):
-        return (1 if state[0] else 0) << 1 | (1 if state[1] else 0)
-    
     def _read_raw(self):
-        return (self._a.value, self._b.value)
+        return (2 if self._a.value else 0) | (1 if self._b.value else 0)
     
     def update(self):
         now = time.monotonic() * 1000.0
@@ -50,10 +46,9 @@ class RotaryEncoder:
             self._last_raw = raw
             self._last_change_time = now
             return False
-        if raw != self._last_stable and (now - self._last_change_time) >= self._debounce_ms:
+        if raw != self._last_q and (now - self._last_change_time) >= self._debounce_ms:
             prev_q = self._last_q
-            self._last_stable = raw
-            curr_q = self._pack(raw)
+            curr_q = raw
             self._last_q = curr_q
             key = (prev_q << 2) | curr_q
             move = self._TRANSITIONS.get(key, 0)
@@ -0,0 +1,111 @@
+import time
+
+NEVER = float("inf")
+
+
+class Scheduler:
+    """
+    Deadline-driven (tickless) scheduler for a polling loop.
+
+    Every activity is registered as a task with a period. The loop asks
+    due(task, now) before running an activity, and at the end of each
+    iteration calls sleep(), which sleeps exactly until the earliest
+    deadline instead of a fixed tick.
+
+    Tasks with period 0 are one-shot: they run once at the deadline given
+    to set_deadline() and then wait for the next one.
+
+    How late each task ran compared to its deadline is kept per task, see
+    print_stats().
+    """
+
+    def __init__(self, max_sleep=0.1):
+        """
+        Args:
+            max_sleep: Longest single sleep in seconds, so the caller still
+                       gets to feed the watchdog (default 0.1)
+        """
+        self.max_sleep = max_sleep
+        self.names = []
+        self.periods = []
+        self.deadlines = []
+
+        # Statistics
+        self.runs = []
+        self.max_late = []
+        self.total_late = []
+        self.sleeps = 0
+        self.slept = 0.0
+
+    def add(self, name, period):
+        """
+        Register a task. A periodic task is due immediately, a one-shot
+        task waits for set_deadline()
+        Returns: the task id
+        """
+        self.names.append(name)
+        self.periods.append(period)
+        self.deadlines.append(0.0 if period else NEVER)
+        self.runs.append(0)
+        self.max_late.append(0.0)
+        self.total_late.append(0.0)
+        return len(self.names) - 1
+
+    def start(self, now=None):
+        """Make every periodic task due now, one-shot tasks wait for set_deadline()"""
+        if now is None:
+            now = time.monotonic()
+        for task in range(len(self.deadlines)):
+            self.deadlines[task] = now if self.periods[task] else NEVER
+
+    def set_deadline(self, task, deadline):
+        """Run a task at an absolute time (NEVER to park it)"""
+        self.deadlines[task] = deadline
+
+    def due(self, task, now):
+        """
+        True if the task's deadline has passed, the next deadline is
+        scheduled right away. Missed periods are skipped, not run back to back.
+        """
+        deadline = self.deadlines[task]
+        if now < deadline:
+            return False
+        late = now - deadline
+        self.runs[task] += 1
+        self.total_late[task] += late
+        if late > self.max_late[task]:
+            self.max_late[task] = late
+
+        period = self.periods[task]
+        if period:
+            deadline += period
+            if deadline <= now:
+                deadline = now + period
+        else:
+            deadline = NEVER
+        self.deadlines[task] = deadline
+        return True
+
+    def next_deadline(self):
+        """Earliest deadline of all tasks"""
+        return min(self.deadlines)
+
+    def sleep(self):
+        """Sleep until the earliest deadline, at most max_sleep"""
+        delay = self.next_deadline() - time.monotonic()
+        if delay <= 0:
+            return
+        if delay > self.max_sleep:
+            delay = self.max_sleep
+        time.sleep(delay)
+        self.sleeps += 1
+        self.slept += delay
+
+    def print_stats(self):
+        """Print how late every task ran compared to its deadline"""
+        for task in range(len(self.names)):
+            runs = self.runs[task]
+            if runs:
+                mean = self.total_late[task] / runs * 1000
+                print(f"{self.names[task]}: {runs} runs, late mean {mean:.1f}ms max {self.max_late[task] * 1000:.1f}ms")
+        print(f"Slept {self.slept:.1f}s in {self.sleeps} sleeps")
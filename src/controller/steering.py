@@ -0,0 +1,92 @@
+from protocol import (
+    OP_STEER, OP_STEER_DELTA, STEER_DELTA_MIN, STEER_DELTA_MAX, pack_steer_delta,
+)
+
+
+class SteeringStream:
+    """
+    Tilt steering for manual mode.
+
+    send() maps the controller's tilt to (left, right) wheel speeds, tilting
+    forward drives and tilting sideways turns, and streams them as
+    fire-and-forget frames at whatever fixed rate it is called. Most frames
+    are a one-byte STEER_DELTA; a full STEER frame goes out every
+    KEY_INTERVAL calls, when a change is too big for a delta and after
+    restart(), so Scrappy resyncs quickly after a lost frame. Nothing is sent
+    while the speeds don't change, the periodic STEER keeps the stream alive.
+    """
+
+    MAX_SPEED = 100       # % at full tilt
+    DEAD_ZONE = 0.15      # fraction of full tilt that still counts as level
+    KEY_INTERVAL = 5      # calls between full STEER frames
+    SMOOTHING = 2         # tilt filter, each sample moves it 1/2^SMOOTHING of the way
+    THROTTLE_SIGN = -1    # tilting away from the player (negative Y) drives forward
+    TURN_SIGN = 1         # tilting right (positive X) turns right
+
+    def __init__(self, full_tilt):
+        """
+        Args:
+            full_tilt: Tilt in raw accelerometer counts that gives full speed
+        """
+        self._dead_zone = int(full_tilt * self.DEAD_ZONE)
+        self._span = max(1, full_tilt - self._dead_zone)
+        self.left = 0
+        self.right = 0
+
+        # Statistics
+        self.key_frames = 0
+        self.delta_frames = 0
+        self.skipped = 0
+        self.restart()
+
+    def restart(self):
+        """Start a new stream, the next frame is a full STEER"""
+        self._tilt_x = 0
+        self._tilt_y = 0
+        self._sent_left = 0
+        self._sent_right = 0
+        self._counter = 0
+        self._since_key = self.KEY_INTERVAL
+
+    def _speed(self, tilt):
+        dead = self._dead_zone
+        if -dead <= tilt <= dead:
+            return 0
+        tilt = tilt - dead if tilt > 0 else tilt + dead
+        speed = tilt * self.MAX_SPEED // self._span
+        return max(-self.MAX_SPEED, min(self.MAX_SPEED, speed))
+
+    def mix(self, tilt_x, tilt_y):
+        """Filter a tilt sample (counts from rest) and update left and right"""
+        self._tilt_x += (tilt_x - self._tilt_x) >> self.SMOOTHING
+        self._tilt_y += (tilt_y - self._tilt_y) >> self.SMOOTHING
+        throttle = self.THROTTLE_SIGN * self._speed(self._tilt_y)
+        turn = self.TURN_SIGN * self._speed(self._tilt_x)
+        limit = self.MAX_SPEED
+        self.left = max(-limit, min(limit, throttle + turn))
+        self.right = max(-limit, min(limit, throttle - turn))
+
+    def send(self, channel, tilt_x, tilt_y):
+        """Mix a tilt sample and send the next frame of the stream"""
+        self.mix(tilt_x, tilt_y)
+        left = self.left
+        right = self.right
+        delta_left = left - self._sent_left
+        delta_right = right - self._sent_right
+        self._since_key += 1
+        if (self._since_key >= self.KEY_INTERVAL
+                or not STEER_DELTA_MIN <= delta_left <= STEER_DELTA_MAX
+                or not STEER_DELTA_MIN <= delta_right <= STEER_DELTA_MAX):
+            channel.send_unacked(OP_STEER, left, right)
+            self._counter = 0
+            self._since_key = 0
+            self.key_frames += 1
+        elif delta_left == 0 and delta_right == 0:
+            self.skipped += 1
+            return
+        else:
+            self._counter = (self._counter + 1) & 0xFF
+            channel.send_unacked(OP_STEER_DELTA, self._counter, pack_steer_delta(delta_left, delta_right))
+            self.delta_frames += 1
+        self._sent_left = left
+        self._sent_right = right
@@ -1,63 +1,159 @@
 import board
 import time
-import adafruit_adxl34x
 import math
+import array
+from adxl345 import ADXL345, FIFO_BYPASS, FIFO_STREAM, FIFO_SIZE, INT_ACTIVITY, INT_FREE_FALL
+from motion import MotionEstimator
+from calibration import Calibration
+
+class RunningWindow:
+    """
+    Sum and sum of squares of the last `size` integer samples, kept in a
+    ring buffer and updated in O(1) per sample
+    """
+    
+    def __init__(self, size):
+        self.size = size
+        self._values = array.array("h", [0] * size)
+        self.clear()
+    
+    def clear(self):
+        self._pos = 0
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+    
+    def add(self, value):
+        """Add a sample, dropping the oldest once the window is full"""
+        pos = self._pos
+        if self.count == self.size:
+            old = self._values[pos]
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.count += 1
+        self._values[pos] = value
+        self.total += value
+        self.total_sq += value * value
+        self._pos = pos + 1 if pos + 1 < self.size else 0
+    
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+    
+    def variance(self):
+        if not self.count:
+            return 0.0
+        mean = self.total / self.count
+        return max(0.0, self.total_sq / self.count - mean * mean)
 
 class AccelerometerMonitor:
-    """Class to handle accelerometer-based impact detection"""
+    """
+    Class to handle accelerometer-based impact detection
+    
+    The sensor runs its FIFO in stream mode and check_impact() drains it in
+    one burst, so no sample is lost while the loop is busy elsewhere (up to
+    FIFO_SIZE samples, 320ms at 100 Hz). Every sample feeds a window of
+    SUSTAINED_IMPACT_TIME. A fall is a sustained tilt: the window's mean Z
+    deviation is over TILT_FALL_THRESHOLD (Scrappy lying on its side reads
+    about 9.8 m/s^2, upside down about 19.6) and the samples are steady.
+    Bumps and knocks while driving, however hard, are over within a few
+    samples and never hold the window there.
+    
+    With the sensor's INT1 line wired to int_pin, the sensor's own engines
+    do the watching: free fall kills the robot straight away, and the FIFO
+    is only read for ACTIVITY_HOLD after an activity interrupt. While the
+    robot sits still the I2C bus is not touched at all.
+    
+    With track_motion every sample also feeds a MotionEstimator (motion),
+    which then needs every sample and keeps the FIFO drained even between
+    activity interrupts.
+    """
     
     # thresholds for fall detection
-    Z_AXIS_FALL_THRESHOLD = 12  # Z-axis deviation when tipping over
+    TILT_FALL_THRESHOLD = 6.5  # m/s^2 mean Z deviation over the window, tipped about 70 degrees
     SUSTAINED_IMPACT_TIME = 0.1  # Impact must last this long (100ms)
+    TILT_MAX_DEVIATION = 6  # m/s^2 standard deviation, more is shaking rather than lying tipped
+    
+    # interrupt mode
+    FREE_FALL_THRESHOLD = 4.0  # m/s^2 on all axes counts as falling
+    FREE_FALL_TIME = 0.15  # seconds of free fall before it is reported
+    ACTIVITY_THRESHOLD = 3.0  # m/s^2 change from rest that wakes the fall detector
+    ACTIVITY_HOLD = 1.0  # seconds the FIFO is checked after an activity interrupt
+    
+    # motion estimation
+    MOTION_AXIS = 1  # sensor axis pointing forward (0=X, 1=Y)
+    MOTION_SIGN = 1  # -1 if the sensor axis points backward
     
-    def __init__(self):
-        """Initialize the accelerometer monitor"""
+    def __init__(self, int_pin=None, track_motion=False):
+        """
+        Initialize the accelerometer monitor
+        
+        Args:
+            int_pin: Board pin wired to the ADXL345 INT1 line, None to poll over I2C
+            track_motion: Feed the samples to a MotionEstimator as well
+        """
         # Initialize I2C and accelerometer
         i2c = board.I2C()
-        self.accelerometer = adafruit_adxl34x.ADXL345(i2c)
+        self.sensor = ADXL345(i2c)
+        self.calibration = Calibration(self.sensor)
+        self.use_interrupts = int_pin is not None
+        if self.use_interrupts:
+            self.sensor.attach_interrupt(int_pin)
+        self._active_until = 0
+        self._samples = array.array("h", [0] * (3 * FIFO_SIZE))
+        size = max(1, round(self.SUSTAINED_IMPACT_TIME * self.sensor.sample_rate))
+        self.window = RunningWindow(size)
+        # Window limits in counts: |sum| over size * threshold, size^2 * variance under the limit
+        self._fall_total = size * self.sensor.to_counts(self.TILT_FALL_THRESHOLD)
+        max_spread = size * self.sensor.to_counts(self.TILT_MAX_DEVIATION)
+        self._max_spread = max_spread * max_spread
+        self.sensor.set_fifo_mode(FIFO_STREAM)
+        self.motion = None
+        if track_motion:
+            self.motion = MotionEstimator(self.sensor.scale, self.sensor.sample_rate)
         
-        # Calibration offsets
+        # Calibration offsets in m/s^2, and in raw counts for the hot path
         self.offset_x = 0.0
         self.offset_y = 0.0
         self.offset_z = 0.0
+        self._offset_x = 0
+        self._offset_y = 0
+        self._offset_z = 0
         
         # Robot state
         self._is_alive = True
         self.last_magnitude = 0.0
         
-        # Fall detection
-        self.impact_start_time = None
-        
         print("AccelerometerMonitor initialized")
     
     def calibrate(self, samples=50):
         """
         Perform zero offset calibration
-        Robot should be stationary during calibration
+        Robot should be stationary during calibration. Offsets stored by an
+        earlier boot are only checked, which takes a fraction of a second.
         """
         print("Starting accelerometer calibration...")
         print("Keep robot stationary!")
-        time.sleep(1)
-        
-        sum_x = 0.0
-        sum_y = 0.0
-        sum_z = 0.0
+        # Read live samples, not what is queued in the FIFO
+        self.sensor.set_fifo_mode(FIFO_BYPASS)
         
-        for i in range(samples):
-            x, y, z = self.accelerometer.acceleration
-            sum_x += x
-            sum_y += y
-            sum_z += z
-            time.sleep(0.02)  # 20ms between samples
-            
-            if i % 10 == 0:
-                print(f"Calibrating... {i}/{samples}")
-        
-        # Calculate average offsets
-        self.offset_x = sum_x / samples
-        self.offset_y = sum_y / samples
-        self.offset_z = (sum_z / samples)
+        sensor = self.sensor
+        calibration = self.calibration
+        calibration.run(samples, 0.02, settle=1)
+        self._offset_x = calibration.x
+        self._offset_y = calibration.y
+        self._offset_z = calibration.z
+        self.offset_x = self._offset_x * sensor.scale
+        self.offset_y = self._offset_y * sensor.scale
+        self.offset_z = self._offset_z * sensor.scale
         
+        self.sensor.set_fifo_mode(FIFO_STREAM)
+        self.window.clear()
+        if self.use_interrupts:
+            # The robot is at rest, the activity reference is taken now
+            self.sensor.enable_free_fall(self.FREE_FALL_THRESHOLD, self.FREE_FALL_TIME)
+            self.sensor.enable_activity(self.ACTIVITY_THRESHOLD)
+            self.sensor.interrupt_source()
         print(f"Calibration complete!")
         print(f"Offsets: X={self.offset_x:.2f}, Y={self.offset_y:.2f}, Z={self.offset_z:.2f}")
     
@@ -66,11 +162,12 @@ class AccelerometerMonitor:
         Get calibrated acceleration values
         Returns: (x, y, z) in m/s^2
         """
-        x, y, z = self.accelerometer.acceleration
+        sensor = self.sensor
+        sensor.read()
         return (
-            x - self.offset_x,
-            y - self.offset_y,
-            z - self.offset_z
+            (sensor.x - self._offset_x) * sensor.scale,
+            (sensor.y - self._offset_y) * sensor.scale,
+            (sensor.z - self._offset_z) * sensor.scale
         )
     
     def calculate_magnitude(self, x, y, z):
@@ -82,17 +179,55 @@ class AccelerometerMonitor:
     
     def check_impact(self):
         """
-        Read accelerometer and check for fall/impact
+        Drain the FIFO and check every sample for a fall
         Returns: True if impact detected, False otherwise
-        """        
-        # Get calibrated readings (already has gravity removed)
-        x, y, z = self.get_calibrated_acceleration()
+        """
+        sensor = self.sensor
+        if self.use_interrupts:
+            now = time.monotonic()
+            if sensor.interrupt_pending():
+                source = sensor.interrupt_source()
+                if source & INT_FREE_FALL:
+                    print("Free fall detected!")
+                    return True
+                if source & INT_ACTIVITY:
+                    self._active_until = now + self.ACTIVITY_HOLD
+            if now >= self._active_until and self.motion is None:
+                # At rest, the FIFO keeps the latest samples for the next activity
+                return False
+        
+        samples = self._samples
+        count = sensor.read_fifo(samples, FIFO_SIZE)
+        window = self.window
+        offset = self._offset_z
+        motion = self.motion
+        if motion is not None:
+            axis = self.MOTION_AXIS
+            motion_offset = self._offset_y if axis else self._offset_x
+            sign = self.MOTION_SIGN
         
-        # Check for fall: Z-axis changes significantly from 0
-        is_tipped = abs(z) > self.Z_AXIS_FALL_THRESHOLD
-        if is_tipped:
-            print(f"Z magnitiude: {str(abs(z))}")
-        return is_tipped
+        for i in range(count):
+            if motion is not None:
+                motion.update(sign * (samples[i * 3 + axis] - motion_offset))
+            # Calibrated Z in raw counts (gravity removed)
+            z = samples[i * 3 + 2] - offset
+            window.add(z)
+            if window.count < window.size:
+                continue
+            
+            # Check for fall: Z-axis mean changes significantly from 0 ...
+            total = window.total
+            if abs(total) <= self._fall_total:
+                continue
+            
+            # ... and stays there, rather than bouncing around it
+            spread = window.total_sq * window.size - total * total
+            if spread < self._max_spread:
+                scale = sensor.scale
+                print(f"Z magnitiude: {abs(window.mean()) * scale:.2f}, "
+                      f"deviation {math.sqrt(window.variance()) * scale:.2f} over {window.size} samples")
+                return True
+        return False
     
     def is_alive(self):
         """Returns the current alive status"""
@@ -101,7 +236,15 @@ class AccelerometerMonitor:
     def reset(self):
         """Reset robot to alive state"""
         self._is_alive = True
-        self.impact_start_time = None
+        # Forget samples and interrupts from before the reset
+        self.sensor.read_fifo(self._samples, FIFO_SIZE)
+        self.window.clear()
+        if self.use_interrupts:
+            self.sensor.interrupt_source()
+            self._active_until = 0
+        if self.motion is not None:
+            # Scrappy is put back in the middle of the table
+            self.motion.reset()
         print("Accelerometer status reset - Robot is ALIVE")
     
     def get_status(self):
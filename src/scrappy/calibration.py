@@ -0,0 +1,182 @@
+import time
+from protocol import crc8
+
+try:
+    import microcontroller
+except ImportError:
+    # Running on a host, offsets only live as long as the process
+    microcontroller = None
+
+# This file is shared between the controller and Scrappy.
+
+
+class Welford:
+    """Running mean and variance of one value (Welford's method)"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def variance(self):
+        return self._m2 / self.count if self.count else 0.0
+
+
+class Calibration:
+    """
+    Zero-offset calibration of an ADXL345, kept in non-volatile memory.
+
+    measure() samples the resting sensor with a Welford accumulator per
+    axis and rejects the result if any axis spread more than MAX_DEVIATION,
+    i.e. the device moved. Accepted offsets are saved with a CRC so later
+    boots only take CHECK_SAMPLES quick samples to confirm them (run()).
+
+    Persistent memory layout (microcontroller.nvm, not alarm.sleep_memory
+    which the StallMonitor uses):
+        [0] MAGIC
+        [1] sensor format (range and resolution the offsets were taken at)
+        [2...7] x, y, z offsets in counts, signed 16-bit little endian
+        [8] CRC-8 over [0...7]
+    """
+
+    MAGIC = 0xCA
+    MEMORY_SIZE = 9
+    MAX_DEVIATION = 0.5   # m/s^2 standard deviation on any axis, more means the device moved
+    TOLERANCE = 0.6       # m/s^2 the stored offsets may be off before recalibrating
+    CHECK_SAMPLES = 8     # samples taken to confirm stored offsets
+    CHECK_INTERVAL = 0.01  # seconds between them
+    ATTEMPTS = 3          # full calibrations tried before giving up
+
+    def __init__(self, sensor, memory=None, offset=0):
+        """
+        Args:
+            sensor: ADXL345 to calibrate, read in bypass mode
+            memory: Persistent byte buffer (default microcontroller.nvm)
+            offset: Where the record starts in memory (default 0)
+        """
+        self.sensor = sensor
+        if memory is None:
+            memory = microcontroller.nvm if microcontroller else bytearray(offset + self.MEMORY_SIZE)
+        self._mem = memory
+        self._offset = offset
+        self._record = bytearray(self.MEMORY_SIZE)
+        self._axes = (Welford(), Welford(), Welford())
+        self._max_variance = sensor.to_counts(self.MAX_DEVIATION) ** 2
+        self._tolerance = sensor.to_counts(self.TOLERANCE)
+
+        # Offsets in raw counts
+        self.x = 0
+        self.y = 0
+        self.z = 0
+        self.from_memory = False
+
+    def _format(self):
+        sensor = self.sensor
+        return sensor.g_range | (0x04 if sensor.full_resolution else 0)
+
+    def load(self):
+        """
+        Read the stored offsets
+        Returns: True if a valid record for the current sensor format was found
+        """
+        record = self._record
+        start = self._offset
+        record[:] = self._mem[start:start + self.MEMORY_SIZE]
+        if record[0] != self.MAGIC or record[1] != self._format():
+            return False
+        if crc8(record, 0, self.MEMORY_SIZE - 1) != record[self.MEMORY_SIZE - 1]:
+            return False
+        values = [0, 0, 0]
+        for axis in range(3):
+            value = record[2 + axis * 2] | (record[3 + axis * 2] << 8)
+            values[axis] = value - 0x10000 if value & 0x8000 else value
+        self.x, self.y, self.z = values
+        return True
+
+    def save(self):
+        """Store the offsets, the write is skipped if nothing changed"""
+        record = self._record
+        record[0] = self.MAGIC
+        record[1] = self._format()
+        for axis, value in enumerate((self.x, self.y, self.z)):
+            record[2 + axis * 2] = value & 0xFF
+            record[3 + axis * 2] = (value >> 8) & 0xFF
+        record[self.MEMORY_SIZE - 1] = crc8(record, 0, self.MEMORY_SIZE - 1)
+        start = self._offset
+        if self._mem[start:start + self.MEMORY_SIZE] != record:
+            self._mem[start:start + self.MEMORY_SIZE] = record
+
+    def _sample(self, samples, interval):
+        sensor = self.sensor
+        x, y, z = self._axes
+        x.reset()
+        y.reset()
+        z.reset()
+        for _ in range(samples):
+            sensor.read()
+            x.add(sensor.x)
+            y.add(sensor.y)
+            z.add(sensor.z)
+            time.sleep(interval)
+
+    def _steady(self):
+        for axis in self._axes:
+            if axis.variance() > self._max_variance:
+                return False
+        return True
+
+    def measure(self, samples=50, interval=0.02):
+        """
+        Calibrate from scratch, the device must be at rest
+        Returns: True if it stayed still, the offsets are set either way
+        """
+        self._sample(samples, interval)
+        x, y, z = self._axes
+        self.x = round(x.mean)
+        self.y = round(y.mean)
+        self.z = round(z.mean)
+        return self._steady()
+
+    def verify(self):
+        """
+        Take a few samples and compare them with the loaded offsets
+        Returns: True if the device is at rest where it was calibrated
+        """
+        self._sample(self.CHECK_SAMPLES, self.CHECK_INTERVAL)
+        if not self._steady():
+            return False
+        tolerance = self._tolerance
+        x, y, z = self._axes
+        return (abs(x.mean - self.x) <= tolerance and abs(y.mean - self.y) <= tolerance
+                and abs(z.mean - self.z) <= tolerance)
+
+    def run(self, samples=50, interval=0.02, settle=0):
+        """
+        Use the stored offsets if a quick check confirms them, otherwise
+        wait settle seconds and calibrate from scratch (and store the result)
+        Returns: True if the offsets can be trusted
+        """
+        start = time.monotonic()
+        self.from_memory = self.load() and self.verify()
+        if self.from_memory:
+            print(f"Stored calibration confirmed in {time.monotonic() - start:.2f}s")
+            return True
+
+        time.sleep(settle)
+        for attempt in range(self.ATTEMPTS):
+            if self.measure(samples, interval):
+                self.save()
+                print(f"Calibrated and stored in {time.monotonic() - start:.2f}s")
+                return True
+            print(f"Moved during calibration ({attempt + 1}/{self.ATTEMPTS})")
+        print("Calibration not stored, device never stayed still")
+        return False
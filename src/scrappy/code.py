@@ -1,179 +1,479 @@
 import time
+import asyncio
 from adafruit_ble import BLERadio
 from adafruit_ble.advertising.standard import ProvideServicesAdvertisement
 from adafruit_ble.services.nordic import UARTService
 import motor
 from movement_patterns import MovementController
 from accelerometer import AccelerometerMonitor
+from heartbeat import Failsafe
+from watchdog_monitor import StallMonitor
+from memory_manager import MemoryManager
+from steering_receiver import SteeringReceiver
+from link import (
+    Link, FrameBatch, DuplicateFilter, RESULT_NAMES,
+    RESULT_DONE, RESULT_IGNORED, RESULT_SUPERSEDED, RESULT_UNKNOWN,
+)
+from protocol import (
+    opcode_name, DIFFICULTIES,
+    OP_HELLO, OP_ACK, OP_LEVEL, OP_MANUAL, OP_STOP, OP_SESSION,
+    OP_UP, OP_DOWN, OP_LEFT, OP_RIGHT, OP_STEER, OP_STEER_DELTA, OP_DEAD,
+    OP_MODE, OP_MANUAL_END, OP_LEVEL_START, OP_PING, OP_PONG, OP_FAILSAFE, OP_DANGER,
+    SESSION_ACKLESS_MOVES, SESSION_STATE_EVENTS,
+    MODE_WAITING, MODE_AUTO, MODE_MANUAL, MODE_DEAD,
+)
 
 ble = BLERadio()
 uart = UARTService()
 advertisement = ProvideServicesAdvertisement(uart)
+link = Link(uart)
+batch = FrameBatch()
+duplicates = DuplicateFilter()
+# At least 200 ms, a heartbeat interval plus 100 ms of controller loop latency
+# (display refresh, scheduler sleep) before the controller has measured it
+failsafe = Failsafe(missed=3, min_timeout=0.2, max_timeout=0.5)
+
+# Watchdog regions, each id is an index into WATCHDOG_REGIONS
+REGION_CONNECT = 0
+REGION_MOTOR = 1
+REGION_IMPACT = 2
+REGION_LINK = 3
+REGION_MOVEMENT = 4
+WATCHDOG_REGIONS = ("connect", "motor", "impact", "link", "movement")
+WAIT_REGIONS = (REGION_CONNECT,)  # advertising waits for the controller, not a stall
+ENABLE_WATCHDOG = True
+WATCHDOG_TIMEOUT = 8.0  # seconds
+PROFILE_ALLOCATIONS = False  # count heap allocations per region, printed on disconnect
+
+monitor = StallMonitor(WATCHDOG_REGIONS, timeout=WATCHDOG_TIMEOUT,
+                       track_allocations=PROFILE_ALLOCATIONS, waits=WAIT_REGIONS)
+monitor.report()
+
+# Automatic GC is held off while Scrappy moves, collections run in pauses
+MEMORY_FLOOR = 16384  # bytes free below which GC runs anyway
+GC_MIN_PAUSE = 0.05  # seconds, shorter auto-mode pauses are not used for GC
+memory = MemoryManager(floor=MEMORY_FLOOR)
 
 # Initialize controllers
+ACCEL_INT_PIN = None  # board pin wired to the ADXL345 INT1 (e.g. board.A3), None polls over I2C
 movement = MovementController()
-accel = AccelerometerMonitor()
+accel = AccelerometerMonitor(int_pin=ACCEL_INT_PIN, track_motion=True)
 
 # Configuration
 MANUAL_MOVE_DURATION = 0.2  # seconds for individual moves
 MANUAL_MODE_DURATION = 5.0  # seconds for full manual control mode
 BASE_SPEED = 60
+STEER_TIMEOUT = 0.5  # seconds without a steering frame before the wheels stop, the controller sends one every 200 ms
+DANGER_TIME = 500  # ms to the table edge at which the controller is warned
+SCHEDULE_SEED = None  # auto-move seed, None for new moves every level, a number replays a logged run
+LOG_FRAMES = False  # print every received command and move, each line costs an allocation and a serial write
+
+motor.verbose = LOG_FRAMES
+movement.verbose = LOG_FRAMES
+
+# Task periods (seconds), each task runs at its own rate
+LINK_PERIOD = 0.005     # BLE receive, dispatch and flush
+IMPACT_PERIOD = 0.05    # fall detection, drains ~5 buffered accelerometer samples
+MOTOR_PERIOD = 0.005    # motor ramp stepping
+AUTO_PERIOD = 0.02      # auto-mode scheduler and manual-mode expiry
+WATCHDOG_PERIOD = 1.0   # watchdog feed, only runs if no task hogs the CPU
+
+# Only the newest of these runs when several arrive in one read
+MOVEMENT_OPCODES = (OP_UP, OP_DOWN, OP_LEFT, OP_RIGHT)
+
+# Frames that are answered by their handler or streamed, never ACKed
+UNACKED_OPCODES = (OP_HELLO, OP_PING, OP_STEER, OP_STEER_DELTA)
+
+# Session flags this firmware supports
+SUPPORTED_SESSION_FLAGS = SESSION_ACKLESS_MOVES | SESSION_STATE_EVENTS
 
-def send_response(message):
+# Protocol mode reported for each state
+STATE_MODES = {
+    "WAITING": MODE_WAITING,
+    "AUTO": MODE_AUTO,
+    "MANUAL": MODE_MANUAL,
+    "DEAD": MODE_DEAD,
+}
+
+# State variables
+state = "WAITING"  # WAITING, AUTO, MANUAL, DEAD
+manual_mode_end_time = 0
+user_move_end_time = 0
+session_flags = 0
+danger_reported = False
+
+# Steering stream, changed wheel speeds are applied once per link tick
+steering = SteeringReceiver(motor.steer)
+
+def send_response(opcode, arg0=0, arg1=0, seq=0):
     """Send response over BLE"""
     try:
-        uart.write(f"{message}\n".encode('utf-8'))
-        print(f"Sent: {message}")
+        link.send(opcode, arg0, arg1, seq)
     except:
         pass
 
-def handle_connection():
-    """Handle BLE connection process"""
+def send_event(opcode, arg0=0, arg1=0):
+    """Send a state event if the controller asked for them"""
+    if session_flags & SESSION_STATE_EVENTS:
+        send_response(opcode, arg0, arg1)
+
+def set_state(new_state):
+    """Change robot state and report the new mode"""
+    global state
+    if new_state != state:
+        state = new_state
+        send_event(OP_MODE, STATE_MODES[state])
+        if state == "AUTO" or state == "MANUAL":
+            memory.hold()
+        else:
+            # Between levels or dead, nothing is timing critical
+            memory.release()
+            memory.collect()
+
+async def wait_for_connection():
+    """Advertise until the controller connects"""
     print("Waiting for connection...")
+    monitor.begin(REGION_CONNECT)
     ble.start_advertising(advertisement)
-    
+
     while not ble.connected:
-        time.sleep(0.1)
-    
+        monitor.feed()
+        await asyncio.sleep(0.1)
+
     print("Connected!")
     ble.stop_advertising()
+    monitor.end()
 
-accel.calibrate()
+def next_period(start_time, period):
+    """
+    Start of the period after start_time, keeps task rates fixed. Periods
+    missed while the task was late are skipped rather than run back to back.
+    Tasks await asyncio.sleep() until then themselves, calling an async
+    function would allocate a new coroutine every period.
+    """
+    next_time = start_time + period
+    now = time.monotonic()
+    if next_time < now:
+        next_time = now
+    return next_time
 
-while True:
-    # Wait for connection
-    handle_connection()
-    
-    # State variables
-    state = "WAITING"  # WAITING, AUTO, MANUAL, DEAD
-    manual_mode_end_time = 0
-    user_move_end_time = 0
-    
-    movement.reset()
+# ===== MESSAGE HANDLERS =====
+# Each handler takes (arg0, arg1, current_time) from the decoded frame
+# and returns a RESULT_* code for that frame. Every frame except HELLO and
+# PING is acknowledged by the dispatch loop once its handler has run.
+
+def handle_hello(version, _, current_time):
+    """Protocol negotiation from the controller"""
+    link.accept_hello(version)
+    if not link.binary:
+        # Unsupported version, answer like older firmware would
+        send_response(OP_ACK)
+        return RESULT_IGNORED
+    return RESULT_DONE
+
+def handle_ping(stamp, interval_ms, current_time):
+    """Heartbeat from the controller, echo it and keep the failsafe armed"""
+    send_response(OP_PONG, stamp)
+    failsafe.heartbeat(interval_ms, current_time)
+    return RESULT_DONE
+
+def handle_session(flags, _, current_time):
+    """SESSION - controller opts in to ACK-less moves and state events"""
+    global session_flags
+    session_flags = flags & SUPPORTED_SESSION_FLAGS
+    send_response(OP_SESSION, session_flags)
+    print(f"Session flags: 0x{session_flags:02X}")
+    return RESULT_DONE
+
+def handle_level(level, difficulty, current_time):
+    """LEVEL command - starts/restarts the game"""
+    global user_move_end_time
+    if not 0 <= difficulty < len(DIFFICULTIES):
+        # Corrupt frame or a newer controller, keep playing what is running
+        print(f"Unknown difficulty {difficulty}, LEVEL ignored")
+        return RESULT_IGNORED
     accel.reset()
-    
-    # Connection loop
-    try:
-        while ble.connected:
-            current_time = time.monotonic()
-            
-            # Check for death (only when alive)
-            if state != "DEAD" and state != "WAITING":
-                if accel.check_impact():
-                    motor.stop()
-                    state = "DEAD"
-                    send_response("DEAD")
-                    print("Robot died!")
-            
-            message = None
-            # Handle incoming messages
-            if uart.in_waiting:
-                data = uart.read(uart.in_waiting)
-                message = data.decode('utf-8').strip()
-                print(f"Received: {message}")
-                
-                # LEVEL command - starts/restarts the game
-                if message.startswith("LEVEL:"):
-                    try:
-                        parts = message.split(":")
-                        level = int(parts[1])
-                        difficulty = parts[2].upper()
-                        
-                        if difficulty in ["EASY", "MEDIUM", "HARD"]:
-                            accel.reset()
-                            movement.set_level(level, difficulty)
-                            state = "AUTO"
-                            user_move_end_time = 0  # Reset user move timer
-                            send_response("ACK")
-                            print(f"Started level {level} - {difficulty}")
-                        else:
-                            send_response("ACK")
-                    except:
-                        send_response("ACK")
-                
-                # MANUAL mode - 5 seconds of full control
-                elif message == "MANUAL":
-                    if state == "AUTO":
-                        state = "MANUAL"
-                        manual_mode_end_time = current_time + MANUAL_MODE_DURATION
-                        motor.stop()
-                        send_response("ACK")
-                        print("Manual mode: 5 seconds of full control")
-                
-                # Movement commands
-                elif message == "UP":
-                    if state == "MANUAL":
-                        # Continuous movement in manual mode
-                        motor.forward(BASE_SPEED)
-                    elif state == "AUTO":
-                        # Execute user move and block auto for duration
-                        motor.stop()  # Stop any current movement first
-                        motor.forward(BASE_SPEED)
-                        user_move_end_time = current_time + MANUAL_MOVE_DURATION
-                    send_response("ACK")
-                
-                elif message == "DOWN":
-                    if state == "MANUAL":
-                        motor.backward(BASE_SPEED)
-                    elif state == "AUTO":
-                        motor.stop()
-                        motor.backward(BASE_SPEED)
-                        user_move_end_time = current_time + MANUAL_MOVE_DURATION
-                    send_response("ACK")
-                
-                elif message == "LEFT":
-                    if state == "MANUAL":
-                        motor.left(BASE_SPEED)
-                    elif state == "AUTO":
-                        motor.stop()
-                        motor.left(BASE_SPEED)
-                        user_move_end_time = current_time + MANUAL_MOVE_DURATION
-                    send_response("ACK")
-                
-                elif message == "RIGHT":
-                    if state == "MANUAL":
-                        motor.right(BASE_SPEED)
-                    elif state == "AUTO":
-                        motor.stop()
-                        motor.right(BASE_SPEED)
-                        user_move_end_time = current_time + MANUAL_MOVE_DURATION
-                    send_response("ACK")
-                
-                elif message == "STOP":
-                    motor.stop()
-                    user_move_end_time = 0
-                    state = "WAITING"
-                    send_response("ACK")
-                
-                else:
-                    send_response("ACK")
-            
-            # Update movement states
-            if state == "AUTO":
-                # Only run auto mode if user move timer has expired
-                if current_time >= user_move_end_time: # add one here for a short delay before the robot makes another random move
-                    # Execute auto random movements
-                    movement.update_auto_mode()
-                # else: user command is still executing, don't interfere
-            
-            elif state == "MANUAL":
-                # Check if manual mode expired
-                if current_time >= manual_mode_end_time:
-                    state = "AUTO"
-                    motor.stop()
-                    movement.reset()
-                    user_move_end_time = 0  # Reset timer
-                    print("Manual mode ended, back to auto")
-            
-            elif state == "DEAD":
-                motor.stop()
-            
-    
-    except Exception as e:
-        print(f"Error: {e}")
-    
-    finally:
-        print("Disconnected!")
+    movement.set_level(level, DIFFICULTIES[difficulty], SCHEDULE_SEED)
+    memory.collect()  # level transition, before the moves start
+    set_state("AUTO")
+    user_move_end_time = 0  # Reset user move timer
+    send_event(OP_LEVEL_START, level, difficulty)
+    print(f"Started level {level} - {DIFFICULTIES[difficulty]}")
+    return RESULT_DONE
+
+def handle_manual(_, __, current_time):
+    """MANUAL mode - 5 seconds of full control"""
+    global manual_mode_end_time
+    if state == "AUTO":
+        set_state("MANUAL")
+        manual_mode_end_time = current_time + MANUAL_MODE_DURATION
         motor.stop()
-        ble.stop_advertising()
-        time.sleep(0.5)
+        steering.stop()
+        print("Manual mode: 5 seconds of full control")
+        return RESULT_DONE
+    return RESULT_IGNORED
+
+def handle_stop(_, __, current_time):
+    """STOP - stop Scrappy between levels and after game over"""
+    global user_move_end_time
+    motor.stop()
+    user_move_end_time = 0
+    set_state("WAITING")
+    return RESULT_DONE
+
+def make_move_handler(move):
+    """Build the handler for one movement command"""
+    def handle_move(_, __, current_time):
+        global user_move_end_time
+        result = RESULT_DONE
+        if state == "MANUAL":
+            # Continuous movement in manual mode
+            move(BASE_SPEED)
+        elif state == "AUTO":
+            # Execute user move and block auto for duration
+            motor.stop()  # Stop any current movement first
+            move(BASE_SPEED)
+            user_move_end_time = current_time + MANUAL_MOVE_DURATION
+        else:
+            result = RESULT_IGNORED
+        return result
+    return handle_move
+
+def handle_steer(left, right, current_time):
+    """STEER - wheel speeds for manual mode, (re)starts the stream"""
+    if state != "MANUAL":
+        return RESULT_IGNORED
+    steering.steer(left, right, current_time)
+    return RESULT_DONE
+
+def handle_steer_delta(counter, packed, current_time):
+    """STEER_DELTA - change of the wheel speeds since the previous frame"""
+    if state != "MANUAL" or not steering.delta(counter, packed, current_time):
+        return RESULT_IGNORED
+    return RESULT_DONE
+
+def handle_superseded(_, __, current_time):
+    """A newer movement command arrived in the same read"""
+    return RESULT_SUPERSEDED
+
+def handle_duplicate(_, __, current_time):
+    """Retransmission of a command that already ran"""
+    return RESULT_IGNORED
+
+def handle_unknown(_, __, current_time):
+    return RESULT_UNKNOWN
+
+HANDLERS = {
+    OP_HELLO: handle_hello,
+    OP_PING: handle_ping,
+    OP_LEVEL: handle_level,
+    OP_MANUAL: handle_manual,
+    OP_STOP: handle_stop,
+    OP_SESSION: handle_session,
+    OP_UP: make_move_handler(motor.forward),
+    OP_DOWN: make_move_handler(motor.backward),
+    OP_LEFT: make_move_handler(motor.left),
+    OP_RIGHT: make_move_handler(motor.right),
+    OP_STEER: handle_steer,
+    OP_STEER_DELTA: handle_steer_delta,
+}
+
+def check_danger():
+    """Warn the controller once per approach to the table edge"""
+    global danger_reported
+    time_to_edge = accel.motion.time_to_edge()
+    if time_to_edge <= DANGER_TIME:
+        if not danger_reported:
+            danger_reported = True
+            send_event(OP_DANGER, time_to_edge)
+            print(f"Danger! Edge in {time_to_edge}ms")
+    elif time_to_edge > 2 * DANGER_TIME:
+        danger_reported = False
+
+# ===== TASKS =====
+# Every task runs while the BLE connection is up, at its own fixed period.
+
+async def link_task():
+    """Receive and dispatch frames, newest movement command wins"""
+    next_time = time.monotonic()
+    while ble.connected:
+        current_time = time.monotonic()
+        monitor.begin(REGION_LINK)
+        link.poll()
+        count = link.read_batch(batch)
+        batch.collapse(MOVEMENT_OPCODES)
+        if count:
+            gap = failsafe.activity(current_time)
+            if gap:
+                send_event(OP_FAILSAFE, min(0xFFFF, int(gap * 1000)))
+                print(f"Link back after {gap * 1000:.0f}ms")
+        for i in range(count):
+            opcode = batch.opcodes[i]
+            seq = batch.seqs[i]
+            if duplicates.is_duplicate(seq):
+                handler = handle_duplicate
+            elif batch.results[i] == RESULT_SUPERSEDED:
+                handler = handle_superseded
+            else:
+                handler = HANDLERS.get(opcode, handle_unknown)
+            batch.results[i] = handler(batch.arg0[i], batch.arg1[i], current_time)
+            if opcode in UNACKED_OPCODES:
+                continue
+            if seq == 0 and link.binary and session_flags & SESSION_ACKLESS_MOVES:
+                pass  # Fire-and-forget command, nothing to acknowledge
+            else:
+                send_response(OP_ACK, seq=seq)
+            if LOG_FRAMES:
+                print(f"Received: {opcode_name(opcode)} #{seq} ({RESULT_NAMES[batch.results[i]]})")
+
+        steering.apply()
+
+        # Failsafe: heartbeats stopped while moving, stop and hold still
+        if state == "AUTO" or state == "MANUAL":
+            if failsafe.check(current_time):
+                motor.stop()
+                print(f"Failsafe! No heartbeat for {(current_time - failsafe.last_seen) * 1000:.0f}ms")
+
+        # Send everything queued this tick in as few writes as possible
+        link.flush()
+        monitor.end()
+
+        next_time = next_period(next_time, LINK_PERIOD)
+        await asyncio.sleep(next_time - time.monotonic())
+
+async def impact_task():
+    """Check for death and the table edge at a fixed rate (only when alive)"""
+    next_time = time.monotonic()
+    while ble.connected:
+        if state != "DEAD" and state != "WAITING":
+            monitor.begin(REGION_IMPACT)
+            accel.motion.set_command(motor.left_command(), motor.right_command())
+            if accel.check_impact():
+                motor.stop()
+                set_state("DEAD")
+                send_response(OP_DEAD)
+                link.flush()
+                print("Robot died!")
+            else:
+                check_danger()
+            monitor.end()
+
+        next_time = next_period(next_time, IMPACT_PERIOD)
+        await asyncio.sleep(next_time - time.monotonic())
+
+async def motor_task():
+    """Advance motor ramps (kick-start and acceleration)"""
+    next_time = time.monotonic()
+    while ble.connected:
+        monitor.begin(REGION_MOTOR)
+        motor.update()
+        monitor.end()
+
+        next_time = next_period(next_time, MOTOR_PERIOD)
+        await asyncio.sleep(next_time - time.monotonic())
+
+async def auto_task():
+    """Auto-mode scheduler and manual-mode expiry"""
+    global user_move_end_time
+    next_time = time.monotonic()
+    while ble.connected:
+        current_time = time.monotonic()
+        monitor.begin(REGION_MOVEMENT)
+        if failsafe.tripped:
+            pass  # Wait for the link to come back
+
+        elif state == "AUTO":
+            # Only run auto mode if user move timer has expired
+            if current_time >= user_move_end_time: # add one here for a short delay before the robot makes another random move
+                # Execute auto random movements, collect garbage in the pauses
+                if movement.update_auto_mode() and movement.move_end_time - current_time >= GC_MIN_PAUSE:
+                    memory.collect()
+            # else: user command is still executing, don't interfere
+
+        elif state == "MANUAL":
+            # Check if manual mode expired
+            if current_time >= manual_mode_end_time:
+                send_event(OP_MANUAL_END)
+                set_state("AUTO")
+                motor.stop()
+                steering.stop()
+                movement.reset()
+                user_move_end_time = 0  # Reset timer
+                print("Manual mode ended, back to auto")
+            elif steering.stale(current_time, STEER_TIMEOUT):
+                # The steering stream stopped, don't keep driving on its last frame
+                motor.stop()
+                steering.stop()
+                print("Steering stream stale, stopped")
+
+        elif state == "DEAD":
+            motor.stop()
+        memory.check()
+        monitor.end()
+
+        next_time = next_period(next_time, AUTO_PERIOD)
+        await asyncio.sleep(next_time - time.monotonic())
+
+async def watchdog_task():
+    """
+    Feed the watchdog. The tasks are cooperative, so this only runs if none
+    of them is stuck.
+    """
+    while ble.connected:
+        monitor.feed()
+        await asyncio.sleep(WATCHDOG_PERIOD)
+
+async def main():
+    global state, manual_mode_end_time, user_move_end_time, session_flags, danger_reported
+    while True:
+        monitor.feed()
+        await wait_for_connection()
+
+        # Reset state for this connection
+        state = "WAITING"
+        manual_mode_end_time = 0
+        user_move_end_time = 0
+        session_flags = 0
+        danger_reported = False
+        steering.stop()
+
+        link.reset()
+        duplicates.clear()
+        failsafe.reset()
+        movement.reset()
+        accel.reset()
+
+        tasks = [
+            asyncio.create_task(link_task()),
+            asyncio.create_task(impact_task()),
+            asyncio.create_task(motor_task()),
+            asyncio.create_task(auto_task()),
+            asyncio.create_task(watchdog_task()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+
+        except Exception as e:
+            print(f"Error: {e}")
+
+        finally:
+            for task in tasks:
+                task.cancel()
+            print("Disconnected!")
+            print(f"Link: {link.frames_sent} frames in {link.writes} writes")
+            motor_stats = motor.driver.get_stats()
+            print(f"Motors: {motor_stats['writes']} pin writes, {motor_stats['skipped']} unchanged skipped")
+            monitor.print_stats()
+            memory.print_stats()
+            memory.release()
+            motor.stop()
+            ble.stop_advertising()
+            await asyncio.sleep(0.5)
+
+if __name__ == "__main__":
+    accel.calibrate()
+
+    if ENABLE_WATCHDOG:
+        monitor.start()
+
+    asyncio.run(main())
@@ -0,0 +1,154 @@
+import time
+from protocol import OP_PING, OP_PONG
+
+try:
+    import supervisor
+except ImportError:
+    # Running on a host, time.monotonic() stands in
+    supervisor = None
+
+# This file is shared between the controller and Scrappy.
+# The controller sends PING frames every interval, Scrappy answers each one
+# with a PONG carrying the same timestamp and runs a Failsafe that stops the
+# motors when heartbeats stop arriving.
+
+
+def ticks_ms():
+    """
+    Millisecond timestamp that fits a 16-bit heartbeat field.
+    supervisor.ticks_ms() stays exact, time.monotonic() loses milliseconds
+    after a few hours of uptime on CircuitPython's 30-bit floats.
+    """
+    if supervisor:
+        return supervisor.ticks_ms() & 0xFFFF
+    return int(time.monotonic() * 1000) & 0xFFFF
+
+
+class LatencyStats:
+    """Running round-trip time statistics in milliseconds"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.last = 0
+        self.mean = 0.0
+        self.min = 0
+        self.max = 0
+
+    def add(self, rtt):
+        """Add one round-trip sample"""
+        self.count += 1
+        self.last = rtt
+        self.mean += (rtt - self.mean) / self.count
+        if self.count == 1 or rtt < self.min:
+            self.min = rtt
+        if rtt > self.max:
+            self.max = rtt
+
+    def __str__(self):
+        return f"RTT {self.last}ms (mean {self.mean:.1f}, min {self.min}, max {self.max}, n={self.count})"
+
+
+class HeartbeatSender:
+    """
+    Sends PING frames at a fixed interval and measures the round trip.
+
+    Heartbeats only go out when the main loop gets to service(), so a
+    blocking display refresh or FIFO read delays them. Every PING carries
+    the longest gap between two heartbeats seen so far (at least the
+    interval) instead of the nominal interval, Scrappy's failsafe then
+    waits for several of those and never trips on the controller's own
+    loop latency. Gaps longer than MAX_GAP are stalls (or the connection
+    setup), they are not counted.
+    """
+
+    MAX_GAP = 0.5  # seconds, Scrappy's longest failsafe timeout
+
+    def __init__(self, link, interval=0.03):
+        """
+        Args:
+            link: Link to send heartbeats on
+            interval: Seconds between heartbeats (default 0.03)
+        """
+        self.link = link
+        self.interval = interval
+        self.stats = LatencyStats()
+        self.longest_gap = 0.0
+        self._next_time = 0
+        self._last_sent = 0
+
+    def service(self, now):
+        """Send a heartbeat if one is due (binary protocol only)"""
+        if not self.link.binary or now < self._next_time:
+            return
+        gap = now - self._last_sent
+        if self._last_sent and self.longest_gap < gap <= self.MAX_GAP:
+            self.longest_gap = gap
+        self._last_sent = now
+        self._next_time = now + self.interval
+        self.link.send(OP_PING, ticks_ms(), int(max(self.interval, self.longest_gap) * 1000))
+
+    def on_pong(self, stamp):
+        """Record the round trip of an answered heartbeat"""
+        self.stats.add((ticks_ms() - stamp) & 0xFFFF)
+
+
+class Failsafe:
+    """
+    Stops trusting the link when heartbeats stop.
+    Armed by the first heartbeat, so older controllers that never send one
+    are unaffected. Trips once nothing has arrived for `missed` heartbeat
+    intervals, bounded by min_timeout and max_timeout. The interval is the
+    one each heartbeat carries, which grows with the sender's worst loop
+    latency.
+    """
+
+    def __init__(self, missed=3, min_timeout=0.05, max_timeout=0.5):
+        self.missed = missed
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.reset()
+
+    def reset(self):
+        """Disarm, call on every new connection"""
+        self.armed = False
+        self.tripped = False
+        self.timeout = self.max_timeout
+        self.last_seen = 0
+        self.trip_count = 0
+        self.longest_gap = 0.0
+
+    def heartbeat(self, interval_ms, now):
+        """A heartbeat arrived, (re)arm with the sender's interval"""
+        timeout = self.missed * interval_ms / 1000
+        self.timeout = max(self.min_timeout, min(self.max_timeout, timeout))
+        self.armed = True
+        return self.activity(now)
+
+    def activity(self, now):
+        """
+        Any frame arrived, the link is alive
+        Returns: the gap in seconds if this ends a tripped failsafe, else 0
+        """
+        gap = now - self.last_seen
+        self.last_seen = now
+        if not self.tripped:
+            return 0
+        self.tripped = False
+        if gap > self.longest_gap:
+            self.longest_gap = gap
+        return gap
+
+    def check(self, now):
+        """
+        Returns: True exactly once when the failsafe trips
+        """
+        if not self.armed or self.tripped:
+            return False
+        if now - self.last_seen <= self.timeout:
+            return False
+        self.tripped = True
+        self.trip_count += 1
+        return True
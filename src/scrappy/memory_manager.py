@@ -0,0 +1,80 @@
+import gc
+import time
+
+# This file is shared between the controller and Scrappy.
+
+
+class MemoryManager:
+    """
+    Moves garbage collection to moments where a pause does not hurt.
+
+    hold() turns automatic collection off while timing matters (a move,
+    the game timer), collect() runs a timed collection when the caller
+    knows it has a quiet moment (a pause between moves, a level
+    transition), and release() hands collection back to the VM. check()
+    is the safety net: while held, it collects straight away once free
+    memory drops under the floor, so holding can never run the heap dry.
+    """
+
+    def __init__(self, floor=16384):
+        """
+        Args:
+            floor: Bytes of free memory below which check() collects anyway
+        """
+        self.floor = floor
+        self.held = False
+        # CPython has no mem_free, the safety net is off on a host
+        self._mem_free = getattr(gc, "mem_free", None)
+
+        # Statistics
+        self.collections = 0
+        self.forced = 0
+        self.max_pause = 0.0
+        self.total_pause = 0.0
+        self.min_free = None
+
+    def hold(self):
+        """Stop automatic collection"""
+        if not self.held:
+            gc.disable()
+            self.held = True
+
+    def release(self):
+        """Let the VM collect automatically again"""
+        if self.held:
+            gc.enable()
+            self.held = False
+
+    def collect(self):
+        """Collect now and record how long it took (seconds)"""
+        start = time.monotonic()
+        gc.collect()
+        pause = time.monotonic() - start
+        self.collections += 1
+        self.total_pause += pause
+        if pause > self.max_pause:
+            self.max_pause = pause
+        return pause
+
+    def check(self):
+        """
+        Collect if free memory is under the floor, call from the main loop
+        Returns: True if it had to collect
+        """
+        if self._mem_free is None:
+            return False
+        free = self._mem_free()
+        if self.min_free is None or free < self.min_free:
+            self.min_free = free
+        if free >= self.floor:
+            return False
+        self.forced += 1
+        pause = self.collect()
+        print(f"GC: only {free} bytes free, collected in {pause * 1000:.1f}ms")
+        return True
+
+    def print_stats(self):
+        average = self.total_pause / self.collections if self.collections else 0.0
+        print(f"GC: {self.collections} collections ({self.forced} forced), "
+              f"pause avg {average * 1000:.1f}ms max {self.max_pause * 1000:.1f}ms, "
+              f"lowest free {self.min_free}")
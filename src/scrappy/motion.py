@@ -0,0 +1,125 @@
+import math
+import array
+
+# Heading resolution: HEADING_STEPS directions, 256 sub-steps each
+HEADING_STEPS = 64
+_HEADING_MASK = HEADING_STEPS * 256 - 1
+_TRIG_ONE = 1024  # fixed point 1.0 of the sine and cosine tables
+
+_COS = array.array("h", [round(math.cos(2 * math.pi * i / HEADING_STEPS) * _TRIG_ONE)
+                         for i in range(HEADING_STEPS)])
+_SIN = array.array("h", [round(math.sin(2 * math.pi * i / HEADING_STEPS) * _TRIG_ONE)
+                         for i in range(HEADING_STEPS)])
+
+# Returned by time_to_edge() while not heading for an edge
+NO_EDGE = 0xFFFF
+
+
+class MotionEstimator:
+    """
+    Dead reckoning of Scrappy's position on the table.
+
+    update() takes one accelerometer sample along the driving axis and
+    integrates velocity and position, in integer micrometres, so a sample
+    costs a few integer operations and allocates nothing. The velocity is
+    pulled towards what the motor command predicts (the drift correction),
+    and while the motors are stopped it decays to zero and the sensor bias
+    is re-estimated. The heading follows the difference between the wheel
+    commands.
+
+    The table is a TABLE_LENGTH x TABLE_WIDTH rectangle centred on where
+    Scrappy stood at reset(). time_to_edge() is how long until the current
+    velocity takes it over the nearest edge ahead.
+    """
+
+    TABLE_LENGTH = 600   # mm, along the heading at reset()
+    TABLE_WIDTH = 600    # mm
+    MAX_SPEED = 0.5      # m/s driving straight at 100%
+    TURN_RATE = 360      # degrees/s turning on the spot at 100%
+    BLEND_SHIFT = 5      # velocity moves 1/2^BLEND_SHIFT towards the command each sample
+    BIAS_SHIFT = 6       # bias filter while stopped, 1/2^BIAS_SHIFT per sample
+
+    def __init__(self, scale, sample_rate):
+        """
+        Args:
+            scale: m/s^2 per accelerometer count
+            sample_rate: Accelerometer samples per second
+        """
+        self.rate = int(sample_rate)
+        # Velocity change in um/s for one count over one sample
+        self._dv = round(scale * 1000000 / sample_rate)
+        self._max_speed_um = int(self.MAX_SPEED * 1000000)
+        self._max_velocity = 2 * self._max_speed_um
+        # Heading change per sample at 100% turn
+        self._turn_scale = round(self.TURN_RATE / 360 * HEADING_STEPS * 256 / sample_rate)
+        self._half_length = self.TABLE_LENGTH * 500
+        self._half_width = self.TABLE_WIDTH * 500
+        self.samples = 0
+        self.reset()
+
+    def reset(self):
+        """Scrappy stands still in the middle of the table"""
+        self.velocity = 0   # um/s along the heading
+        self.x = 0          # um along the table length
+        self.y = 0          # um across the table
+        self._heading = 0
+        self._bias = 0      # counts << BIAS_SHIFT
+        self._model_velocity = 0
+        self._turn = 0
+        self._stopped = True
+
+    def set_command(self, left, right):
+        """Current wheel commands in % (negative is backward)"""
+        self._model_velocity = (left + right) * self._max_speed_um // 200
+        self._turn = (right - left) * self._turn_scale // 200
+        self._stopped = left == 0 and right == 0
+
+    def update(self, accel):
+        """Add one sample, accel is in counts along the driving axis"""
+        self.samples += 1
+        if self._stopped:
+            # Not moving: whatever the sensor reads is bias, and velocity is zero
+            self._bias += accel - (self._bias >> self.BIAS_SHIFT)
+            self.velocity -= self.velocity >> 2
+            return
+
+        accel -= self._bias >> self.BIAS_SHIFT
+        velocity = self.velocity + accel * self._dv
+        velocity += (self._model_velocity - velocity) >> self.BLEND_SHIFT
+        limit = self._max_velocity
+        velocity = max(-limit, min(limit, velocity))
+        self.velocity = velocity
+
+        self._heading = (self._heading + self._turn) & _HEADING_MASK
+        step = self._heading >> 8
+        self.x += (velocity * _COS[step] // _TRIG_ONE) // self.rate
+        self.y += (velocity * _SIN[step] // _TRIG_ONE) // self.rate
+
+    def time_to_edge(self):
+        """
+        Milliseconds until the current velocity reaches the nearest edge
+        ahead, 0 if already past one, NO_EDGE if not heading for one
+        """
+        step = self._heading >> 8
+        velocity = self.velocity
+        best = NO_EDGE
+        for axis in range(2):
+            if axis == 0:
+                position = self.x
+                speed = velocity * _COS[step] // _TRIG_ONE
+                half = self._half_length
+            else:
+                position = self.y
+                speed = velocity * _SIN[step] // _TRIG_ONE
+                half = self._half_width
+            if speed > 0:
+                distance = half - position
+            elif speed < 0:
+                distance = half + position
+                speed = -speed
+            else:
+                continue
+            if distance <= 0:
+                return 0
+            best = min(best, distance * 1000 // speed)
+        return best
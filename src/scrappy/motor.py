@@ -1,121 +1,92 @@
-import board
-import pwmio
-import digitalio
-import time
+from motor_driver import MotorDriver, PWMIOBackend, SimBackend, FORWARD, BACKWARD, CHANNEL_A, CHANNEL_B
+
+try:
+    import board
+except ImportError:
+    # Not on a CircuitPython board, run against the in-memory simulation
+    board = None
 
 # QT Py ESP32-S3 pin mapping
 # You'll need to choose actual pins from: A0, A1, A2, A3, SCK, MISO, MOSI, TX, RX, SCL, SDA
 # Here's a suggested mapping using available GPIO pins:
+#
+# Motor A: ENA = SCK (was D8), IN1 = MISO (was D9), IN2 = MOSI (was D10)
+# Motor B: IN3 = A3 (was D3), IN4 = A2 (was D2), ENB = A1 (was D1)
+
+if board:
+    driver = MotorDriver(PWMIOBackend(
+        ena=board.SCK, in1=board.MISO, in2=board.MOSI,
+        in3=board.A3, in4=board.A2, enb=board.A1,
+        frequency=5000,
+    ))
+else:
+    driver = MotorDriver(SimBackend())
+
+# Log every move, code.py turns this off so moves don't cost a serial write
+verbose = True
+
+
+def use_backend(backend):
+    """Swap the motor backend (simulation, recording...), motors start stopped"""
+    global driver
+    driver = MotorDriver(backend)
+
+
+def update():
+    """Advance both motor ramps, call once per main loop iteration"""
+    driver.update()
 
-# Motor A pins
-ENA = pwmio.PWMOut(board.SCK, frequency=5000)   # Was D8
-IN1 = digitalio.DigitalInOut(board.MISO)         # Was D9
-IN2 = digitalio.DigitalInOut(board.MOSI)         # Was D10
-
-# Motor B pins
-IN3 = digitalio.DigitalInOut(board.A3)         # Was D3
-IN4 = digitalio.DigitalInOut(board.A2)        # Was D2
-ENB = pwmio.PWMOut(board.A1, frequency=5000) # Was D1
-
-# Configure direction pins as outputs
-IN1.direction = digitalio.Direction.OUTPUT
-IN2.direction = digitalio.Direction.OUTPUT
-IN3.direction = digitalio.Direction.OUTPUT
-IN4.direction = digitalio.Direction.OUTPUT
-
-# Initialize motors to stopped state
-IN1.value = False
-IN2.value = False
-IN3.value = False
-IN4.value = False
-
-def set_speed(pwm_pin, speed):
-    """Set motor speed (0-100%)"""
-    time.sleep(0.02)
-    duty = int((80 / 100) * 65535)
-    pwm_pin.duty_cycle = max(0, min(65535, duty))
-    time.sleep(0.01)
-    duty = int((speed / 100) * 65535)
-    pwm_pin.duty_cycle = max(0, min(65535, duty))
 
 def forward(speed=10):
     """Move both motors forward"""
-    # Motor A forward
-    IN1.value = True
-    IN2.value = False
-    set_speed(ENA, speed)
-    
-    # Motor B forward
-    IN3.value = True
-    IN4.value = False
-    set_speed(ENB, speed)
-    print("Moving Forward")
+    driver.drive(FORWARD, speed, FORWARD, speed)
+    if verbose:
+        print("Moving Forward")
 
 def backward(speed=10):
     """Move both motors backward"""
-    # Motor A backward
-    IN1.value = False
-    IN2.value = True
-    set_speed(ENA, speed)
-    
-    # Motor B backward
-    IN3.value = False
-    IN4.value = True
-    set_speed(ENB, speed)
-    print("Moving Backward")
+    driver.drive(BACKWARD, speed, BACKWARD, speed)
+    if verbose:
+        print("Moving Backward")
 
 def right(speed=10):
-    """Turn left (Motor A backward, Motor B forward)"""
-    # Motor A backward
-    IN1.value = False
-    IN2.value = True
-    set_speed(ENA, speed)
-    
-    # Motor B forward
-    IN3.value = True
-    IN4.value = False
-    set_speed(ENB, speed)
-    print("Turning RIGHT")
+    """Turn right (Motor A backward, Motor B forward)"""
+    driver.drive(BACKWARD, speed, FORWARD, speed)
+    if verbose:
+        print("Turning RIGHT")
 
 def left(speed=10):
-    """Turn right (Motor A forward, Motor B backward)"""
-    # Motor A forward
-    IN1.value = True
-    IN2.value = False
-    set_speed(ENA, speed)
-    
-    # Motor B backward
-    IN3.value = False
-    IN4.value = True
-    set_speed(ENB, speed)
-    print("Turning LEFT")
+    """Turn left (Motor A forward, Motor B backward)"""
+    driver.drive(FORWARD, speed, BACKWARD, speed)
+    if verbose:
+        print("Turning LEFT")
+
+def steer(left, right):
+    """
+    Drive each side at its own speed (-100 to 100%, negative is backward).
+    Motor A is the right wheel and Motor B the left one.
+    """
+    driver.drive(FORWARD if right >= 0 else BACKWARD, abs(right),
+                 FORWARD if left >= 0 else BACKWARD, abs(left))
+
+def left_command():
+    """Commanded left wheel (Motor B) speed in %, negative is backward"""
+    return driver.command(CHANNEL_B)
+
+def right_command():
+    """Commanded right wheel (Motor A) speed in %, negative is backward"""
+    return driver.command(CHANNEL_A)
 
 def stop():
     """Stop both motors"""
-    IN1.value = False
-    IN2.value = False
-    set_speed(ENA, 0)
-    
-    IN3.value = False
-    IN4.value = False
-    set_speed(ENB, 0)
+    driver.stop()
 
 def motor_a(speed, forward=True):
     """Control Motor A individually (speed 0-100%)"""
-    if forward:
-        IN1.value = True
-        IN2.value = False
-    else:
-        IN1.value = False
-        IN2.value = True
-    set_speed(ENA, abs(speed))
+    driver.set_channel(CHANNEL_A, FORWARD if forward else BACKWARD, abs(speed))
+    driver.update()
 
 def motor_b(speed, forward=True):
     """Control Motor B individually (speed 0-100%)"""
-    if forward:
-        IN3.value = True
-        IN4.value = False
-    else:
-        IN3.value = False
-        IN4.value = True
-    set_speed(ENB, abs(speed))
\ No newline at end of file
+    driver.set_channel(CHANNEL_B, FORWARD if forward else BACKWARD, abs(speed))
+    driver.update()
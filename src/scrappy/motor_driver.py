@@ -0,0 +1,243 @@
+import time
+
+# Direction states for one L298N channel
+STOPPED = 0
+FORWARD = 1
+BACKWARD = -1
+
+# Channel indexes
+CHANNEL_A = 0
+CHANNEL_B = 1
+
+# Ramp configuration
+KICK_DUTY = 80       # % duty used to break static friction when starting from rest
+KICK_TIME = 0.03     # seconds the kick-start pulse is held
+ACCEL_RATE = 400     # max duty increase in % per second, the ramp after the kick starts at 0
+
+
+def speed_to_duty(speed):
+    """Convert a speed (0-100%) to a 16-bit PWM duty cycle"""
+    duty = int((speed / 100) * 65535)
+    return max(0, min(65535, duty))
+
+
+class MotorRamp:
+    """
+    Tick-driven speed ramp for one motor channel.
+    Nothing here sleeps: set_target() records where the motor should go and
+    step() moves it one tick closer. Starting from rest, a KICK_DUTY pulse
+    breaks static friction for KICK_TIME, then the speed rises from zero.
+    Speed decreases are applied immediately, increases are limited to
+    ACCEL_RATE.
+    """
+
+    def __init__(self):
+        self.current = 0.0
+        self.target = 0
+        self.kick_end_time = 0
+
+    def set_target(self, speed, now):
+        """Set the target speed (0-100%)"""
+        speed = max(0, min(100, abs(speed)))
+        if speed > 0 and self.current == 0 and not self.kick_end_time:
+            # Starting from rest, hold the kick-start pulse first
+            self.kick_end_time = now + KICK_TIME
+        elif speed == 0:
+            self.current = 0.0
+            self.kick_end_time = 0
+        self.target = speed
+
+    def step(self, now, dt):
+        """Advance the ramp by dt seconds, returns the speed to apply"""
+        if now < self.kick_end_time:
+            return KICK_DUTY
+        if self.current > self.target:
+            self.current = self.target
+        elif self.current < self.target:
+            self.current = min(self.target, self.current + ACCEL_RATE * dt)
+        return self.current
+
+    def is_settled(self):
+        """True once the ramp has reached its target"""
+        return self.current == self.target
+
+
+# ===== BACKENDS =====
+# A backend only knows how to drive pins. It is told which channel to change
+# and never sees a write that would not change anything.
+
+class PWMIOBackend:
+    """Real hardware backend using pwmio and digitalio"""
+
+    def __init__(self, ena, in1, in2, in3, in4, enb, frequency=5000):
+        import pwmio
+        import digitalio
+
+        self._pwm = (
+            pwmio.PWMOut(ena, frequency=frequency),
+            pwmio.PWMOut(enb, frequency=frequency),
+        )
+        self._pins = []
+        for pin in (in1, in2, in3, in4):
+            io = digitalio.DigitalInOut(pin)
+            io.direction = digitalio.Direction.OUTPUT
+            io.value = False
+            self._pins.append(io)
+
+    def set_direction(self, channel, direction):
+        """Set the two direction inputs for a channel"""
+        in_a = self._pins[channel * 2]
+        in_b = self._pins[channel * 2 + 1]
+        in_a.value = direction == FORWARD
+        in_b.value = direction == BACKWARD
+
+    def set_duty(self, channel, duty):
+        """Set the PWM duty cycle for a channel"""
+        self._pwm[channel].duty_cycle = duty
+
+
+class SimBackend:
+    """In-memory backend, keeps the last applied state of every channel"""
+
+    def __init__(self):
+        self.direction = [STOPPED, STOPPED]
+        self.duty = [0, 0]
+
+    def set_direction(self, channel, direction):
+        self.direction[channel] = direction
+
+    def set_duty(self, channel, duty):
+        self.duty[channel] = duty
+
+
+class RecordingBackend:
+    """
+    Records every write as (time, channel, kind, value) and optionally
+    forwards it to another backend.
+    kind is "dir" or "duty".
+    """
+
+    def __init__(self, backend=None, max_records=256):
+        self.backend = backend
+        self.max_records = max_records
+        self.records = []
+
+    def _record(self, channel, kind, value):
+        if len(self.records) >= self.max_records:
+            self.records.pop(0)
+        self.records.append((time.monotonic(), channel, kind, value))
+
+    def set_direction(self, channel, direction):
+        self._record(channel, "dir", direction)
+        if self.backend:
+            self.backend.set_direction(channel, direction)
+
+    def set_duty(self, channel, duty):
+        self._record(channel, "duty", duty)
+        if self.backend:
+            self.backend.set_duty(channel, duty)
+
+    def clear(self):
+        """Forget all recorded writes"""
+        self.records = []
+
+
+# ===== DRIVER =====
+
+class MotorDriver:
+    """
+    Two channel motor driver with pin-state caching.
+    The last applied direction and duty of each channel is cached and
+    writes that would not change anything never reach the backend.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.ramps = (MotorRamp(), MotorRamp())
+        self._direction = [None, None]
+        self._duty = [None, None]
+        self._last_update = time.monotonic()
+
+        # Write statistics
+        self.writes = 0
+        self.skipped = 0
+
+        self.apply_direction(CHANNEL_A, STOPPED)
+        self.apply_direction(CHANNEL_B, STOPPED)
+        self.apply_duty(CHANNEL_A, 0)
+        self.apply_duty(CHANNEL_B, 0)
+
+    def apply_direction(self, channel, direction):
+        """Write a channel direction if it differs from the cached one"""
+        if self._direction[channel] == direction:
+            self.skipped += 1
+            return
+        self._direction[channel] = direction
+        self.backend.set_direction(channel, direction)
+        self.writes += 1
+
+    def apply_duty(self, channel, duty):
+        """Write a channel duty cycle if it differs from the cached one"""
+        if self._duty[channel] == duty:
+            self.skipped += 1
+            return
+        self._duty[channel] = duty
+        self.backend.set_duty(channel, duty)
+        self.writes += 1
+
+    def set_channel(self, channel, direction, speed, now=None):
+        """
+        Set direction and target speed (0-100%) for one channel.
+        A channel changing direction is cut to zero duty before its pins
+        flip, then starts again from rest with a kick.
+        """
+        if now is None:
+            now = time.monotonic()
+        if speed == 0:
+            direction = STOPPED
+        elif direction == STOPPED:
+            speed = 0
+        if direction != self._direction[channel]:
+            # Never switch the H-bridge under load
+            self.ramps[channel].set_target(0, now)
+            self.apply_duty(channel, 0)
+        self.apply_direction(channel, direction)
+        self.ramps[channel].set_target(speed, now)
+
+    def drive(self, direction_a, speed_a, direction_b, speed_b):
+        """Set both channels and apply the first ramp tick"""
+        now = time.monotonic()
+        self.set_channel(CHANNEL_A, direction_a, speed_a, now)
+        self.set_channel(CHANNEL_B, direction_b, speed_b, now)
+        self.update(now)
+
+    def command(self, channel):
+        """Target speed of a channel in %, negative when running backward"""
+        direction = self._direction[channel]
+        target = self.ramps[channel].target
+        return -target if direction == BACKWARD else target if direction == FORWARD else 0
+
+    def stop(self):
+        """Stop both channels immediately"""
+        self.drive(STOPPED, 0, STOPPED, 0)
+
+    def update(self, now=None):
+        """
+        Advance both ramps, call once per main loop iteration.
+        ENA and ENB are written back to back so both wheels change together.
+        """
+        if now is None:
+            now = time.monotonic()
+        dt = now - self._last_update
+        self._last_update = now
+        duty_a = speed_to_duty(self.ramps[CHANNEL_A].step(now, dt))
+        duty_b = speed_to_duty(self.ramps[CHANNEL_B].step(now, dt))
+        self.apply_duty(CHANNEL_A, duty_a)
+        self.apply_duty(CHANNEL_B, duty_b)
+
+    def get_stats(self):
+        """Returns write statistics"""
+        return {
+            "writes": self.writes,
+            "skipped": self.skipped,
+        }
@@ -1,9 +1,33 @@
 import time
+import array
 import random
 import motor
 
+# Auto-move directions, each one is an index into DIRECTION_NAMES
+FORWARD = 0
+BACKWARD = 1
+LEFT = 2
+RIGHT = 3
+DIRECTION_NAMES = ("forward", "backward", "left", "right")
+
+
+def _xorshift(state):
+    """Next state of a 32-bit xorshift generator, same sequence on every platform"""
+    state ^= (state << 13) & 0xFFFFFFFF
+    state ^= state >> 17
+    state ^= (state << 5) & 0xFFFFFFFF
+    return state
+
+
 class MovementController:
-    """Class to handle random movement patterns for the robot"""
+    """
+    Class to handle random movement patterns for the robot
+    
+    set_level() precomputes the level's whole sequence of moves and pauses
+    into array tables from a seed, so update_auto_mode() only steps an
+    index: no random calls and no allocations while playing. The same
+    seed, level and difficulty always give the same schedule.
+    """
     
     # Difficulty settings
     DIFFICULTY_SETTINGS = {
@@ -24,14 +48,32 @@ class MovementController:
         }
     }
     
+    # Level scaling, applied on top of the difficulty settings
+    SPEED_PER_LEVEL = 1  # % faster for every level after the first
+    PAUSE_PER_LEVEL = 0.05  # pauses get 5% shorter for every level after the first
+    MIN_PAUSE_FACTOR = 0.5  # pauses never shrink below half
+    
+    SCHEDULE_LENGTH = 128  # moves per level, the schedule wraps around after that
+    
     def __init__(self):
         """Initialize the movement controller"""
         self.current_level = 0
         self.current_difficulty = "EASY"
+        self.seed = 0
+        
+        # Schedule tables, one entry per move
+        length = self.SCHEDULE_LENGTH
+        self.directions = bytearray(length)
+        self.speeds = bytearray(length)
+        self.durations = array.array("H", [0] * length)  # ms
+        self.pauses = array.array("H", [0] * length)     # ms, before the move
+        self.index = 0
+        self._moves = (motor.forward, motor.backward, motor.left, motor.right)
         
         # Auto mode state tracking
         self.move_end_time = 0
         self.is_pausing = False
+        self.verbose = True  # log every auto move and pause
         
         print("MovementController initialized")
     
@@ -42,54 +84,78 @@ class MovementController:
         self.is_pausing = False
         print("MovementController reset")
     
-    def set_level(self, level, difficulty):
-        """Set game level and difficulty"""
+    def set_level(self, level, difficulty, seed=None):
+        """
+        Set game level and difficulty and precompute the level's schedule
+        
+        Args:
+            seed: Schedule seed, None picks a new one. Logged so any run
+                  can be replayed.
+        """
         self.current_level = level
         self.current_difficulty = difficulty.upper()
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.generate(seed, level, self.current_difficulty)
         self.reset()
-        print(f"Level set to {level} - {self.current_difficulty}")
+        print(f"Level set to {level} - {self.current_difficulty} (seed {seed})")
     
-    def get_random_move(self):
-        """Generate a random movement command"""
-        settings = self.DIFFICULTY_SETTINGS[self.current_difficulty]
+    def generate(self, seed, level, difficulty):
+        """Fill the schedule tables for one level"""
+        settings = self.DIFFICULTY_SETTINGS[difficulty]
+        bonus = (level - 1) * self.SPEED_PER_LEVEL
+        speed_low = min(100, settings["speed_range"][0] + bonus)
+        speed_span = min(100, settings["speed_range"][1] + bonus) - speed_low + 1
+        duration_low = int(settings["duration_range"][0] * 1000)
+        duration_span = int(settings["duration_range"][1] * 1000) - duration_low + 1
+        pause_factor = max(self.MIN_PAUSE_FACTOR, 1 - (level - 1) * self.PAUSE_PER_LEVEL)
+        pause_low = int(settings["pause_range"][0] * pause_factor * 1000)
+        pause_span = int(settings["pause_range"][1] * pause_factor * 1000) - pause_low + 1
         
-        return {
-            "direction": random.choice(["forward", "backward", "left", "right"]),
-            "speed": random.randint(*settings["speed_range"]),
-            "duration": random.uniform(*settings["duration_range"]),
-            "pause": random.uniform(*settings["pause_range"])
-        }
+        # Every level and difficulty gets its own sequence from the same seed
+        state = (seed ^ (level << 16) ^ (ord(difficulty[0]) << 8) ^ 0x9E3779B9) & 0xFFFFFFFF
+        state = state or 1
+        for i in range(self.SCHEDULE_LENGTH):
+            state = _xorshift(state)
+            self.directions[i] = state & 0x03
+            self.speeds[i] = speed_low + (state >> 2) % speed_span
+            state = _xorshift(state)
+            self.durations[i] = duration_low + state % duration_span
+            state = _xorshift(state)
+            self.pauses[i] = pause_low + state % pause_span
+        self.index = 0
     
     def update_auto_mode(self):
-        """Update auto mode movement (non-blocking)"""
+        """
+        Update auto mode movement (non-blocking)
+        Returns: True if a pause just started, a quiet moment until move_end_time
+        """
         current_time = time.monotonic()
         
         # Check if current action finished
         if current_time < self.move_end_time:
-            return 
+            return False
         
+        i = self.index
         if self.is_pausing:
-            # Pause finished, start new move
-            move = self.get_random_move()
-            
-            # Execute motor command
-            if move["direction"] == "forward":
-                motor.forward(move["speed"])
-            elif move["direction"] == "backward":
-                motor.backward(move["speed"])
-            elif move["direction"] == "left":
-                motor.left(move["speed"])
-            elif move["direction"] == "right":
-                motor.right(move["speed"])
+            # Pause finished, start the next move
+            direction = self.directions[i]
+            speed = self.speeds[i]
+            self._moves[direction](speed)
             
-            self.move_end_time = current_time + move["duration"]
+            self.move_end_time = current_time + self.durations[i] / 1000
             self.is_pausing = False
-            print(f"Auto: {move['direction']} @ {move['speed']}% for {move['duration']:.1f}s")
+            self.index = i + 1 if i + 1 < self.SCHEDULE_LENGTH else 0
+            if self.verbose:
+                print(f"Auto #{i}: {DIRECTION_NAMES[direction]} @ {speed}% for {self.durations[i]}ms")
+            return False
         
         else:
-            # Move finished, start pause
+            # Move finished, pause before the next one
             motor.stop()
-            move = self.get_random_move()
-            self.move_end_time = current_time + move["pause"]
+            self.move_end_time = current_time + self.pauses[i] / 1000
             self.is_pausing = True
-            print(f"Pausing for {move['pause']:.1f}s")
+            if self.verbose:
+                print(f"Pausing for {self.pauses[i]}ms")
+            return True
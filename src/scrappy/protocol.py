@@ -0,0 +1,410 @@
+"""
+Controller <-> Scrappy link protocol.
+
+This file is shared: the same copy lives in src/controller and src/scrappy.
+
+Binary frame layout:
+
+    +-------+-----+-----+-----+--------+----------------+
+    | MAGIC | LEN | CRC | SEQ | OPCODE | PAYLOAD (LEN)  |
+    +-------+-----+-----+-----+--------+----------------+
+
+MAGIC is 0xA5, which can never start a line of the old UTF-8 text
+protocol, so both formats can be told apart from the first byte.
+LEN is the payload length, CRC is a CRC-8 over SEQ, OPCODE and PAYLOAD.
+SEQ numbers commands that expect an ACK (1-255), the ACK carries the same
+SEQ back. SEQ 0 means the frame is not acknowledged.
+Every opcode has a fixed payload layout (see FIELDS).
+
+Text fallback is the original newline terminated protocol
+("LEVEL:3:MEDIUM", "UP", "ACK", ...), used until both sides agree on the
+binary protocol with a HELLO exchange.
+"""
+
+PROTOCOL_VERSION = 2
+
+MAGIC = 0xA5
+HEADER_SIZE = 5      # MAGIC, LEN, CRC, SEQ, OPCODE
+PAYLOAD_MAX = 16
+FRAME_MAX = HEADER_SIZE + PAYLOAD_MAX
+
+# Opcodes
+OP_INVALID = 0x00
+OP_HELLO = 0x01
+OP_ACK = 0x02
+OP_PING = 0x03
+OP_PONG = 0x04
+OP_LEVEL = 0x10
+OP_MANUAL = 0x11
+OP_STOP = 0x12
+OP_SESSION = 0x13
+OP_UP = 0x20
+OP_DOWN = 0x21
+OP_LEFT = 0x22
+OP_RIGHT = 0x23
+OP_STEER = 0x24
+OP_STEER_DELTA = 0x25
+OP_DEAD = 0x30
+OP_MODE = 0x31
+OP_MANUAL_END = 0x32
+OP_LEVEL_START = 0x33
+OP_FAILSAFE = 0x34
+OP_DANGER = 0x35
+
+# Payload layout per opcode, one character per field:
+#   B = unsigned byte, b = signed byte, H = unsigned 16-bit little endian
+FIELDS = {
+    OP_HELLO: "B",       # protocol version
+    OP_ACK: "",
+    OP_PING: "HH",       # timestamp ms, heartbeat interval ms
+    OP_PONG: "H",        # timestamp ms echoed from the PING
+    OP_LEVEL: "BB",      # level, difficulty index
+    OP_MANUAL: "",
+    OP_STOP: "",
+    OP_SESSION: "B",     # session flags
+    OP_UP: "",
+    OP_DOWN: "",
+    OP_LEFT: "",
+    OP_RIGHT: "",
+    OP_STEER: "bb",      # left, right wheel speed in % (negative is backward)
+    OP_STEER_DELTA: "BB",  # stream counter, left and right speed change as signed nibbles
+    OP_DEAD: "",
+    OP_MODE: "B",        # robot mode (MODE_*)
+    OP_MANUAL_END: "",
+    OP_LEVEL_START: "BB",  # level, difficulty index
+    OP_FAILSAFE: "H",    # link gap in ms that tripped the failsafe
+    OP_DANGER: "H",      # estimated ms until Scrappy drives off the table
+}
+
+_FIELD_SIZE = {"B": 1, "b": 1, "H": 2}
+
+OPCODE_NAMES = {
+    OP_INVALID: "INVALID",
+    OP_HELLO: "HELLO",
+    OP_ACK: "ACK",
+    OP_PING: "PING",
+    OP_PONG: "PONG",
+    OP_LEVEL: "LEVEL",
+    OP_MANUAL: "MANUAL",
+    OP_STOP: "STOP",
+    OP_SESSION: "SESSION",
+    OP_UP: "UP",
+    OP_DOWN: "DOWN",
+    OP_LEFT: "LEFT",
+    OP_RIGHT: "RIGHT",
+    OP_STEER: "STEER",
+    OP_STEER_DELTA: "STEER_DELTA",
+    OP_DEAD: "DEAD",
+    OP_MODE: "MODE",
+    OP_MANUAL_END: "MANUAL_END",
+    OP_LEVEL_START: "LEVEL_START",
+    OP_FAILSAFE: "FAILSAFE",
+    OP_DANGER: "DANGER",
+}
+
+# Text protocol keywords, the text form of an opcode is its name
+TEXT_OPCODES = {}
+for _op, _name in OPCODE_NAMES.items():
+    if _op != OP_INVALID:
+        TEXT_OPCODES[_name] = _op
+
+# The same keywords as bytes, matched in place against received lines
+_TEXT_KEYWORDS = tuple((_name.encode("utf-8"), _op) for _name, _op in TEXT_OPCODES.items())
+
+# Prebuilt text lines of the opcodes without arguments
+_TEXT_LINES = {}
+for _name, _op in TEXT_OPCODES.items():
+    _TEXT_LINES[_op] = (_name + "\n").encode("utf-8")
+
+# Session flags, requested by the controller with OP_SESSION and echoed
+# back by Scrappy with the flags it accepted (binary protocol only)
+SESSION_ACKLESS_MOVES = 0x01   # movement commands are sent without a SEQ and not ACKed
+SESSION_STATE_EVENTS = 0x02    # Scrappy reports MODE, MANUAL_END, LEVEL_START and DANGER events
+
+# Robot modes reported by OP_MODE
+MODE_WAITING = 0
+MODE_AUTO = 1
+MODE_MANUAL = 2
+MODE_DEAD = 3
+MODE_NAMES = ("WAITING", "AUTO", "MANUAL", "DEAD")
+
+# Difficulty index <-> name, index is what goes on the wire
+DIFFICULTIES = ("EASY", "MEDIUM", "HARD")
+_DIFFICULTY_KEYWORDS = tuple(_name.encode("utf-8") for _name in DIFFICULTIES)
+
+# Movement opcodes mapped to button names
+BUTTON_OPCODES = {
+    "UP": OP_UP,
+    "DOWN": OP_DOWN,
+    "LEFT": OP_LEFT,
+    "RIGHT": OP_RIGHT,
+}
+
+# Steering stream: STEER sets both wheel speeds and restarts the stream
+# counter at 0, every STEER_DELTA carries the next counter value and the
+# change of both speeds packed into one byte (left in the low nibble).
+# Changes outside STEER_DELTA_MIN..STEER_DELTA_MAX need a STEER frame.
+STEER_DELTA_MIN = -8
+STEER_DELTA_MAX = 7
+
+
+def pack_steer_delta(left, right):
+    """Pack two speed changes (STEER_DELTA_MIN..STEER_DELTA_MAX) into one byte"""
+    return (left & 0x0F) | ((right & 0x0F) << 4)
+
+
+def signed_nibble(value):
+    """Signed value of the low 4 bits, unpacks one half of a STEER_DELTA"""
+    value &= 0x0F
+    return value - 16 if value & 0x08 else value
+
+
+def _build_crc_table():
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ 0x07) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+        table[i] = crc
+    return table
+
+
+_CRC_TABLE = _build_crc_table()
+
+
+def crc8(data, start, end):
+    """CRC-8 (poly 0x07) over data[start:end]"""
+    crc = 0
+    table = _CRC_TABLE
+    for i in range(start, end):
+        crc = table[crc ^ data[i]]
+    return crc
+
+
+def _build_payload_sizes():
+    sizes = {}
+    for opcode, layout in FIELDS.items():
+        size = 0
+        for field in layout:
+            size += _FIELD_SIZE[field]
+        sizes[opcode] = size
+    return sizes
+
+
+_PAYLOAD_SIZES = _build_payload_sizes()
+
+
+def payload_size(opcode):
+    """Fixed payload size of an opcode, None if the opcode is unknown"""
+    return _PAYLOAD_SIZES.get(opcode)
+
+
+def _keyword_at(data, start, end, keyword):
+    """True if data[start:end] is keyword (upper case bytes), ignoring case"""
+    if end - start != len(keyword):
+        return False
+    for i in range(end - start):
+        c = data[start + i]
+        if 0x61 <= c <= 0x7A:
+            c -= 0x20
+        if c != keyword[i]:
+            return False
+    return True
+
+
+def _field_end(data, start, end):
+    """Index of the ':' ending the text field at data[start], end if it is the last"""
+    for i in range(start, end):
+        if data[i] == 0x3A:
+            return i
+    return end
+
+
+def _number_at(data, start, end):
+    """Decimal number in data[start:end], -1 if it is not one"""
+    if start >= end:
+        return -1
+    value = 0
+    for i in range(start, end):
+        digit = data[i] - 0x30
+        if not 0 <= digit <= 9:
+            return -1
+        value = value * 10 + digit
+    return value
+
+
+def opcode_name(opcode):
+    """Readable name of an opcode, for logging"""
+    return OPCODE_NAMES.get(opcode, "0x%02X" % opcode)
+
+
+class Encoder:
+    """Builds frames into a preallocated buffer"""
+
+    def __init__(self):
+        self._buf = bytearray(FRAME_MAX)
+        self._view = memoryview(self._buf)
+
+    def encode(self, opcode, arg0=0, arg1=0, seq=0):
+        """
+        Encode a binary frame
+        Returns: memoryview over the internal buffer, valid until the next call
+        """
+        return self._view[:self.encode_into(self._buf, 0, opcode, arg0, arg1, seq)]
+
+    def encode_into(self, buf, start, opcode, arg0=0, arg1=0, seq=0):
+        """
+        Encode a binary frame straight into buf at start, which must have
+        room for the whole frame. Nothing is allocated.
+        Returns: index just past the frame
+        """
+        pos = start + HEADER_SIZE
+        args = 0
+        for field in FIELDS.get(opcode, ""):
+            value = arg0 if args == 0 else arg1
+            args += 1
+            if field == "H":
+                buf[pos] = value & 0xFF
+                buf[pos + 1] = (value >> 8) & 0xFF
+                pos += 2
+            else:
+                buf[pos] = value & 0xFF
+                pos += 1
+        buf[start] = MAGIC
+        buf[start + 1] = pos - start - HEADER_SIZE
+        buf[start + 3] = seq
+        buf[start + 4] = opcode
+        buf[start + 2] = crc8(buf, start + 3, pos)
+        return pos
+
+    def encode_text(self, opcode, arg0=0, arg1=0):
+        """Encode a frame using the text protocol, prebuilt for opcodes without arguments"""
+        if opcode == OP_LEVEL:
+            return f"LEVEL:{arg0}:{DIFFICULTIES[arg1]}\n".encode("utf-8")
+        if opcode == OP_HELLO:
+            return f"HELLO:{arg0}\n".encode("utf-8")
+        line = _TEXT_LINES.get(opcode)
+        if line is None:
+            line = f"{opcode_name(opcode)}\n".encode("utf-8")
+        return line
+
+
+class Decoder:
+    """
+    Parses one frame (binary or text) at a time.
+    After parse() returns a non-zero length, the decoded frame is available
+    as opcode, arg0, arg1 and seq.
+    """
+
+    def __init__(self):
+        self.opcode = OP_INVALID
+        self.arg0 = 0
+        self.arg1 = 0
+        self.seq = 0
+        self.binary = False
+
+    def parse(self, data, start, end):
+        """
+        Parse the frame starting at data[start], stopping before data[end]
+        Returns: number of bytes consumed, 0 if the frame is incomplete.
+        A consumed frame that could not be decoded has opcode OP_INVALID.
+        """
+        self.opcode = OP_INVALID
+        self.arg0 = 0
+        self.arg1 = 0
+        self.seq = 0
+        if start >= end:
+            return 0
+        if data[start] == MAGIC:
+            self.binary = True
+            return self._parse_binary(data, start, end)
+        self.binary = False
+        return self._parse_text(data, start, end)
+
+    def _parse_binary(self, data, start, end):
+        if end - start < HEADER_SIZE:
+            return 0
+        length = data[start + 1]
+        if length > PAYLOAD_MAX:
+            # Corrupt header, skip the magic byte and resync
+            return 1
+        total = HEADER_SIZE + length
+        if end - start < total:
+            return 0
+        if crc8(data, start + 3, start + total) != data[start + 2]:
+            return 1
+        opcode = data[start + 4]
+        if payload_size(opcode) != length:
+            return total
+        pos = start + HEADER_SIZE
+        args = 0
+        for field in FIELDS[opcode]:
+            if field == "H":
+                value = data[pos] | (data[pos + 1] << 8)
+                pos += 2
+            elif field == "b":
+                value = data[pos]
+                if value > 127:
+                    value -= 256
+                pos += 1
+            else:
+                value = data[pos]
+                pos += 1
+            if args == 0:
+                self.arg0 = value
+            else:
+                self.arg1 = value
+            args += 1
+        self.seq = data[start + 3]
+        self.opcode = opcode
+        return total
+
+    def _parse_text(self, data, start, end):
+        newline = -1
+        for i in range(start, end):
+            if data[i] == 0x0A:
+                newline = i
+                break
+            if data[i] == MAGIC:
+                # Binary frame follows an unterminated line, drop the line
+                return i - start
+        if newline < 0:
+            return 0
+        # Strip surrounding whitespace (and the CR of CRLF lines)
+        first = start
+        last = newline
+        while first < last and data[first] <= 0x20:
+            first += 1
+        while last > first and data[last - 1] <= 0x20:
+            last -= 1
+        self.parse_line(data, first, last)
+        return newline + 1 - start
+
+    def parse_line(self, data, start, end):
+        """Decode one line of the text protocol in data[start:end], in place"""
+        colon = _field_end(data, start, end)
+        opcode = OP_INVALID
+        for keyword, op in _TEXT_KEYWORDS:
+            if _keyword_at(data, start, colon, keyword):
+                opcode = op
+                break
+        if opcode == OP_LEVEL or opcode == OP_HELLO:
+            start = colon + 1
+            colon = _field_end(data, start, end)
+            self.arg0 = _number_at(data, start, colon)
+            if self.arg0 < 0:
+                opcode = OP_INVALID
+        if opcode == OP_LEVEL:
+            start = colon + 1
+            colon = _field_end(data, start, end)
+            self.arg1 = -1
+            for index in range(len(_DIFFICULTY_KEYWORDS)):
+                if _keyword_at(data, start, colon, _DIFFICULTY_KEYWORDS[index]):
+                    self.arg1 = index
+                    break
+            if self.arg1 < 0:
+                opcode = OP_INVALID
+        self.opcode = opcode
@@ -0,0 +1,73 @@
+from protocol import signed_nibble
+
+
+class SteeringReceiver:
+    """
+    Scrappy's end of the manual-mode steering stream.
+
+    steer() and delta() rebuild the controller's (left, right) wheel speeds
+    from STEER and STEER_DELTA frames, apply() hands them to drive once per
+    link tick. Only a change of the speeds reaches the wheels: frames that
+    repeat them (the controller's periodic STEER) leave a button move made
+    in between running. After a missing delta the speeds are unknown, deltas
+    are ignored until the next STEER.
+    """
+
+    MAX_SPEED = 100  # %
+
+    def __init__(self, drive):
+        """
+        Args:
+            drive: Called with (left, right) in % when the speeds change
+        """
+        self.drive = drive
+        self.stop()
+
+    def stop(self):
+        """Forget the stream, call when the wheels were stopped"""
+        self.left = 0
+        self.right = 0
+        self.counter = 0
+        self.synced = False
+        self.changed = False
+        self.last_time = 0  # arrival of the last frame, 0 while not steering
+
+    def steer(self, left, right, now):
+        """STEER: both speeds, (re)starts the stream"""
+        self.counter = 0
+        self.synced = True
+        self.last_time = now
+        self._set(left, right)
+
+    def delta(self, counter, packed, now):
+        """
+        STEER_DELTA: change of both speeds since the previous frame
+        Returns: False if the frame was ignored (stream not synced or a frame went missing)
+        """
+        if not self.synced:
+            return False
+        if counter != (self.counter + 1) & 0xFF:
+            self.synced = False
+            return False
+        self.counter = counter
+        self.last_time = now
+        limit = self.MAX_SPEED
+        self._set(max(-limit, min(limit, self.left + signed_nibble(packed))),
+                  max(-limit, min(limit, self.right + signed_nibble(packed >> 4))))
+        return True
+
+    def _set(self, left, right):
+        if left != self.left or right != self.right:
+            self.left = left
+            self.right = right
+            self.changed = True
+
+    def apply(self):
+        """Drive the wheels if the speeds changed since the last call"""
+        if self.changed:
+            self.changed = False
+            self.drive(self.left, self.right)
+
+    def stale(self, now, timeout):
+        """True if the stream went quiet for more than timeout seconds"""
+        return self.last_time != 0 and now - self.last_time > timeout
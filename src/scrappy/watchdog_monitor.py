@@ -0,0 +1,241 @@
+import gc
+import time
+
+try:
+    import microcontroller
+    from watchdog import WatchDogMode
+except ImportError:
+    # Running on a host, use HostWatchdog instead
+    microcontroller = None
+    WatchDogMode = None
+
+try:
+    import alarm
+except ImportError:
+    alarm = None
+
+# This file is shared between the controller and Scrappy.
+
+
+class HostWatchdog:
+    """Stand-in for microcontroller.watchdog when running on a host"""
+
+    def __init__(self):
+        self.timeout = None
+        self.mode = None
+        self.feeds = 0
+        self.last_feed = time.monotonic()
+
+    def feed(self):
+        self.feeds += 1
+        self.last_feed = time.monotonic()
+
+    def deinit(self):
+        self.mode = None
+
+    def expired(self, now=None):
+        """True if the real watchdog would have reset the board by now"""
+        if now is None:
+            now = time.monotonic()
+        return self.mode is not None and now - self.last_feed > self.timeout
+
+
+class StallMonitor:
+    """
+    Feeds the hardware watchdog from the main loop and profiles how long
+    each code region runs.
+
+    Code regions are wrapped in begin(region) / end(). The longest run of
+    every region is kept in RAM, and every run longer than stall_threshold
+    is written to a small ring buffer in persistent memory
+    (alarm.sleep_memory), together with the region currently running. After
+    a watchdog reset, report() names the region that never finished.
+    Regions listed in waits wrap intentional blocking waits (scanning,
+    advertising), their longest run is kept but they are never logged, so
+    they can't push real stalls out of the ring.
+
+    With track_allocations every run also counts the heap bytes it
+    allocated (gc.mem_alloc() before and after). The hot regions are meant
+    to allocate nothing, print_stats() names every region that did. Runs
+    during which the VM collected can't be measured and are not counted,
+    hold automatic collection off (MemoryManager.hold()) for exact numbers.
+
+    Persistent memory layout:
+        [0] MAGIC
+        [1] next ring slot
+        [2] region running right now (NO_REGION when idle)
+        [3...] RING_SIZE records of (region, stall ms low, stall ms high)
+    """
+
+    MAGIC = 0x5A
+    NO_REGION = 0xFF
+    RING_SIZE = 8
+    RECORD_SIZE = 3
+    HEADER_SIZE = 3
+    MEMORY_SIZE = HEADER_SIZE + RING_SIZE * RECORD_SIZE
+
+    def __init__(self, regions, timeout=8.0, stall_threshold=0.1,
+                 watchdog=None, memory=None, offset=0, track_allocations=False, waits=()):
+        """
+        Args:
+            regions: Tuple of region names, a region's id is its index
+            timeout: Watchdog timeout in seconds (default 8.0)
+            stall_threshold: Runs longer than this are logged (default 0.1 s)
+            watchdog: Watchdog to feed (default microcontroller.watchdog)
+            memory: Persistent byte buffer (default alarm.sleep_memory)
+            offset: Where the stall log starts in memory (default 0)
+            track_allocations: Count the bytes every run allocates (default False)
+            waits: Ids of regions that are expected to block, never logged
+        """
+        self.regions = regions
+        self.timeout = timeout
+        self.stall_threshold = stall_threshold
+        self.max_stall = [0.0] * len(regions)
+        self.runs = [0] * len(regions)
+        self._waits = bytearray(len(regions))
+        for region in waits:
+            self._waits[region] = 1
+
+        # Allocation probe, CPython has no mem_alloc so it is off on a host
+        self._mem_alloc = getattr(gc, "mem_alloc", None) if track_allocations else None
+        self._alloc_start = 0
+        self.allocating_runs = [0] * len(regions)
+        self.max_allocated = [0] * len(regions)
+
+        if watchdog is None:
+            watchdog = microcontroller.watchdog if microcontroller else HostWatchdog()
+        self.watchdog = watchdog
+
+        if memory is None:
+            memory = alarm.sleep_memory if alarm else bytearray(offset + self.MEMORY_SIZE)
+        self._mem = memory
+        self._offset = offset
+
+        self._region = self.NO_REGION
+        self._start = 0
+        self.running = False
+
+        # Look at what the last boot left behind before it is overwritten
+        self.last_region = self.NO_REGION
+        self.watchdog_reset = False
+        if self._mem[offset] == self.MAGIC:
+            self.last_region = self._mem[offset + 2]
+        else:
+            self.clear_log()
+        if microcontroller:
+            reason = microcontroller.cpu.reset_reason
+            self.watchdog_reset = reason == microcontroller.ResetReason.WATCHDOG
+        self._mem[offset + 2] = self.NO_REGION
+
+    def start(self):
+        """Arm the watchdog, the main loop must call feed() from now on"""
+        self.watchdog.timeout = self.timeout
+        self.watchdog.mode = WatchDogMode.RESET if WatchDogMode else "RESET"
+        self.watchdog.feed()
+        self.running = True
+        print(f"Watchdog armed ({self.timeout}s)")
+
+    def stop(self):
+        """Disarm the watchdog"""
+        if self.running:
+            self.watchdog.deinit()
+            self.running = False
+
+    def feed(self):
+        """Feed the watchdog, call once per main loop iteration"""
+        if self.running:
+            self.watchdog.feed()
+
+    # ===== REGION PROFILING =====
+
+    def begin(self, region):
+        """Mark the start of a code region"""
+        self._region = region
+        self._start = time.monotonic()
+        self._mem[self._offset + 2] = region
+        if self._mem_alloc is not None:
+            self._alloc_start = self._mem_alloc()
+
+    def end(self):
+        """Mark the end of the current code region"""
+        region = self._region
+        if region == self.NO_REGION:
+            return
+        if self._mem_alloc is not None:
+            # Negative if a collection ran in between, that run is not counted
+            allocated = self._mem_alloc() - self._alloc_start
+            if allocated > 0:
+                self.allocating_runs[region] += 1
+                if allocated > self.max_allocated[region]:
+                    self.max_allocated[region] = allocated
+        stall = time.monotonic() - self._start
+        self.runs[region] += 1
+        if stall > self.max_stall[region]:
+            self.max_stall[region] = stall
+        if stall >= self.stall_threshold and not self._waits[region]:
+            self._log(region, stall)
+        self._region = self.NO_REGION
+        self._mem[self._offset + 2] = self.NO_REGION
+
+    def _log(self, region, stall):
+        mem = self._mem
+        base = self._offset
+        slot = mem[base + 1]
+        ms = min(0xFFFF, int(stall * 1000))
+        pos = base + self.HEADER_SIZE + slot * self.RECORD_SIZE
+        mem[pos] = region
+        mem[pos + 1] = ms & 0xFF
+        mem[pos + 2] = ms >> 8
+        mem[base + 1] = (slot + 1) % self.RING_SIZE
+
+    def clear_log(self):
+        """Empty the persistent stall log"""
+        base = self._offset
+        self._mem[base] = self.MAGIC
+        self._mem[base + 1] = 0
+        self._mem[base + 2] = self.NO_REGION
+        for i in range(self.RING_SIZE * self.RECORD_SIZE):
+            self._mem[base + self.HEADER_SIZE + i] = self.NO_REGION if i % self.RECORD_SIZE == 0 else 0
+
+    def region_name(self, region):
+        if region < len(self.regions):
+            return self.regions[region]
+        return "?"
+
+    def logged_stalls(self):
+        """Returns: list of (region name, stall ms) from the persistent log, oldest first"""
+        base = self._offset
+        slot = self._mem[base + 1]
+        stalls = []
+        for i in range(self.RING_SIZE):
+            pos = base + self.HEADER_SIZE + ((slot + i) % self.RING_SIZE) * self.RECORD_SIZE
+            region = self._mem[pos]
+            if region != self.NO_REGION:
+                stalls.append((self.region_name(region), self._mem[pos + 1] | (self._mem[pos + 2] << 8)))
+        return stalls
+
+    def report(self):
+        """Print what the previous boot left in the stall log"""
+        if self.watchdog_reset:
+            if self.last_region != self.NO_REGION:
+                print(f"Watchdog reset! Stuck in region: {self.region_name(self.last_region)}")
+            else:
+                print("Watchdog reset! No region was running")
+        for name, ms in self.logged_stalls():
+            print(f"Stall: {name} {ms}ms")
+
+    def print_stats(self):
+        """Print the longest run of every region since boot, and what allocated"""
+        for region in range(len(self.regions)):
+            if self.runs[region]:
+                print(f"{self.regions[region]}: max {self.max_stall[region] * 1000:.0f}ms over {self.runs[region]} runs")
+        if self._mem_alloc is None:
+            return
+        clean = True
+        for region in range(len(self.regions)):
+            if self.allocating_runs[region]:
+                clean = False
+                print(f"{self.regions[region]}: allocated in {self.allocating_runs[region]} of "
+                      f"{self.runs[region]} runs, up to {self.max_allocated[region]} bytes")
+        if clean:
+            print("Allocations: none in any region")
@@ -0,0 +1,32 @@
+"""
+Host test setup.
+
+The firmware runs on CircuitPython, tests run it on CPython against the
+stand-ins in tests/fakes (board, busio, digitalio, pwmio, a simulated
+ADXL345 on the I2C bus, the BLE UART and the display libraries). Both device directories are importable: shared
+modules are identical copies, and Scrappy's accelerometer.py is the one
+found, the controller's is not under test. They go after the standard
+library on the path, code.py would shadow the stdlib code module.
+"""
+import os
+import sys
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TESTS)
+SRC = os.path.join(ROOT, "src")
+
+for path in (os.path.join(TESTS, "fakes"), os.path.join(SRC, "scrappy"),
+             os.path.join(SRC, "controller")):
+    if path not in sys.path:
+        sys.path.append(path)
+
+
+@pytest.fixture
+def adxl():
+    """The simulated ADXL345 on board.I2C(), emptied for every test"""
+    import board
+    sim = board.I2C().devices[0x53]
+    sim.fifo.clear()
+    return sim
@@ -0,0 +1,12 @@
+class BLERadio:
+    """A radio that is connected as soon as a test says so"""
+
+    def __init__(self):
+        self.connected = False
+        self.advertising = False
+
+    def start_advertising(self, advertisement):
+        self.advertising = True
+
+    def stop_advertising(self):
+        self.advertising = False
@@ -0,0 +1,3 @@
+class ProvideServicesAdvertisement:
+    def __init__(self, *services):
+        self.services = services
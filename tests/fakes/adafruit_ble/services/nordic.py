@@ -0,0 +1,36 @@
+class UARTService:
+    """BLE UART that replays the bytes given to feed() and counts what is written"""
+
+    def __init__(self, size=256):
+        self._data = bytearray(size)
+        self._pos = 0
+        self._len = 0
+        self.written = 0
+
+    def feed(self, data):
+        for i in range(len(data)):
+            self._data[self._len + i] = data[i]
+        self._len += len(data)
+
+    @property
+    def in_waiting(self):
+        return self._len - self._pos
+
+    def readinto(self, buf, nbytes=None):
+        if nbytes is None:
+            nbytes = len(buf)
+        nbytes = min(nbytes, self._len - self._pos)
+        for i in range(nbytes):
+            buf[i] = self._data[self._pos + i]
+        self._pos += nbytes
+        if self._pos == self._len:
+            self._pos = self._len = 0
+        return nbytes
+
+    def write(self, data):
+        self.written += len(data)
+
+    def read(self, nbytes=None):
+        data = bytes(self._data[self._pos:self._len])
+        self._pos = self._len = 0
+        return data
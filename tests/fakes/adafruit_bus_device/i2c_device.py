@@ -0,0 +1,11 @@
+class I2CDevice:
+    """Hands transfers to the simulated device at address on the fake bus"""
+
+    def __init__(self, i2c, device_address, probe=True):
+        self.target = i2c.devices[device_address]
+
+    def __enter__(self):
+        return self.target
+
+    def __exit__(self, *exc):
+        return False
@@ -0,0 +1,6 @@
+class Label:
+    def __init__(self, font, text="", x=0, y=0):
+        self.font = font
+        self.text = text
+        self.x = x
+        self.y = y
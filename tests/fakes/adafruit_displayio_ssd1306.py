@@ -0,0 +1,13 @@
+class SSD1306:
+    """Panel that counts the frames pushed to it"""
+
+    def __init__(self, bus=None, width=128, height=64):
+        self.width = width
+        self.height = height
+        self.auto_refresh = True
+        self.root_group = None
+        self.frames = 0
+
+    def refresh(self, target_frames_per_second=60):
+        self.frames += 1
+        return True
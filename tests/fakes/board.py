@@ -0,0 +1,33 @@
+"""
+Host stand-in for CircuitPython's board module.
+
+Pins are just their names. I2C() returns the same bus every call, like on
+a board, with a simulated ADXL345 at its default address.
+"""
+import busio
+from sim_adxl345 import SimADXL345
+
+SCK = "SCK"
+MISO = "MISO"
+MOSI = "MOSI"
+A0 = "A0"
+A1 = "A1"
+A2 = "A2"
+A3 = "A3"
+D0 = "D0"
+D1 = "D1"
+D2 = "D2"
+D3 = "D3"
+D8 = "D8"
+D9 = "D9"
+D10 = "D10"
+
+_i2c = None
+
+
+def I2C():
+    global _i2c
+    if _i2c is None:
+        _i2c = busio.I2C(None, None)
+        _i2c.devices[SimADXL345.ADDRESS] = SimADXL345()
+    return _i2c
@@ -0,0 +1,5 @@
+class I2C:
+    """Simulated I2C bus, devices are looked up by address"""
+
+    def __init__(self, scl, sda, frequency=400000):
+        self.devices = {}
@@ -0,0 +1,8 @@
+class PWMOut:
+    def __init__(self, pin, frequency=500, duty_cycle=0):
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = duty_cycle
+
+    def deinit(self):
+        pass
@@ -0,0 +1,46 @@
+class SimADXL345:
+    """
+    Register-level ADXL345. Tests queue samples (raw counts) with push(),
+    every read of the data registers pops one like the real FIFO. With an
+    empty FIFO the data registers read rest.
+    """
+
+    ADDRESS = 0x53
+    FIFO_SIZE = 32
+    _REG_DEVID = 0x00
+    _REG_INT_SOURCE = 0x30
+    _REG_DATAX0 = 0x32
+    _REG_FIFO_STATUS = 0x39
+
+    def __init__(self):
+        self.registers = bytearray(64)
+        self.registers[self._REG_DEVID] = 0xE5
+        self.fifo = []
+        self.rest = (0, 0, 256)
+
+    def push(self, x, y, z):
+        """Queue one sample, the oldest is dropped when the FIFO is full (stream mode)"""
+        if len(self.fifo) == self.FIFO_SIZE:
+            self.fifo.pop(0)
+        self.fifo.append((x, y, z))
+
+    def write(self, buffer):
+        if len(buffer) >= 2:
+            self.registers[buffer[0]] = buffer[1]
+
+    def write_then_readinto(self, out_buffer, in_buffer):
+        register = out_buffer[0]
+        if register == self._REG_FIFO_STATUS:
+            in_buffer[0] = len(self.fifo)
+        elif register == self._REG_DATAX0:
+            sample = self.fifo.pop(0) if self.fifo else self.rest
+            for axis in range(3):
+                value = sample[axis] & 0xFFFF
+                in_buffer[axis * 2] = value & 0xFF
+                in_buffer[axis * 2 + 1] = value >> 8
+        elif register == self._REG_INT_SOURCE:
+            in_buffer[0] = self.registers[register]
+            self.registers[register] = 0
+        else:
+            for i in range(len(in_buffer)):
+                in_buffer[i] = self.registers[register + i]
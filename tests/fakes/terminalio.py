@@ -0,0 +1 @@
+FONT = "terminalio.FONT"
@@ -0,0 +1,66 @@
+import math
+
+import pytest
+
+import calibration
+
+ONE_G = 256  # counts at full resolution, 3.9 mg each
+
+
+@pytest.fixture
+def monitor(adxl, monkeypatch):
+    from accelerometer import AccelerometerMonitor
+    monkeypatch.setattr(calibration.time, "sleep", lambda seconds: None)
+    monitor = AccelerometerMonitor()
+    monitor.calibrate()
+    monitor.reset()
+    return monitor
+
+
+def tilted(adxl, degrees, samples=20):
+    """Queue samples of the robot resting tipped over by degrees"""
+    angle = math.radians(degrees)
+    for _ in range(samples):
+        adxl.push(round(ONE_G * math.sin(angle)), 0, round(ONE_G * math.cos(angle)))
+
+
+def test_level_robot_stays_alive(monitor, adxl):
+    tilted(adxl, 0)
+    assert not monitor.check_impact()
+
+
+def test_robot_on_its_side_is_dead(monitor, adxl):
+    tilted(adxl, 90)
+    assert monitor.check_impact()
+
+
+def test_upside_down_robot_is_dead(monitor, adxl):
+    tilted(adxl, 180)
+    assert monitor.check_impact()
+
+
+def test_slope_is_not_a_fall(monitor, adxl):
+    tilted(adxl, 30)
+    assert not monitor.check_impact()
+
+
+def test_single_bump_is_not_a_fall(monitor, adxl):
+    tilted(adxl, 0, samples=5)
+    adxl.push(0, 0, ONE_G + monitor.sensor.to_counts(8))
+    tilted(adxl, 0, samples=14)
+    assert not monitor.check_impact()
+
+
+def test_hard_knock_is_not_a_fall(monitor, adxl):
+    tilted(adxl, 0, samples=5)
+    for _ in range(2):
+        adxl.push(0, 0, ONE_G - monitor.sensor.to_counts(20))
+    tilted(adxl, 0, samples=20)
+    assert not monitor.check_impact()
+
+
+def test_flip_after_a_knock_is_a_fall(monitor, adxl):
+    tilted(adxl, 0, samples=5)
+    adxl.push(0, 0, ONE_G + monitor.sensor.to_counts(20))
+    tilted(adxl, 180)
+    assert monitor.check_impact()
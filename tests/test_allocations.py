@@ -0,0 +1,386 @@
+"""
+The steady-state hot paths must not allocate.
+
+CircuitPython has no tracemalloc, on the host every opcode executed in
+src/ is traced instead (AllocationTracer). Whatever traced memory an
+opcode leaves behind is an allocation made by that opcode, even if it is
+freed again later in the same step, so per-iteration garbage is caught.
+"""
+import array
+import dis
+import gc
+import importlib.util
+import os
+import sys
+import tracemalloc
+import types
+
+import pytest
+
+from display import DisplayManager
+from game_state import (
+    GameStateMachine, STATE_PLAYING,
+    EVENT_LINK, EVENT_FRAME, EVENT_BUTTON, EVENT_STEER, EVENT_TIMER, TASK_TIMER, TASK_LINK, TASK_BUTTONS,
+    TASK_STEER,
+)
+from gestures import GestureRecognizer
+from adafruit_ble.services.nordic import UARTService
+from adafruit_displayio_ssd1306 import SSD1306
+from command_channel import CommandChannel
+from heartbeat import HeartbeatSender
+from link import Link, FrameBatch
+from motor_driver import MotorDriver, SimBackend, CHANNEL_A, CHANNEL_B, FORWARD, BACKWARD
+from protocol import (
+    Encoder, OP_ACK, OP_DEAD, OP_LEVEL, OP_MODE, OP_PING, OP_PONG, OP_STEER, OP_STEER_DELTA, OP_UP,
+    MODE_MANUAL, SESSION_ACKLESS_MOVES, SESSION_STATE_EVENTS,
+)
+from steering import SteeringStream
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+WARM_UP = 20  # steps before tracing, for one-time setup like first-use caches
+ITERATIONS = 100
+
+# CircuitPython keeps small ints and floats in the object reference, CPython
+# boxes them. Anything an opcode leaves behind up to this size is one of them.
+NUMBER_SIZE = 32
+
+# A range() object with its length, what a CALL right before GET_ITER may leave
+RANGE_SIZE = sys.getsizeof(range(0)) + NUMBER_SIZE
+
+# Opcodes that allocate on any VM. CPython serves some of them from free
+# lists, which tracemalloc can't see, so they are flagged without measuring.
+ALLOCATING_OPCODES = frozenset((
+    "BUILD_TUPLE", "BUILD_LIST", "BUILD_SET", "BUILD_MAP", "BUILD_CONST_KEY_MAP", "BUILD_STRING",
+    "BUILD_SLICE", "FORMAT_VALUE", "MAKE_FUNCTION", "CALL_FUNCTION_EX", "LIST_TO_TUPLE",
+))
+
+
+class AllocationTracer:
+    """
+    Records every allocation made by an opcode of the firmware in src/.
+
+    A global trace function turns on opcode events for frames of src/
+    code. At every event the traced memory is compared with the reading
+    taken at the previous one, the difference belongs to the opcode that
+    ran in between. Not counted, since CircuitPython keeps them off the
+    heap: boxed ints and floats, for-loop iterators over builtins and
+    range() objects. A call also allocates the new frame object on
+    CPython, only what a call allocates beyond it is counted, and the first
+    traced call of a function is skipped, it sets up CPython's tracing.
+
+    The tracer keeps its state in preallocated arrays and lists, nothing
+    it allocates is alive when it takes a reading.
+    """
+
+    def __init__(self):
+        self.found = {}
+        self._marks = array.array("q", [0, -1])  # traced bytes at the last event, pending opcode offset
+        self._pending = [None]  # code object of the pending opcode
+        self._instructions = {}
+        self._called = set()
+        self._global = self._call
+        self._local = self._opcode
+
+    def run(self, step, iterations):
+        """
+        Call step(i) for i in range(iterations) under the tracer
+        Returns: one line per allocating opcode, empty if there were none
+        """
+        gc.collect()
+        tracemalloc.start()
+        sys.settrace(self._global)
+        try:
+            for i in range(iterations):
+                step(i)
+        finally:
+            sys.settrace(None)
+            tracemalloc.stop()
+        return sorted(f"{where}: {size} bytes" for where, size in self.found.items())
+
+    def _call(self, frame, event, arg):
+        marks = self._marks
+        code = frame.f_code
+        if code not in self._called:
+            self._called.add(code)
+        elif marks[1] >= 0 and tracemalloc.get_traced_memory()[0] - marks[0] - sys.getsizeof(frame) > NUMBER_SIZE:
+            self._record(self._pending[0], marks[1],
+                         tracemalloc.get_traced_memory()[0] - marks[0] - sys.getsizeof(frame))
+        marks[1] = -1
+        if code.co_filename.startswith(SRC):
+            frame.f_trace_lines = False
+            frame.f_trace_opcodes = True
+            marks[0] = tracemalloc.get_traced_memory()[0]
+            return self._local
+        marks[0] = tracemalloc.get_traced_memory()[0]
+        return None
+
+    def _opcode(self, frame, event, arg):
+        marks = self._marks
+        if marks[1] >= 0:
+            if tracemalloc.get_traced_memory()[0] - marks[0] > NUMBER_SIZE:
+                self._record(self._pending[0], marks[1], tracemalloc.get_traced_memory()[0] - marks[0])
+            elif self._opname(self._pending[0], marks[1]) in ALLOCATING_OPCODES:
+                self._record(self._pending[0], marks[1], 0)
+        if event == "opcode":
+            marks[1] = frame.f_lasti
+            self._pending[0] = frame.f_code
+        else:
+            marks[1] = -1
+        marks[0] = tracemalloc.get_traced_memory()[0]
+        return self._local
+
+    def _opname(self, code, offset):
+        instructions = self._instructions.get(code)
+        if instructions is None:
+            instructions = self._instructions[code] = self._decode(code)
+        return instructions[offset][0]
+
+    def _decode(self, code):
+        """Returns: {offset: (opname, next opname, line)} for a code object"""
+        decoded = {}
+        listing = list(dis.get_instructions(code))
+        line = code.co_firstlineno
+        for i, instruction in enumerate(listing):
+            if instruction.starts_line is not None:
+                line = instruction.starts_line
+            following = listing[i + 1].opname if i + 1 < len(listing) else None
+            decoded[instruction.offset] = (instruction.opname, following, line)
+        return decoded
+
+    def _record(self, code, offset, size):
+        self._opname(code, offset)
+        opname, following, line = self._instructions[code][offset]
+        if opname == "GET_ITER":
+            return
+        if opname == "CALL" and following == "GET_ITER" and size <= RANGE_SIZE:
+            return
+        where = f"{os.path.relpath(code.co_filename, SRC)}:{line} {opname}"
+        if size > self.found.get(where, -1):
+            self.found[where] = size
+
+
+def allocations(step):
+    """Lines of src/ that allocated during any of ITERATIONS steps after the warm-up"""
+    for i in range(WARM_UP):
+        step(i)
+    return AllocationTracer().run(lambda i: step(WARM_UP + i), ITERATIONS)
+
+
+def test_tracer_catches_garbage():
+    # A text-mode send builds its line with an f-string, which is freed again by the flush
+    uart = UARTService()
+    link = Link(uart)
+
+    def step(i):
+        link.send(OP_LEVEL, 1, 2)
+        link.flush()
+
+    found = allocations(step)
+    assert any(line.startswith(os.path.join("scrappy", "protocol.py")) for line in found), found
+
+
+def test_link_receive_allocates_nothing():
+    encoder = Encoder()
+    stream = bytearray()
+    for opcode, arg0, arg1, seq in ((OP_UP, 0, 0, 7), (OP_STEER, -40, 35, 0),
+                                    (OP_STEER_DELTA, 3, 0x1F, 0), (OP_PING, 0, 0, 9)):
+        stream += encoder.encode(opcode, arg0, arg1, seq)
+    stream += b"LEVEL:2:MEDIUM\r\n"
+    stream = bytes(stream)
+    uart = UARTService()
+    link = Link(uart)
+    link.binary = True
+    batch = FrameBatch()
+
+    def step(i):
+        # Odd lengths make frames wrap around the end of the receive ring
+        uart.feed(stream[:i % 7])
+        link.poll()
+        link.read_batch(batch)
+        uart.feed(stream[i % 7:])
+        link.poll()
+        link.read_batch(batch)
+
+    assert allocations(step) == []
+    assert batch.count
+
+
+def test_link_send_allocates_nothing():
+    uart = UARTService()
+    link = Link(uart)
+    link.binary = True
+
+    def step(i):
+        link.send(OP_ACK, seq=i & 0xFF or 1)
+        link.send(OP_STEER, -i & 0x7F, i & 0x7F)
+        link.send(OP_MODE, i & 3)
+        link.flush()
+
+    assert allocations(step) == []
+    assert uart.written
+
+
+def test_encode_into_allocates_nothing():
+    encoder = Encoder()
+    buf = bytearray(64)
+
+    def step(i):
+        pos = encoder.encode_into(buf, 0, OP_LEVEL, i & 0xFF, i % 3, i & 0xFF)
+        pos = encoder.encode_into(buf, pos, OP_STEER, -(i & 0x7F), i & 0x7F)
+        encoder.encode_into(buf, pos, OP_DEAD)
+
+    assert allocations(step) == []
+
+
+def test_gesture_update_allocates_nothing():
+    gestures = GestureRecognizer(peak_threshold=80, tilt_threshold=60, tilt_spread=20, cooldown=0.05)
+    # Shakes, flicks, tilts and rest, so every branch of update() runs
+    pattern = [(150, 0, 0), (-150, 0, 0)] * 4 + [(120, 0, 0)] + [(0, 0, 0)] * 20 + [(0, 90, 0)] * 40
+    steps = WARM_UP + ITERATIONS
+    samples = [pattern[i % len(pattern)] for i in range(steps)]
+    times = [i * 0.01 for i in range(steps)]
+    found = [0]
+
+    def step(i):
+        x, y, z = samples[i]
+        if gestures.update(x, y, z, times[i]):
+            found[0] += 1
+
+    assert allocations(step) == []
+    assert found[0]
+
+
+def test_steering_send_allocates_nothing():
+    stream = SteeringStream(full_tilt=128)
+    channel = CommandChannel(Link(UARTService()))
+    channel.link.binary = True
+    tilts = [((i * 37) % 256 - 128, (i * 11) % 256 - 128) if i % 40 < 30 else (0, 0)
+             for i in range(WARM_UP + ITERATIONS)]
+
+    def step(i):
+        tilt_x, tilt_y = tilts[i]
+        stream.send(channel, tilt_x, tilt_y)
+        channel.link.flush()
+
+    assert allocations(step) == []
+    assert stream.key_frames and stream.delta_frames and stream.skipped
+
+
+@pytest.mark.parametrize("direction", (FORWARD, BACKWARD))
+def test_motor_update_allocates_nothing(direction):
+    driver = MotorDriver(SimBackend())
+    driver.set_channel(CHANNEL_A, direction, 100, now=0.0)
+    driver.set_channel(CHANNEL_B, direction, 60, now=0.0)
+    times = [0.05 + i * 0.001 for i in range(WARM_UP + ITERATIONS)]  # kick, then still ramping at the end
+
+    def step(i):
+        driver.update(times[i])
+
+    assert allocations(step) == []
+    assert driver.writes
+
+
+class Sleep:
+    """Reusable awaitable like CircuitPython's asyncio.sleep(), suspends the task once"""
+
+    def __init__(self):
+        self.slept = False
+
+    def __await__(self):
+        return self
+
+    def __next__(self):
+        if self.slept:
+            self.slept = False
+            raise StopIteration
+        self.slept = True
+
+
+@pytest.fixture
+def scrappy(monkeypatch):
+    """Scrappy's code.py, loaded without starting it, connected and playing manual mode"""
+    spec = importlib.util.spec_from_file_location("scrappy_code", os.path.join(SRC, "scrappy", "code.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sleep = Sleep()
+    monkeypatch.setattr(module, "asyncio", types.SimpleNamespace(sleep=lambda delay: sleep))
+    monkeypatch.setattr(module.motor, "verbose", False)
+    module.motor.use_backend(SimBackend())
+    module.ble.connected = True
+    module.link.binary = True
+    module.session_flags = SESSION_ACKLESS_MOVES | SESSION_STATE_EVENTS
+    module.state = "MANUAL"
+    module.manual_mode_end_time = float("inf")
+    return module
+
+
+def test_scrappy_link_task_allocates_nothing(scrappy):
+    encoder = Encoder()
+    # One read of each kind: a heartbeat, the steering stream and a button move
+    ping = bytes(encoder.encode(OP_PING, 0x1234, 30, 0))
+    steer = bytes(encoder.encode(OP_STEER, 40, 35, 0))
+    up = bytes(encoder.encode(OP_UP, 0, 0, 0))
+    reads = (
+        ping,
+        steer,
+        ping + encoder.encode(OP_STEER_DELTA, 1, 0x11, 0),
+        up + up,
+        ping + encoder.encode(OP_STEER_DELTA, 2, 0xFF, 0),
+        b"",
+    )
+    task = scrappy.link_task()
+
+    def step(i):
+        scrappy.uart.feed(reads[i % len(reads)])
+        task.send(None)
+
+    try:
+        assert allocations(step) == []
+    finally:
+        task.close()
+    assert scrappy.uart.written
+    assert scrappy.motor.left_command()
+    assert not scrappy.failsafe.tripped
+
+
+def test_controller_game_loop_allocates_nothing():
+    panel = SSD1306()
+    display = DisplayManager(panel)
+    uart = UARTService()
+    link = Link(uart)
+    link.binary = True
+    channel = CommandChannel(link, HeartbeatSender(link, interval=0.03))
+    channel.session_flags = SESSION_ACKLESS_MOVES
+    game = GameStateMachine(display, SteeringStream(full_tilt=128))
+    game.start(channel, 0.0)
+    game.go(STATE_PLAYING, 0.0)
+    game.dispatch(EVENT_FRAME, OP_MODE, MODE_MANUAL, 0.0)
+    tasks = game.tasks
+    encoder = Encoder()
+    pong = bytes(encoder.encode(OP_PONG, 0, 0, 0))
+    buttons = (None, None, "UP", "UP", None, "LEFT")
+
+    def step(i):
+        # One pass of the controller's session loop, time moves 10 ms per pass
+        now = 0.01 * i
+        if i % 3 == 0:
+            uart.feed(pong)
+        if tasks.due(TASK_LINK, now):
+            channel.service(now)
+            events = channel.events
+            for j in range(events.count):
+                game.dispatch(EVENT_FRAME, events.opcodes[j], events.arg0[j], now)
+            game.dispatch(EVENT_LINK, 0, 0, now)
+        if tasks.due(TASK_BUTTONS, now):
+            game.dispatch(EVENT_BUTTON, buttons[i % len(buttons)], 0, now)
+        if tasks.due(TASK_STEER, now):
+            game.dispatch(EVENT_STEER, (i * 7) % 100 - 50, (i * 3) % 100 - 50, now)
+        if tasks.due(TASK_TIMER, now):
+            game.dispatch(EVENT_TIMER, TASK_TIMER, 0, now)
+        link.flush()
+        display.refresh(now)
+
+    assert allocations(step) == []
+    assert game.state == STATE_PLAYING
+    assert panel.frames > 1
+    assert uart.written
@@ -0,0 +1,26 @@
+import gc
+
+from adafruit_displayio_ssd1306 import SSD1306
+from display import DisplayManager
+
+
+def test_lowest_free_heap_is_kept(monkeypatch):
+    heap = {"free": 50000}
+    monkeypatch.setattr(gc, "mem_free", lambda: heap["free"], raising=False)
+    display = DisplayManager(SSD1306(), release_screens=True)
+    assert display.screens_built == 1
+    assert display.min_free == 50000
+
+    heap["free"] = 42000  # the menu screen is being built
+    display.show_menu_screen()
+    heap["free"] = 47000  # released again once left
+    display.show_game_screen()
+    assert display.min_free == 42000
+    assert display.menu_title is None
+    assert display.screens_built == 3
+
+
+def test_no_heap_samples_on_a_host():
+    display = DisplayManager(SSD1306())
+    display.show_game_over_screen("Scrappy Died!")
+    assert display.min_free is None
@@ -0,0 +1,153 @@
+import types
+
+import pytest
+
+from adafruit_displayio_ssd1306 import SSD1306
+from display import DisplayManager
+from game_state import (
+    GameStateMachine, STATE_MENU, STATE_PLAYING, STATE_TRANSITION, STATE_GAME_OVER,
+    EVENT_LINK, EVENT_FRAME, EVENT_BUTTON, EVENT_ENCODER, EVENT_SHAKE, EVENT_TIMER, EVENT_GESTURE,
+    EVENT_STEER, TASK_TIMER, TASK_TRANSITION,
+)
+from gestures import GESTURE_FLICK_LEFT, GESTURE_FLICK_RIGHT, GESTURE_TILT_HOLD
+from protocol import (
+    OP_DEAD, OP_LEFT, OP_LEVEL, OP_MANUAL, OP_MANUAL_END, OP_MODE, OP_RIGHT, OP_STEER, OP_STOP, OP_UP,
+    MODE_AUTO, MODE_MANUAL,
+)
+from steering import SteeringStream
+
+
+class Channel:
+    """Records what the game sends, every command is acknowledged at once"""
+
+    def __init__(self):
+        self.link = types.SimpleNamespace(binary=True, discard_input=lambda: None)
+        self.sent = []
+
+    def reset(self):
+        pass
+
+    def send(self, opcode, arg0=0, arg1=0):
+        self.sent.append((opcode, arg0, arg1))
+        return 1
+
+    def send_move(self, opcode):
+        self.sent.append((opcode, 0, 0))
+        return False
+
+    def send_unacked(self, opcode, arg0=0, arg1=0):
+        self.sent.append((opcode, arg0, arg1))
+
+    def pop_lost(self):
+        return 0
+
+    def pop_acked(self):
+        return 0
+
+    def in_flight(self):
+        return 0
+
+
+@pytest.fixture
+def game():
+    game = GameStateMachine(DisplayManager(SSD1306()), SteeringStream(full_tilt=128))
+    game.start(Channel(), 0.0)
+    return game
+
+
+def opcodes(game):
+    sent = [opcode for opcode, _, _ in game.channel.sent]
+    game.channel.sent.clear()
+    return sent
+
+
+def play(game, now=0.0):
+    """Pick MEDIUM in the menu and start the first level"""
+    game.dispatch(EVENT_ENCODER, 1, 0, now)
+    game.dispatch(EVENT_BUTTON, "RIGHT", 0, now)
+    assert game.state == STATE_PLAYING
+    assert game.channel.sent == [(OP_LEVEL, 1, 1)]
+    game.channel.sent.clear()
+
+
+def test_menu_playing_manual_game_over(game):
+    display = game.display
+    assert game.state == STATE_MENU
+    assert display.is_menu_screen()
+    play(game)
+    assert display.is_game_screen()
+
+    # RIGHT is still held from the menu, it only moves Scrappy once pressed again
+    game.dispatch(EVENT_BUTTON, "RIGHT", 0, 0.1)
+    game.dispatch(EVENT_BUTTON, None, 0, 0.2)
+    game.dispatch(EVENT_BUTTON, "UP", 0, 0.3)
+    assert opcodes(game) == [OP_UP]
+
+    # Shake for manual mode, Scrappy reports it and tilt steering takes over
+    game.dispatch(EVENT_SHAKE, 0, 0, 1.0)
+    assert opcodes(game) == [OP_MANUAL]
+    game.dispatch(EVENT_FRAME, OP_MODE, MODE_MANUAL, 1.1)
+    assert game.steering_active
+    assert display.response_label.text == "Mode: MANUAL"
+    game.dispatch(EVENT_STEER, 40, -20, 1.2)
+    assert opcodes(game) == [OP_STEER]
+
+    game.dispatch(EVENT_FRAME, OP_MANUAL_END, 0, 6.1)
+    assert not game.steering_active
+    game.dispatch(EVENT_STEER, 40, -20, 6.2)
+    assert opcodes(game) == []
+
+    game.dispatch(EVENT_FRAME, OP_DEAD, 0, 7.0)
+    assert game.state == STATE_GAME_OVER
+    assert display.is_game_over_screen()
+    game.dispatch(EVENT_BUTTON, "UP", 0, 7.5)
+    assert opcodes(game) == []
+    game.dispatch(EVENT_SHAKE, 0, 0, 8.0)
+    assert game.state == STATE_MENU
+
+
+def test_unknown_mode_is_ignored(game):
+    play(game)
+    game.dispatch(EVENT_FRAME, OP_MODE, MODE_AUTO, 0.5)
+    game.dispatch(EVENT_FRAME, OP_MODE, 200, 0.6)
+    assert game.state == STATE_PLAYING
+    assert game.display.response_label.text == "Mode: AUTO"
+    assert not game.steering_active
+
+
+def test_level_timer_moves_to_the_next_level(game):
+    tasks = game.tasks
+    assert not tasks.due(TASK_TIMER, 0.0)
+    play(game)
+    now = 0.0
+    for _ in range(game.LEVEL1_LENGTH + 1):
+        now += 0.001  # the loop gets there a little after the deadline
+        assert tasks.due(TASK_TIMER, now)
+        game.dispatch(EVENT_TIMER, TASK_TIMER, 0, now)
+        if game.state != STATE_PLAYING:
+            break
+        now = tasks.deadlines[TASK_TIMER]
+    assert game.LEVEL1_LENGTH <= now < game.LEVEL1_LENGTH + 0.01
+    assert game.state == STATE_TRANSITION
+    assert opcodes(game) == [OP_STOP]
+
+    assert not tasks.due(TASK_TRANSITION, now + 1)
+    assert tasks.due(TASK_TRANSITION, now + game.TRANSITION_TIME)
+    game.dispatch(EVENT_TIMER, TASK_TRANSITION, 0, now + game.TRANSITION_TIME)
+    assert game.channel.sent == [(OP_LEVEL, 2, 1)]
+    game.dispatch(EVENT_LINK, 0, 0, now + game.TRANSITION_TIME + 0.1)
+    assert game.state == STATE_PLAYING
+    assert game.level_length == game.LEVEL1_LENGTH + game.ADD_TIME
+
+
+def test_flicks_turn_scrappy(game):
+    play(game)
+    game.dispatch(EVENT_GESTURE, GESTURE_FLICK_LEFT, 0.8, 0.5)
+    game.dispatch(EVENT_GESTURE, GESTURE_FLICK_RIGHT, 0.8, 0.6)
+    game.dispatch(EVENT_GESTURE, GESTURE_TILT_HOLD, 0.8, 0.7)
+    assert opcodes(game) == [OP_LEFT, OP_RIGHT]
+
+    # Not while tilt steering drives the wheels
+    game.dispatch(EVENT_FRAME, OP_MODE, MODE_MANUAL, 1.0)
+    game.dispatch(EVENT_GESTURE, GESTURE_FLICK_LEFT, 0.8, 1.1)
+    assert opcodes(game) == []
@@ -0,0 +1,84 @@
+import math
+
+from gestures import (
+    GestureRecognizer, GESTURE_SHAKE, GESTURE_FLICK_LEFT, GESTURE_FLICK_RIGHT,
+    GESTURE_TILT_HOLD,
+)
+
+RATE = 100  # Hz, the ADXL345 default
+PEAK = 80  # counts, about 15 m/s^2 at +-4g
+TILT = 60
+SPREAD = 20
+
+
+def recognizer():
+    return GestureRecognizer(PEAK, TILT, SPREAD, cooldown=0.5)
+
+
+def feed(gestures, samples, start=0.0):
+    """Feed (x, y, z) samples 10 ms apart, returns the gestures reported"""
+    found = []
+    for i, (x, y, z) in enumerate(samples):
+        gesture = gestures.update(x, y, z, start + i / RATE)
+        if gesture:
+            found.append(gesture)
+    return found
+
+
+def rest(seconds):
+    return [(0, 0, 0)] * int(seconds * RATE)
+
+
+def swing(hz, amplitude, seconds, axis=0):
+    """A sine swing on one axis, like a hand shaking the controller"""
+    samples = []
+    for i in range(int(seconds * RATE)):
+        value = int(amplitude * math.sin(2 * math.pi * hz * i / RATE))
+        samples.append(tuple(value if a == axis else 0 for a in range(3)))
+    return samples
+
+
+def flick(sign):
+    """A quick push on X and the smaller opposite peak that stops it"""
+    push = [(sign * v, 0, 0) for v in (40, 120, 180, 150, 90, 30)]
+    stop = [(-sign * v, 0, 0) for v in (50, 100, 60, 10)]
+    return push + stop + rest(0.3)
+
+
+def test_ordinary_hand_shake_is_a_shake():
+    # Two back and forth swings at 3 Hz
+    found = feed(recognizer(), rest(0.1) + swing(3, 150, 0.67) + rest(0.3))
+    assert found == [GESTURE_SHAKE]
+
+
+def test_slow_shake_still_fits_the_window():
+    found = feed(recognizer(), swing(2.5, 150, 0.5, axis=2) + rest(0.3))
+    assert found == [GESTURE_SHAKE]
+
+
+def test_flicks():
+    gestures = recognizer()
+    assert feed(gestures, rest(0.2) + flick(1)) == [GESTURE_FLICK_RIGHT]
+    assert gestures.direction == 1
+    assert feed(gestures, rest(0.5) + flick(-1), start=1.0) == [GESTURE_FLICK_LEFT]
+    assert 0.5 <= gestures.confidence <= 1.0
+
+
+def test_hard_stop_is_still_a_flick():
+    push = [(v, 0, 0) for v in (90, 200, 120, 30)]
+    stop = [(-v, 0, 0) for v in (90, 200, 120, 30)]
+    assert feed(recognizer(), push + stop + rest(0.3)) == [GESTURE_FLICK_RIGHT]
+
+
+def test_tilt_hold_is_reported_once():
+    gestures = recognizer()
+    held = [(0, 90 + (i % 3) * 4, 0) for i in range(100)]
+    assert feed(gestures, rest(0.2) + held) == [GESTURE_TILT_HOLD]
+    assert (gestures.axis, gestures.direction) == (1, 1)
+
+
+def test_idle_noise_is_nothing():
+    # Hand tremor and sensor noise stay well under the peak threshold
+    noise = [(int(30 * math.sin(i * 1.7)), int(25 * math.cos(i * 2.3)),
+              (i * 37) % 21 - 10) for i in range(300)]
+    assert feed(recognizer(), noise) == []
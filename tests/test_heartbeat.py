@@ -0,0 +1,67 @@
+from heartbeat import Failsafe, HeartbeatSender
+from protocol import OP_PING
+
+LOOP = 0.01  # seconds per controller loop pass, its link task period
+
+
+class Link:
+    """Collects the frames a HeartbeatSender sends"""
+
+    def __init__(self):
+        self.binary = True
+        self.frames = []
+
+    def send(self, opcode, arg0=0, arg1=0, seq=0):
+        self.frames.append((opcode, arg0, arg1))
+
+
+def run(sender, failsafe, start, seconds, stalls=None):
+    """
+    Run the controller loop and deliver every heartbeat to Scrappy at once.
+    stalls maps a loop pass to the seconds it blocks for (a display refresh).
+    Returns: the time at the end and whether the failsafe tripped
+    """
+    stalls = stalls or {}
+    now = start
+    tripped = False
+    for i in range(round(seconds / LOOP)):
+        sender.service(now)
+        for opcode, _, interval_ms in sender.link.frames:
+            assert opcode == OP_PING
+            failsafe.heartbeat(interval_ms, now)
+        sender.link.frames.clear()
+        now += LOOP
+        for _ in range(round(stalls.get(i, 0) / LOOP)):
+            now += LOOP
+            tripped = failsafe.check(now) or tripped
+        tripped = failsafe.check(now) or tripped
+    return now, tripped
+
+
+def test_slow_controller_loop_does_not_trip_the_failsafe():
+    sender = HeartbeatSender(Link(), interval=0.03)
+    failsafe = Failsafe(missed=3, min_timeout=0.2, max_timeout=0.5)
+    # A 120 ms display refresh now and then, once it is measured a 300 ms one
+    now, tripped = run(sender, failsafe, 1.0, 2.0, stalls={50: 0.12, 120: 0.12})
+    assert not tripped
+    assert 0.12 < sender.longest_gap < 0.2
+    now, tripped = run(sender, failsafe, now, 1.0, stalls={30: 0.3})
+    assert not tripped
+    assert failsafe.timeout > 0.4
+
+
+def test_lost_heartbeats_trip_the_failsafe():
+    sender = HeartbeatSender(Link(), interval=0.03)
+    failsafe = Failsafe(missed=3, min_timeout=0.2, max_timeout=0.5)
+    run(sender, failsafe, 1.0, 0.5)
+    assert failsafe.timeout == 0.2
+    assert not failsafe.check(failsafe.last_seen + 0.19)
+    assert failsafe.check(failsafe.last_seen + 0.21)
+
+
+def test_connection_setup_is_not_loop_latency():
+    sender = HeartbeatSender(Link(), interval=0.03)
+    sender.service(1.0)
+    sender.service(2.5)  # the controller sleeps after connecting
+    assert sender.longest_gap == 0.0
+    assert sender.link.frames[-1][2] == 30
@@ -0,0 +1,123 @@
+import time
+
+import motor
+from motor_driver import (
+    MotorDriver, PWMIOBackend, RecordingBackend, SimBackend, speed_to_duty,
+    ACCEL_RATE, KICK_DUTY, KICK_TIME, BACKWARD, FORWARD, STOPPED, CHANNEL_A, CHANNEL_B,
+)
+
+TICK = 0.005  # 200 Hz, Scrappy's motor task
+
+
+def run(driver, sim, start, seconds):
+    """Tick the driver for seconds, returns channel A's duty in sim after every tick"""
+    duties = []
+    for i in range(1, int(seconds / TICK) + 1):
+        driver.update(start + i * TICK)
+        duties.append(sim.duty[CHANNEL_A])
+    return duties
+
+
+def test_start_from_rest_kicks_then_ramps():
+    sim = SimBackend()
+    driver = MotorDriver(sim)
+    start = time.monotonic()
+    driver.set_channel(CHANNEL_A, FORWARD, 60, start)
+    duties = run(driver, sim, start, 0.5)
+
+    kick_ticks = int(KICK_TIME / TICK)
+    assert set(duties[:kick_ticks - 1]) == {speed_to_duty(KICK_DUTY)}
+    ramp = duties[kick_ticks:]
+    assert ramp[0] < speed_to_duty(60)
+    step_limit = speed_to_duty(ACCEL_RATE * TICK) + 1
+    for before, after in zip(ramp, ramp[1:]):
+        assert 0 <= after - before <= step_limit
+    assert ramp[-1] == speed_to_duty(60)
+
+
+def test_reversal_cuts_the_duty_before_the_pins_flip():
+    sim = SimBackend()
+    recording = RecordingBackend(sim)
+    driver = MotorDriver(recording)
+    start = time.monotonic()
+    driver.set_channel(CHANNEL_A, FORWARD, 60, start)
+    run(driver, sim, start, 0.5)
+    assert sim.duty[CHANNEL_A] == speed_to_duty(60)
+
+    recording.clear()
+    start += 0.5
+    driver.set_channel(CHANNEL_A, BACKWARD, 60, start)
+    writes = [(kind, value) for _, channel, kind, value in recording.records if channel == CHANNEL_A]
+    assert writes == [("duty", 0), ("dir", BACKWARD)]
+
+    # Starts again from rest: kick, then the ramp
+    duties = run(driver, sim, start, 0.5)
+    assert duties[0] == speed_to_duty(KICK_DUTY)
+    assert duties[-1] == speed_to_duty(60)
+    assert driver.command(CHANNEL_A) == -60
+
+
+def test_stop_cuts_the_duty_before_the_pins():
+    sim = SimBackend()
+    recording = RecordingBackend(sim)
+    driver = MotorDriver(recording)
+    start = time.monotonic()
+    driver.set_channel(CHANNEL_B, BACKWARD, 40, start)
+    run(driver, sim, start, 0.2)
+    recording.clear()
+    driver.set_channel(CHANNEL_B, STOPPED, 0, start + 0.2)
+    writes = [(kind, value) for _, channel, kind, value in recording.records if channel == CHANNEL_B]
+    assert writes == [("duty", 0), ("dir", STOPPED)]
+
+
+def test_unchanged_writes_never_reach_the_backend():
+    recording = RecordingBackend(SimBackend())
+    driver = MotorDriver(recording)
+    assert len(recording.records) == 4  # both channels stopped at 0 duty
+    recording.clear()
+
+    start = time.monotonic()
+    driver.set_channel(CHANNEL_A, FORWARD, 60, start)
+    driver.set_channel(CHANNEL_A, FORWARD, 60, start)
+    driver.update(start + TICK)
+    driver.update(start + 2 * TICK)  # still kicking, same duty
+    writes = [(channel, kind, value) for _, channel, kind, value in recording.records]
+    assert writes == [(CHANNEL_A, "dir", FORWARD), (CHANNEL_A, "duty", speed_to_duty(KICK_DUTY))]
+    assert driver.get_stats() == {"writes": 6, "skipped": driver.skipped}
+    assert driver.skipped >= 5
+
+
+def test_recording_backend_keeps_the_newest_writes():
+    sim = SimBackend()
+    recording = RecordingBackend(sim, max_records=3)
+    for duty in (100, 200, 300, 400):
+        recording.set_duty(CHANNEL_B, duty)
+    recording.set_direction(CHANNEL_B, BACKWARD)
+    assert [value for _, _, _, value in recording.records] == [300, 400, BACKWARD]
+    assert sim.duty[CHANNEL_B] == 400
+    assert sim.direction[CHANNEL_B] == BACKWARD
+
+
+def test_pwmio_backend_sets_the_bridge_inputs():
+    backend = PWMIOBackend(ena="SCK", in1="MISO", in2="MOSI", in3="A3", in4="A2", enb="A1")
+    driver = MotorDriver(backend)
+    start = time.monotonic()
+    driver.set_channel(CHANNEL_A, FORWARD, 60, start)
+    driver.set_channel(CHANNEL_B, BACKWARD, 60, start)
+    driver.update(start + TICK)
+    assert [pin.value for pin in backend._pins] == [True, False, False, True]
+    assert backend._pwm[CHANNEL_A].duty_cycle == speed_to_duty(KICK_DUTY)
+
+    driver.stop()
+    assert [pin.value for pin in backend._pins] == [False, False, False, False]
+    assert backend._pwm[CHANNEL_B].duty_cycle == 0
+
+
+def test_single_motor_helpers_drive_their_channel(monkeypatch):
+    monkeypatch.setattr(motor, "verbose", False)
+    motor.use_backend(SimBackend())
+    motor.motor_a(40)
+    motor.motor_b(30, forward=False)
+    assert motor.right_command() == 40
+    assert motor.left_command() == -30
+    motor.stop()
@@ -0,0 +1,41 @@
+import time
+
+from scheduler import Scheduler, NEVER
+
+
+def test_one_shot_tasks_wait_for_a_deadline():
+    tasks = Scheduler()
+    poll = tasks.add("poll", 0.01)
+    timer = tasks.add("timer", 0)
+    assert tasks.due(poll, 0.0)
+    assert not tasks.due(timer, 100.0)
+
+    tasks.set_deadline(timer, 1.0)
+    assert not tasks.due(timer, 0.5)
+    assert tasks.due(timer, 1.0)
+    assert not tasks.due(timer, 2.0)  # one-shot, runs once per deadline
+
+
+def test_start_resets_every_deadline():
+    tasks = Scheduler()
+    poll = tasks.add("poll", 0.01)
+    timer = tasks.add("timer", 0)
+    tasks.set_deadline(poll, NEVER)
+    tasks.set_deadline(timer, 3.0)
+    tasks.start(5.0)
+    assert tasks.deadlines == [5.0, NEVER]
+
+
+def test_sleep_waits_for_the_next_deadline(monkeypatch):
+    slept = []
+    monkeypatch.setattr(time, "sleep", slept.append)
+    now = time.monotonic()
+    tasks = Scheduler(max_sleep=0.1)
+    tasks.add("poll", 0.05)
+    tasks.add("timer", 0)
+    tasks.start(now)
+    tasks.due(0, now)
+    tasks.sleep()
+    assert len(slept) == 1
+    assert 0 < slept[0] <= 0.05
+    assert tasks.next_deadline() == now + 0.05
@@ -0,0 +1,114 @@
+import pytest
+
+import motor
+from motor_driver import SimBackend
+from protocol import OP_STEER, OP_STEER_DELTA
+from steering import SteeringStream
+from steering_receiver import SteeringReceiver
+
+FULL_TILT = 128
+
+
+class Channel:
+    """Collects the frames a SteeringStream sends"""
+
+    def __init__(self):
+        self.frames = []
+
+    def send_unacked(self, opcode, arg1, arg2):
+        self.frames.append((opcode, arg1, arg2))
+
+
+def deliver(frames, receiver, now=1.0):
+    """Hand every frame to the receiver like Scrappy's link task does"""
+    for opcode, arg1, arg2 in frames:
+        if opcode == OP_STEER:
+            receiver.steer(arg1, arg2, now)
+        elif opcode == OP_STEER_DELTA:
+            receiver.delta(arg1, arg2, now)
+    frames.clear()
+
+
+@pytest.fixture
+def wheels(monkeypatch):
+    monkeypatch.setattr(motor, "verbose", False)
+    motor.use_backend(SimBackend())
+    return motor
+
+
+def test_level_controller_sends_no_deltas():
+    stream = SteeringStream(FULL_TILT)
+    channel = Channel()
+    for _ in range(stream.KEY_INTERVAL * 4):
+        stream.send(channel, 0, 0)
+    assert channel.frames
+    assert all(opcode == OP_STEER for opcode, _, _ in channel.frames)
+    assert len(channel.frames) == 4
+
+
+def test_stream_rebuilds_the_speeds():
+    stream = SteeringStream(FULL_TILT)
+    receiver = SteeringReceiver(lambda left, right: None)
+    channel = Channel()
+    for tilt in (0, -20, -60, -100, -128, -128, -40, 0, 30, 0):
+        stream.send(channel, tilt // 2, tilt)
+        deliver(channel.frames, receiver)
+        assert (receiver.left, receiver.right) == (stream.left, stream.right)
+    assert stream.delta_frames
+
+
+def test_button_move_survives_an_idle_stream(wheels):
+    receiver = SteeringReceiver(wheels.steer)
+    stream = SteeringStream(FULL_TILT)
+    channel = Channel()
+    stream.send(channel, 0, 0)
+    deliver(channel.frames, receiver)
+    receiver.apply()
+
+    wheels.forward(60)
+    for _ in range(stream.KEY_INTERVAL * 3):
+        stream.send(channel, 0, 0)
+        deliver(channel.frames, receiver)
+        receiver.apply()
+    assert wheels.left_command() == 60
+    assert wheels.right_command() == 60
+
+
+def test_zero_delta_changes_nothing(wheels):
+    receiver = SteeringReceiver(wheels.steer)
+    receiver.steer(20, 20, 1.0)
+    receiver.apply()
+    wheels.forward(60)
+    receiver.delta(1, 0, 1.1)
+    receiver.steer(20, 20, 1.2)
+    receiver.apply()
+    assert wheels.left_command() == 60
+
+
+def test_tilt_change_takes_over_from_a_button_move(wheels):
+    receiver = SteeringReceiver(wheels.steer)
+    receiver.steer(0, 0, 1.0)
+    receiver.apply()
+    wheels.forward(60)
+    receiver.delta(1, 0x33, 1.1)
+    receiver.apply()
+    assert (wheels.left_command(), wheels.right_command()) == (3, 3)
+
+
+def test_lost_delta_waits_for_the_next_steer():
+    receiver = SteeringReceiver(lambda left, right: None)
+    receiver.steer(10, 10, 1.0)
+    assert not receiver.delta(2, 0x11, 1.1)
+    assert not receiver.delta(3, 0x11, 1.2)
+    assert receiver.left == 10
+    receiver.steer(30, 30, 1.3)
+    assert receiver.delta(1, 0x11, 1.4)
+    assert receiver.left == 31
+
+
+def test_quiet_stream_is_stale():
+    receiver = SteeringReceiver(lambda left, right: None)
+    assert not receiver.stale(5.0, 0.5)
+    receiver.steer(0, 0, 1.0)
+    assert not receiver.stale(1.4, 0.5)
+    assert receiver.stale(1.6, 0.5)